@@ -0,0 +1,77 @@
+# database/archive.py
+import asyncio
+import logging
+import time
+from typing import Dict
+
+from database.db_handler import DatabaseHandler
+from utils.metrics import metrics
+
+BATCH_SIZE = 500  # Решений за одну порцию переноса
+BATCH_PAUSE = 0.05  # Пауза между порциями: запись бота проходит без очереди
+
+metrics.gauge('archive_last_run_timestamp', 'Время последнего переноса в архив (unix)')
+metrics.gauge('archive_moved_results', 'Решений перенесено в архив последним запуском')
+
+
+class Archiver:
+    """Перенос истории в archive.db.
+
+    Решения, их файлы и файлы самих заданий, деактивированных больше
+    months месяцев назад, переносятся порциями по batch_size решений,
+    каждая - в своих коротких транзакциях. Основная база остается
+    маленькой, архив читается явными запросами (archived=True).
+    """
+
+    def __init__(self):
+        self.db = DatabaseHandler()
+        self.months = 6
+        self.batch_size = BATCH_SIZE
+        self._lock = asyncio.Lock()
+        self._abort = False
+
+    def configure(self, db_path: str, months: int = 6, batch_size: int = BATCH_SIZE):
+        self.db = DatabaseHandler(db_path)
+        self.months = months
+        self.batch_size = batch_size
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def abort(self):
+        """Остановить перенос после текущей порции (при остановке бота)"""
+        self._abort = True
+
+    async def run(self) -> Dict[str, int]:
+        """Перенести все подходящие задания; вернуть итоги"""
+        async with self._lock:
+            self._abort = False
+            started = time.perf_counter()
+            totals = {'assignments': 0, 'results': 0, 'attachments': 0, 'files': 0}
+            for assignment_id in await self.db.get_archivable_assignments(self.months):
+                while not self._abort:
+                    moved = await self.db.archive_assignment_batch(assignment_id, self.batch_size)
+                    for key in ('results', 'attachments', 'files'):
+                        totals[key] += moved[key]
+                    if moved['done']:
+                        totals['assignments'] += 1
+                        break
+                    await asyncio.sleep(BATCH_PAUSE)
+                if self._abort:
+                    logging.warning("Перенос в архив прерван остановкой бота")
+                    break
+            totals['seconds'] = time.perf_counter() - started
+
+        metrics.set('archive_last_run_timestamp', time.time())
+        metrics.set('archive_moved_results', totals['results'])
+        if totals['assignments'] or totals['results']:
+            logging.info(
+                f"Перенос в архив: заданий {totals['assignments']}, решений {totals['results']}, "
+                f"привязок файлов {totals['attachments']}, файлов {totals['files']} "
+                f"за {totals['seconds']:.1f} с"
+            )
+        return totals
+
+
+archiver = Archiver()
@@ -0,0 +1,215 @@
+# database/backup.py
+import asyncio
+import gzip
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from utils.metrics import metrics
+
+STEP_PAGES = 1000  # Страниц за шаг копирования (4 МБ при странице 4 КБ)
+STEP_SLEEP = 0.05  # Пауза между шагами: писатели успевают взять блокировку
+MAX_RESTARTS = 3  # Сколько раз копия может начаться заново из-за записи в базу
+CHUNK_SIZE = 1024 * 1024
+
+SNAPSHOT_PREFIX = "tutor_bot-"
+SNAPSHOT_SUFFIX = ".db.gz"
+SNAPSHOT_TIME_FORMAT = "%Y%m%d-%H%M%S"
+_SNAPSHOT_NAME = re.compile(rf"^{SNAPSHOT_PREFIX}(\d{{8}}-\d{{6}}){re.escape(SNAPSHOT_SUFFIX)}$")
+
+metrics.gauge('backup_last_success_timestamp', 'Время последней успешной резервной копии (unix)')
+metrics.gauge('backup_seconds', 'Длительность последней резервной копии')
+metrics.gauge('backup_size_bytes', 'Размер последней резервной копии (сжатой)')
+
+
+class BackupError(Exception):
+    """Резервная копия не создана или снимок не прошел проверку"""
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def snapshot_time(name: str) -> Optional[datetime]:
+    """Время создания снимка по имени файла (None - не снимок)"""
+    match = _SNAPSHOT_NAME.match(name)
+    return datetime.strptime(match.group(1), SNAPSHOT_TIME_FORMAT) if match else None
+
+
+def list_snapshots(directory: str) -> List[Dict]:
+    """Снимки в каталоге, новые первыми"""
+    if not os.path.isdir(directory):
+        return []
+    snapshots = []
+    for name in os.listdir(directory):
+        created = snapshot_time(name)
+        if created is not None:
+            path = os.path.join(directory, name)
+            snapshots.append({'path': path, 'name': name, 'created': created, 'size': os.path.getsize(path)})
+    return sorted(snapshots, key=lambda s: s['created'], reverse=True)
+
+
+def expired_snapshots(snapshots: List[Dict], keep_last: int, keep_weekly: int) -> List[Dict]:
+    """Снимки вне политики хранения: keep_last последних и по одному
+    (самому новому) на каждую из keep_weekly предыдущих недель"""
+    covered = {snapshot['created'].isocalendar()[:2] for snapshot in snapshots[:keep_last]}
+    weekly = 0
+    expired = []
+    for snapshot in snapshots[keep_last:]:
+        week = snapshot['created'].isocalendar()[:2]
+        if week not in covered and weekly < keep_weekly:
+            covered.add(week)
+            weekly += 1
+        else:
+            expired.append(snapshot)
+    return expired
+
+
+def check_database(path: str) -> str:
+    """PRAGMA integrity_check: 'ok' или описание первых ошибок"""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute("PRAGMA integrity_check(10)").fetchall()
+    except sqlite3.DatabaseError as e:
+        return str(e)
+    finally:
+        conn.close()
+    return "; ".join(row[0] for row in rows)
+
+
+def decompress_snapshot(path: str, target: str):
+    """Распаковать снимок в файл базы"""
+    with gzip.open(path, "rb") as src, open(target, "wb") as dst:
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+
+class BackupManager:
+    """Резервные копии базы без остановки бота.
+
+    Копия снимается онлайн-API SQLite шагами по STEP_PAGES страниц:
+    блокировка чтения держится только на время шага. Если база меняется
+    быстрее, чем копируется, и копия начинается заново больше
+    MAX_RESTARTS раз, оставшееся копируется одним шагом (в режиме WAL
+    это не блокирует запись). Проверка и сжатие идут в отдельном потоке,
+    старые снимки удаляются по политике хранения.
+    """
+
+    def __init__(self):
+        self.db_path = "tutor_bot.db"
+        self.directory = "backups"
+        self.keep_last = 7
+        self.keep_weekly = 4
+        self._lock = asyncio.Lock()
+        self._abort = threading.Event()
+
+    def configure(self, db_path: str, directory: str, keep_last: int = 7, keep_weekly: int = 4):
+        self.db_path = db_path
+        self.directory = directory
+        self.keep_last = keep_last
+        self.keep_weekly = keep_weekly
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def abort(self):
+        """Прервать идущее копирование (при остановке бота)"""
+        self._abort.set()
+
+    def _progress(self, state: Dict):
+        def progress(status: int, remaining: int, total: int):
+            if self._abort.is_set():
+                raise BackupError("копирование прервано остановкой бота")
+            if state['remaining'] is not None and remaining > state['remaining']:
+                state['restarts'] += 1
+                if state['restarts'] > MAX_RESTARTS:
+                    raise _TooManyRestarts()
+            state['remaining'] = remaining
+        return progress
+
+    def _copy(self, target: str) -> int:
+        """Снять копию базы в target; вернуть число перезапусков копирования"""
+        state = {'remaining': None, 'restarts': 0}
+        src = sqlite3.connect(self.db_path)
+        dst = sqlite3.connect(target)
+        try:
+            try:
+                src.backup(dst, pages=STEP_PAGES, progress=self._progress(state), sleep=STEP_SLEEP)
+            except _TooManyRestarts:
+                logging.warning("Резервная копия: база меняется во время копирования, копирование одним шагом")
+                src.backup(dst)
+            # Снимок - самостоятельный файл без журнала WAL
+            dst.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            dst.close()
+            src.close()
+        return state['restarts']
+
+    def _compress(self, source: str, target: str):
+        partial = target + ".part"
+        try:
+            with open(source, "rb") as src, gzip.open(partial, "wb", compresslevel=6) as dst:
+                while chunk := src.read(CHUNK_SIZE):
+                    if self._abort.is_set():
+                        raise BackupError("сжатие прервано остановкой бота")
+                    dst.write(chunk)
+            os.replace(partial, target)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+
+    def _make(self) -> Dict:
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{SNAPSHOT_PREFIX}{datetime.now().strftime(SNAPSHOT_TIME_FORMAT)}{SNAPSHOT_SUFFIX}"
+        path = os.path.join(self.directory, name)
+
+        started = time.perf_counter()
+        fd, raw = tempfile.mkstemp(suffix=".db", dir=self.directory)
+        os.close(fd)
+        try:
+            restarts = self._copy(raw)
+            copied = time.perf_counter() - started
+            result = check_database(raw)
+            if result != "ok":
+                raise BackupError(f"копия не прошла проверку целостности: {result}")
+            self._compress(raw, path)
+            db_size = os.path.getsize(raw)
+        finally:
+            os.remove(raw)
+
+        removed = []
+        for snapshot in expired_snapshots(list_snapshots(self.directory), self.keep_last, self.keep_weekly):
+            os.remove(snapshot['path'])
+            removed.append(snapshot['name'])
+
+        return {
+            'path': path, 'name': name, 'size': os.path.getsize(path), 'db_size': db_size,
+            'copy_seconds': copied, 'seconds': time.perf_counter() - started,
+            'restarts': restarts, 'removed': removed
+        }
+
+    async def run(self) -> Dict:
+        """Создать снимок, проверить, сжать и применить политику хранения"""
+        async with self._lock:
+            self._abort.clear()
+            info = await asyncio.to_thread(self._make)
+
+        metrics.set('backup_last_success_timestamp', time.time())
+        metrics.set('backup_seconds', info['seconds'])
+        metrics.set('backup_size_bytes', info['size'])
+        logging.info(
+            f"Резервная копия {info['name']}: {info['db_size'] // 1024} КБ -> {info['size'] // 1024} КБ "
+            f"за {info['seconds']:.1f} с (копирование {info['copy_seconds']:.1f} с), "
+            f"удалено старых: {len(info['removed'])}"
+        )
+        return info
+
+
+backups = BackupManager()
@@ -0,0 +1,173 @@
+# database/cache.py
+import time
+from typing import Optional, Iterable, Set, Dict, List, Tuple
+
+ROLE_CACHE_TTL = 60  # Секунд; страхует от изменений базы в обход бота
+
+
+class RoleCache:
+    """Кэш ролей: множества администраторов и активных учеников.
+
+    Один экземпляр на процесс (role_cache ниже), общий для всех
+    DatabaseHandler. Методы, меняющие роли, вызывают invalidate().
+    """
+
+    def __init__(self, ttl: float = ROLE_CACHE_TTL):
+        self.ttl = ttl
+        self._admins: Optional[Set[int]] = None
+        self._users: Optional[Set[int]] = None
+        self._loaded_at = 0.0
+
+    def is_fresh(self) -> bool:
+        return self._admins is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def load(self, admin_ids: Iterable[int], user_ids: Iterable[int]):
+        self._admins = set(admin_ids)
+        self._users = set(user_ids)
+        self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        self._admins = None
+        self._users = None
+
+    def is_admin(self, telegram_id: int) -> bool:
+        return telegram_id in self._admins
+
+    def is_user(self, telegram_id: int) -> bool:
+        return telegram_id in self._users
+
+    def add_user(self, telegram_id: int):
+        if self._users is not None:
+            self._users.add(telegram_id)
+
+
+role_cache = RoleCache()
+
+
+ROSTER_CACHE_TTL = 300  # Секунд; страхует от изменений в других процессах
+
+
+class RosterEntry:
+    """Компактная запись ученика в ростере"""
+    __slots__ = ('telegram_id', 'grade')
+
+    def __init__(self, telegram_id: int, grade: int):
+        self.telegram_id = telegram_id
+        self.grade = grade
+
+
+class RosterCache:
+    """Ростер активных учеников, сгруппированный по классам.
+
+    Позволяет получить получателей рассылки за O(получателей), не читая
+    всю таблицу users. Классы загружаются лениво и обновляются при
+    одобрении и деактивации учеников.
+    """
+
+    def __init__(self, ttl: float = ROSTER_CACHE_TTL):
+        self.ttl = ttl
+        self._by_grade: Dict[int, Dict[int, RosterEntry]] = {}
+        self._grade_loaded_at: Dict[int, float] = {}
+        self._all_loaded_at: Optional[float] = None
+        self._grade_of: Dict[int, int] = {}
+
+    def _is_fresh(self, loaded_at: Optional[float]) -> bool:
+        return loaded_at is not None and time.monotonic() - loaded_at < self.ttl
+
+    def has_grade(self, grade: int) -> bool:
+        """Загружен ли класс (0 - все классы)"""
+        if self._is_fresh(self._all_loaded_at):
+            return True
+        return grade != 0 and self._is_fresh(self._grade_loaded_at.get(grade))
+
+    def load_grade(self, grade: int, user_ids: Iterable[int]):
+        """Заменить состав класса данными из базы"""
+        for telegram_id in self._by_grade.get(grade, {}):
+            self._grade_of.pop(telegram_id, None)
+        self._by_grade[grade] = {}
+        for telegram_id in user_ids:
+            self._insert(telegram_id, grade)
+        self._grade_loaded_at[grade] = time.monotonic()
+
+    def load_all(self, rows: Iterable[Tuple[int, int]]):
+        """Заменить весь ростер строками (telegram_id, grade)"""
+        self._by_grade = {}
+        self._grade_of = {}
+        for telegram_id, grade in rows:
+            self._insert(telegram_id, grade)
+        now = time.monotonic()
+        self._grade_loaded_at = {grade: now for grade in self._by_grade}
+        self._all_loaded_at = now
+
+    def _insert(self, telegram_id: int, grade: int):
+        previous = self._grade_of.get(telegram_id)
+        if previous is not None and previous != grade:
+            self._by_grade[previous].pop(telegram_id, None)
+        self._by_grade.setdefault(grade, {})[telegram_id] = RosterEntry(telegram_id, grade)
+        self._grade_of[telegram_id] = grade
+
+    def add(self, telegram_id: int, grade: int):
+        """Добавить (или перевести в другой класс) ученика"""
+        self.remove(telegram_id)
+        self._insert(telegram_id, grade)
+
+    def remove(self, telegram_id: int):
+        """Убрать ученика из ростера"""
+        grade = self._grade_of.pop(telegram_id, None)
+        if grade is not None:
+            self._by_grade[grade].pop(telegram_id, None)
+
+    def recipients(self, grade: int) -> List[int]:
+        """ID учеников класса (0 - все классы)"""
+        if grade == 0:
+            return [telegram_id for members in self._by_grade.values() for telegram_id in members]
+        return list(self._by_grade.get(grade, ()))
+
+    def invalidate(self):
+        self._by_grade = {}
+        self._grade_loaded_at = {}
+        self._all_loaded_at = None
+        self._grade_of = {}
+
+
+roster_cache = RosterCache()
+
+
+UNREACHABLE_CACHE_TTL = 60  # Секунд; в многопроцессном режиме отметки ставит другой процесс
+
+
+class UnreachableCache:
+    """Множество учеников, до которых не доходят сообщения (заблокировали бота).
+
+    Позволяет без обращения к базе понять, что ученик снова написал боту
+    и его нужно вернуть в рассылки. Рассылки планировщика идут в
+    процессе-приемнике, а ответы учеников - в обработчиках, поэтому
+    множество перечитывается из базы раз в ttl секунд.
+    """
+
+    def __init__(self, ttl: float = UNREACHABLE_CACHE_TTL):
+        self.ttl = ttl
+        self._ids: Set[int] = set()
+        self._loaded_at: Optional[float] = None
+
+    def is_fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def load(self, user_ids: Iterable[int]):
+        self._ids = set(user_ids)
+        self._loaded_at = time.monotonic()
+
+    def add(self, user_ids: Iterable[int]):
+        self._ids.update(user_ids)
+
+    def discard(self, telegram_id: int):
+        self._ids.discard(telegram_id)
+
+    def __contains__(self, telegram_id: int) -> bool:
+        return telegram_id in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+unreachable_cache = UnreachableCache()
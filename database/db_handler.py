@@ -1,17 +1,139 @@
 # database/db_handler.py
 import aiosqlite
+import asyncio
+import logging
 import os
+import re
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple, AsyncIterator
 
+from database.cache import role_cache, roster_cache, unreachable_cache
+from database.tracing import query_tracer
+from utils.metrics import instrument_db_methods
 
+# Границы периодов для сводок прогресса: (начало, конец) в выражениях SQLite
+PROGRESS_PERIODS = {
+    'week': ("date(?, 'weekday 0', '-6 days')", "date(?, 'weekday 0', '+1 day')"),
+    'month': ("date(?, 'start of month')", "date(?, 'start of month', '+1 month')"),
+}
+
+# Версия схемы в PRAGMA user_version: при совпадении init_db не выполняет DDL.
+# Увеличивать при любом изменении таблиц, индексов и колонок в init_db
+SCHEMA_VERSION = 6
+
+SCHOOL_GRADES = range(1, 12)
+
+# Архив (archive.db рядом с базой): решения и файлы заданий, деактивированных
+# давно. Таблицы повторяют основные, колонки перечисляются явно
+ARCHIVE_DB_NAME = "archive.db"
+ARCHIVE_COLUMNS = {
+    'results': "id, user_id, assignment_id, solution_text, score, max_score, completed_date, comment",
+    'file_attachments': "id, file_id, object_type, object_id, attached_date",
+    'files': "id, file_id, file_unique_id, file_name, file_size, mime_type, file_type, "
+             "uploaded_date, uploaded_by, description",
+}
+
+# Архивы, схема которых уже создана этим процессом
+_archive_ready = set()
+
+# Полнотекстовый поиск: по решениям ранжируются SEARCH_WINDOW самых новых совпадений -
+# bm25 по сотням тысяч совпадений частого слова занимал бы сотни миллисекунд
+SEARCH_WINDOW = 2000
+SEARCH_MAX_TERMS = 8
+_SEARCH_TERM = re.compile(r"\w+")
+
+
+def fts_query(text: str) -> Optional[str]:
+    """Запрос пользователя -> выражение MATCH: все слова, от трех букв - как префикс
+    (находит и другие формы слова). Кавычки и операторы FTS5 из ввода не проходят;
+    None - искать нечего.
+    """
+    terms = _SEARCH_TERM.findall(text.lower())[:SEARCH_MAX_TERMS]
+    return " ".join(f'"{term}"*' if len(term) >= 3 else f'"{term}"' for term in terms) or None
+
+@instrument_db_methods
 class DatabaseHandler:
     def __init__(self, db_path: str = "tutor_bot.db"):
         self.db_path = db_path
+        self.archive_path = os.path.join(os.path.dirname(db_path), ARCHIVE_DB_NAME)
+
+    def connect(self) -> aiosqlite.Connection:
+        """Соединение с базой (с трассировкой запросов, если она включена)"""
+        if query_tracer.enabled:
+            return query_tracer.connect(self.db_path)
+        return aiosqlite.connect(self.db_path)
+
+    @asynccontextmanager
+    async def _connect_archive(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Соединение с подключенным архивом (схема archive); архив создается при первом обращении"""
+        async with self.connect() as db:
+            await db.execute("ATTACH DATABASE ? AS archive", (self.archive_path,))
+            if self.archive_path not in _archive_ready:
+                await self._init_archive(db)
+                _archive_ready.add(self.archive_path)
+            yield db
+
+    async def _init_archive(self, db: aiosqlite.Connection):
+        """Таблицы архива: как основные, но без внешних ключей (они в другой базе)"""
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS archive.results (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER,
+                assignment_id INTEGER,
+                solution_text TEXT,
+                score INTEGER,
+                max_score INTEGER,
+                completed_date DATETIME,
+                comment TEXT
+            )
+        """)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS archive.files (
+                id INTEGER PRIMARY KEY,
+                file_id TEXT NOT NULL,
+                file_unique_id TEXT,
+                file_name TEXT,
+                file_size INTEGER,
+                mime_type TEXT,
+                file_type TEXT NOT NULL,
+                uploaded_date DATETIME,
+                uploaded_by INTEGER NOT NULL,
+                description TEXT
+            )
+        """)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS archive.file_attachments (
+                id INTEGER PRIMARY KEY,
+                file_id INTEGER NOT NULL,
+                object_type TEXT NOT NULL,
+                object_id INTEGER NOT NULL,
+                attached_date DATETIME
+            )
+        """)
+        await db.execute("CREATE INDEX IF NOT EXISTS archive.idx_results_user ON results (user_id, completed_date)")
+        await db.execute("CREATE INDEX IF NOT EXISTS archive.idx_results_assignment ON results (assignment_id)")
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS archive.idx_file_attachments_object
+            ON file_attachments (object_type, object_id)
+        """)
+        await db.commit()
+
+    async def init_db(self) -> bool:
+        """Инициализация базы данных с созданием таблиц.
+
+        Если версия схемы в базе совпадает с SCHEMA_VERSION, DDL пропускается.
+        Возвращает True, если схема создавалась или обновлялась.
+        """
+        async with self.connect() as db:
+            cursor = await db.execute("PRAGMA user_version")
+            if (await cursor.fetchone())[0] == SCHEMA_VERSION:
+                return False
+
+            # Освобожденные страницы возвращаются по частям (PRAGMA incremental_vacuum);
+            # для новой базы режим действует сразу, существующую переводит tools/convert_auto_vacuum.py
+            await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
 
-    async def init_db(self):
-        """Инициализация базы данных с созданием таблиц"""
-        async with aiosqlite.connect(self.db_path) as db:
             # Таблица заявок на регистрацию
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS registration_requests (
@@ -42,7 +164,8 @@ class DatabaseHandler:
                     parent_contact TEXT,
                     registration_date DATETIME DEFAULT CURRENT_TIMESTAMP,
                     is_active BOOLEAN DEFAULT TRUE,
-                    notes TEXT
+                    notes TEXT,
+                    unreachable_since DATETIME  -- сообщения не доставляются (бот заблокирован)
                 )
             """)
 
@@ -69,6 +192,9 @@ class DatabaseHandler:
                     due_date DATETIME,
                     is_active BOOLEAN DEFAULT TRUE,
                     created_by INTEGER,
+                    publish_date DATETIME,  -- отложенная публикация (местное время)
+                    deactivated_date DATETIME,
+                    archived_date DATETIME,  -- решения и файлы перенесены в archive.db
                     FOREIGN KEY (created_by) REFERENCES admins (telegram_id)
                 )
             """)
@@ -118,36 +244,323 @@ class DatabaseHandler:
                 )
             """)
 
+            # Проверка «на файл никто не ссылается» (сборка осиротевших файлов, архив)
+            await db.execute("""
+                CREATE INDEX IF NOT EXISTS idx_file_attachments_file
+                ON file_attachments (file_id)
+            """)
+
+            # Объем загрузок каждого пользователя для квот: счетчики ведут триггеры
+            # в той же транзакции, что и запись или удаление файла (сборка, архив)
+            cursor = await db.execute("SELECT 1 FROM sqlite_master WHERE name = 'storage_usage'")
+            usage_created = await cursor.fetchone() is None
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS storage_usage (
+                    user_id INTEGER PRIMARY KEY,
+                    files INTEGER NOT NULL DEFAULT 0,
+                    bytes INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            await db.execute("""
+                CREATE TRIGGER IF NOT EXISTS files_usage_insert AFTER INSERT ON files BEGIN
+                    INSERT INTO storage_usage (user_id, files, bytes)
+                    VALUES (new.uploaded_by, 1, COALESCE(new.file_size, 0))
+                    ON CONFLICT(user_id) DO UPDATE SET files = files + 1, bytes = bytes + excluded.bytes;
+                END
+            """)
+            await db.execute("""
+                CREATE TRIGGER IF NOT EXISTS files_usage_delete AFTER DELETE ON files BEGIN
+                    UPDATE storage_usage SET files = files - 1, bytes = bytes - COALESCE(old.file_size, 0)
+                    WHERE user_id = old.uploaded_by;
+                END
+            """)
+            if usage_created:
+                await db.execute("""
+                    INSERT INTO storage_usage (user_id, files, bytes)
+                    SELECT uploaded_by, COUNT(*), COALESCE(SUM(file_size), 0) FROM files GROUP BY uploaded_by
+                """)
+
+            # Индивидуальные квоты (NULL - квота по умолчанию, 0 - без ограничения)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS quota_overrides (
+                    user_id INTEGER PRIMARY KEY,
+                    max_files INTEGER,
+                    max_bytes INTEGER,
+                    set_by INTEGER,
+                    set_date DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            await self._ensure_column(db, 'assignments', 'publish_date', 'DATETIME')
+            await self._ensure_column(db, 'users', 'unreachable_since', 'DATETIME')
+            await self._ensure_column(db, 'assignments', 'deactivated_date', 'DATETIME')
+            await self._ensure_column(db, 'assignments', 'archived_date', 'DATETIME')
+            # Задания, деактивированные до появления колонки: срок архивации отсчитывается с обновления
+            await db.execute("""
+                UPDATE assignments SET deactivated_date = CURRENT_TIMESTAMP
+                WHERE is_active = FALSE AND deactivated_date IS NULL
+            """)
+
+            # Отложенные задачи планировщика (напоминания, публикация)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS scheduled_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,          -- reminder, publish
+                    object_id INTEGER NOT NULL,  -- ID задания
+                    run_at DATETIME NOT NULL,    -- местное время
+                    status TEXT DEFAULT 'pending',  -- pending, done, failed
+                    created_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE (kind, object_id, run_at)
+                )
+            """)
+
+            await db.execute("""
+                CREATE INDEX IF NOT EXISTS idx_scheduled_jobs_pending
+                ON scheduled_jobs (status, run_at)
+            """)
+
+            # Индекс для выбора получателей рассылки по классу
+            await db.execute("""
+                CREATE INDEX IF NOT EXISTS idx_users_grade
+                ON users (grade, is_active)
+            """)
+
+            await db.execute("""
+                CREATE INDEX IF NOT EXISTS idx_results_assignment
+                ON results (assignment_id)
+            """)
+
+            # Индекс для выборок по ученику (статистика, выгрузка журнала)
+            await db.execute("""
+                CREATE INDEX IF NOT EXISTS idx_results_user
+                ON results (user_id, assignment_id)
+            """)
+
+            await db.execute("""
+                CREATE INDEX IF NOT EXISTS idx_results_user_date
+                ON results (user_id, completed_date)
+            """)
+
+            # Сводки прогресса по неделям и месяцам (обновляются при сдаче и оценке)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS progress_rollups (
+                    user_id INTEGER NOT NULL,
+                    period TEXT NOT NULL,  -- week, month
+                    bucket_start DATE NOT NULL,
+                    solutions_count INTEGER DEFAULT 0,
+                    graded_count INTEGER DEFAULT 0,
+                    percentage_sum REAL DEFAULT 0,
+                    updated_at DATETIME,
+                    PRIMARY KEY (user_id, period, bucket_start)
+                )
+            """)
+
+            # Первичное заполнение сводок для уже существующих результатов
+            cursor = await db.execute("SELECT 1 FROM progress_rollups LIMIT 1")
+            if await cursor.fetchone() is None:
+                for period, (start_expr, _) in PROGRESS_PERIODS.items():
+                    await db.execute(f"""
+                        INSERT INTO progress_rollups
+                        (user_id, period, bucket_start, solutions_count, graded_count, percentage_sum, updated_at)
+                        SELECT user_id, ?, {start_expr.replace('?', 'completed_date')},
+                               COUNT(*), COUNT(CASE WHEN score IS NOT NULL AND max_score > 0 THEN 1 END),
+                               COALESCE(SUM(CASE WHEN score IS NOT NULL AND max_score > 0
+                                            THEN score * 100.0 / max_score END), 0),
+                               strftime('%Y-%m-%d %H:%M:%f', 'now')
+                        FROM results
+                        WHERE user_id IS NOT NULL
+                        GROUP BY 1, 3
+                    """, (period,))
+
+            # Состояния FSM (SQLiteStorage) - общие для всех процессов бота
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS fsm_states (
+                    storage_key TEXT PRIMARY KEY,
+                    state TEXT,
+                    data TEXT  -- JSON
+                )
+            """)
+
+            # Журнал обслуживания базы: длительность операций и число строк
+            # таблицы на момент ANALYZE (от него считается объем изменений)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS maintenance_log (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    operation TEXT NOT NULL,  -- analyze, vacuum, checkpoint
+                    object TEXT,
+                    started_at DATETIME NOT NULL,
+                    seconds REAL NOT NULL,
+                    max_step_ms REAL NOT NULL,
+                    amount INTEGER  -- строк, страниц или байт WAL
+                )
+            """)
+            await db.execute("""
+                CREATE INDEX IF NOT EXISTS idx_maintenance_log_operation
+                ON maintenance_log(operation, object, id)
+            """)
+
+            # Полнотекстовый поиск (FTS5) по заданиям и решениям. Индексы хранят
+            # только токены (content=), текст берется из самих таблиц; синхронизация -
+            # триггерами. Автор решения индексируется токеном u<id>: поиск ученика по
+            # своим решениям - пересечение списков документов, а не перебор совпадений
+            await db.execute("""
+                CREATE VIEW IF NOT EXISTS results_search AS
+                SELECT id, solution_text, comment, 'u' || user_id AS author FROM results
+            """)
+            fts_rank = {'assignments': "bm25(2.0, 1.0)", 'results': "bm25(1.0, 0.5, 0.0)"}
+            for table, content, columns, values in (
+                ('assignments', 'assignments', "title, description", "{row}.title, {row}.description"),
+                ('results', 'results_search', "solution_text, comment, author",
+                 "{row}.solution_text, {row}.comment, 'u' || {row}.user_id"),
+            ):
+                cursor = await db.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (f"{table}_fts",))
+                created = await cursor.fetchone() is None
+                await db.execute(f"""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5(
+                        {columns}, content='{content}', content_rowid='id',
+                        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+                    )
+                """)
+                new_values, old_values = values.format(row="new"), values.format(row="old")
+                await db.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN
+                        INSERT INTO {table}_fts (rowid, {columns}) VALUES (new.id, {new_values});
+                    END
+                """)
+                await db.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN
+                        INSERT INTO {table}_fts ({table}_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+                    END
+                """)
+                # Только при изменении текста: оценка решения без комментария индекс не трогает
+                text_columns = columns.replace(", author", ", user_id")
+                await db.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF {text_columns} ON {table} BEGIN
+                        INSERT INTO {table}_fts ({table}_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+                        INSERT INTO {table}_fts (rowid, {columns}) VALUES (new.id, {new_values});
+                    END
+                """)
+                if created:
+                    await db.execute(f"INSERT INTO {table}_fts ({table}_fts, rank) VALUES ('rank', ?)",
+                                     (fts_rank[table],))
+                    # Индекс по уже существующим строкам
+                    await db.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')")
+
             await db.commit()
 
+            cursor = await db.execute("PRAGMA auto_vacuum")
+            if (await cursor.fetchone())[0] != 2:
+                # Перевод - полный VACUUM под монопольной блокировкой: только отдельным шагом
+                logging.warning("База без auto_vacuum=INCREMENTAL: свободное место не возвращается. "
+                                "Остановите бота и выполните python tools/convert_auto_vacuum.py --convert")
+
+            # WAL позволяет процессам-обработчикам читать базу во время записи
+            await db.execute("PRAGMA journal_mode=WAL")
+
+            # Версия - последней: прерванное создание схемы повторится при следующем запуске
+            await db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        return True
+
+    async def _ensure_column(self, db: aiosqlite.Connection, table: str, column: str, definition: str):
+        """Добавить колонку в существующую таблицу, если ее еще нет"""
+        cursor = await db.execute(f"PRAGMA table_info({table})")
+        columns = {row[1] for row in await cursor.fetchall()}
+        if column not in columns:
+            await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    async def warm_up(self) -> Dict[str, int]:
+        """Прогрев после запуска: кэш ролей, ростер всех классов и страницы активных заданий.
+
+        Заданий в памяти бот не держит, поэтому их выборка по каждому классу
+        только подтягивает страницы таблицы в кэш ОС для первых /assignments.
+        """
+        role_cache.invalidate()
+        roster_cache.invalidate()
+        _, recipients, *assignments = await asyncio.gather(
+            self._ensure_role_cache(),
+            self.get_broadcast_recipients(0),
+            *(self.get_assignments_for_grade(grade) for grade in SCHOOL_GRADES)
+        )
+        return {
+            'students': len(recipients),
+            'assignments': len({a['id'] for grade_assignments in assignments for a in grade_assignments})
+        }
+
+    async def checkpoint(self) -> tuple:
+        """Перенести WAL в файл базы и обрезать журнал (при остановке).
+
+        Возвращает (база занята другим соединением, размер WAL до сброса в байтах).
+        """
+        wal_path = self.db_path + "-wal"
+        wal_size = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+        async with self.connect() as db:
+            cursor = await db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            busy, _, _ = await cursor.fetchone()
+        return bool(busy), wal_size
+
     # === МЕТОДЫ ДЛЯ РАБОТЫ С ФАЙЛАМИ ===
 
     async def save_file(self, file_id: str, file_unique_id: str, file_name: str,
                        file_size: int, mime_type: str, file_type: str,
-                       uploaded_by: int, description: str = "") -> int:
-        """Сохранить информацию о файле"""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute("""
-                INSERT INTO files (file_id, file_unique_id, file_name, file_size, 
-                                 mime_type, file_type, uploaded_by, description)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (file_id, file_unique_id, file_name, file_size, mime_type,
-                  file_type, uploaded_by, description))
+                       uploaded_by: int, description: str = "",
+                       quota: Optional[Tuple[int, int]] = None) -> Optional[int]:
+        """Сохранить информацию о файле.
+
+        quota - (файлов, байт) пользователя по умолчанию (0 - без ограничения),
+        индивидуальная квота из quota_overrides важнее. Проверка по счетчикам
+        storage_usage и вставка - один запрос; если файл превысит квоту, он не
+        сохраняется и возвращается None.
+        """
+        async with self.connect() as db:
+            if quota is None:
+                cursor = await db.execute("""
+                    INSERT INTO files (file_id, file_unique_id, file_name, file_size,
+                                     mime_type, file_type, uploaded_by, description)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, (file_id, file_unique_id, file_name, file_size, mime_type,
+                      file_type, uploaded_by, description))
+            else:
+                cursor = await db.execute("""
+                    INSERT INTO files (file_id, file_unique_id, file_name, file_size,
+                                     mime_type, file_type, uploaded_by, description)
+                    SELECT ?, ?, ?, ?, ?, ?, q.user_id, ?
+                    FROM (SELECT ? AS user_id, ? AS max_files, ? AS max_bytes) q
+                    LEFT JOIN storage_usage s ON s.user_id = q.user_id
+                    LEFT JOIN quota_overrides o ON o.user_id = q.user_id
+                    WHERE (COALESCE(o.max_files, q.max_files) = 0
+                           OR COALESCE(s.files, 0) + 1 <= COALESCE(o.max_files, q.max_files))
+                      AND (COALESCE(o.max_bytes, q.max_bytes) = 0
+                           OR COALESCE(s.bytes, 0) + ? <= COALESCE(o.max_bytes, q.max_bytes))
+                """, (file_id, file_unique_id, file_name, file_size, mime_type, file_type, description,
+                      uploaded_by, quota[0], quota[1], file_size or 0))
             await db.commit()
-            return cursor.lastrowid
+            return cursor.lastrowid if cursor.rowcount else None
 
     async def attach_file_to_object(self, file_id: int, object_type: str, object_id: int):
         """Привязать файл к объекту (заданию, решению, оценке)"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.connect() as db:
             await db.execute("""
                 INSERT INTO file_attachments (file_id, object_type, object_id)
                 VALUES (?, ?, ?)
             """, (file_id, object_type, object_id))
             await db.commit()
 
-    async def get_object_files(self, object_type: str, object_id: int) -> List[Dict]:
-        """Получить все файлы, привязанные к объекту"""
-        async with aiosqlite.connect(self.db_path) as db:
+    async def get_object_files(self, object_type: str, object_id: int, archived: bool = False) -> List[Dict]:
+        """Получить все файлы, привязанные к объекту (archived - из архива)"""
+        if archived:
+            async with self._connect_archive() as db:
+                db.row_factory = aiosqlite.Row
+                cursor = await db.execute("""
+                    SELECT f.*, fa.attached_date, u.first_name, u.last_name
+                    FROM archive.files f
+                    JOIN archive.file_attachments fa ON f.id = fa.file_id
+                    LEFT JOIN main.users u ON f.uploaded_by = u.telegram_id
+                    WHERE fa.object_type = ? AND fa.object_id = ?
+                    ORDER BY fa.attached_date ASC
+                """, (object_type, object_id))
+                return [dict(row) for row in await cursor.fetchall()]
+
+        async with self.connect() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("""
                 SELECT f.*, fa.attached_date, u.first_name, u.last_name
@@ -162,7 +575,7 @@ class DatabaseHandler:
 
     async def get_file_by_id(self, file_id: int) -> Optional[Dict]:
         """Получить информацию о файле по ID"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.connect() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("""
                 SELECT * FROM files WHERE id = ?
@@ -172,7 +585,7 @@ class DatabaseHandler:
 
     async def delete_file_attachment(self, file_id: int, object_type: str, object_id: int) -> bool:
         """Удалить привязку файла к объекту"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.connect() as db:
             cursor = await db.execute("""
                 DELETE FROM file_attachments 
                 WHERE file_id = ? AND object_type = ? AND object_id = ?
@@ -180,6 +593,102 @@ class DatabaseHandler:
             await db.commit()
             return cursor.rowcount > 0
 
+    async def get_orphan_files(self, grace_hours: float, after_id: int = 0, limit: int = 500) -> List[Dict]:
+        """Файлы без привязок, загруженные больше grace_hours часов назад (id > after_id)"""
+        async with self.connect() as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute("""
+                SELECT id, file_size FROM files f
+                WHERE id > ? AND uploaded_date < datetime('now', ?)
+                  AND NOT EXISTS (SELECT 1 FROM file_attachments fa WHERE fa.file_id = f.id)
+                ORDER BY id
+                LIMIT ?
+            """, (after_id, f"-{grace_hours * 3600:.0f} seconds", limit))
+            return [dict(row) for row in await cursor.fetchall()]
+
+    async def delete_orphan_files(self, file_ids: List[int]) -> Dict[str, int]:
+        """Удалить файлы, если у них так и нет привязок; вернуть {'rows': ..., 'bytes': ...}.
+
+        Условие проверяется заново в самом DELETE: файл, привязанный после
+        выборки, остается.
+        """
+        if not file_ids:
+            return {'rows': 0, 'bytes': 0}
+        async with self.connect() as db:
+            cursor = await db.execute(f"""
+                DELETE FROM files
+                WHERE id IN ({",".join("?" * len(file_ids))})
+                  AND NOT EXISTS (SELECT 1 FROM file_attachments fa WHERE fa.file_id = files.id)
+                RETURNING file_size
+            """, file_ids)
+            sizes = [row[0] or 0 for row in await cursor.fetchall()]
+            await db.commit()
+        return {'rows': len(sizes), 'bytes': sum(sizes)}
+
+    async def get_orphan_summary(self) -> Dict[str, int]:
+        """Сколько файлов без привязок и их общий размер"""
+        async with self.connect() as db:
+            cursor = await db.execute("""
+                SELECT COUNT(*), COALESCE(SUM(file_size), 0) FROM files f
+                WHERE NOT EXISTS (SELECT 1 FROM file_attachments fa WHERE fa.file_id = f.id)
+            """)
+            rows, size = await cursor.fetchone()
+        return {'rows': rows, 'bytes': size}
+
+    # === МЕТОДЫ ДЛЯ КВОТ ===
+
+    async def get_storage_usage(self, user_id: int) -> Dict:
+        """Объем загрузок пользователя и его индивидуальная квота (None - по умолчанию)"""
+        async with self.connect() as db:
+            cursor = await db.execute("""
+                SELECT COALESCE(s.files, 0), COALESCE(s.bytes, 0), o.max_files, o.max_bytes
+                FROM (SELECT ? AS user_id) q
+                LEFT JOIN storage_usage s ON s.user_id = q.user_id
+                LEFT JOIN quota_overrides o ON o.user_id = q.user_id
+            """, (user_id,))
+            files, size, max_files, max_bytes = await cursor.fetchone()
+        return {'files': files, 'bytes': size, 'max_files': max_files, 'max_bytes': max_bytes}
+
+    async def get_top_storage_usage(self, limit: int = 10) -> List[Dict]:
+        """Пользователи с наибольшим объемом загрузок"""
+        async with self.connect() as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute("""
+                SELECT s.user_id, s.files, s.bytes, o.max_files, o.max_bytes, u.first_name, u.last_name
+                FROM storage_usage s
+                LEFT JOIN quota_overrides o ON o.user_id = s.user_id
+                LEFT JOIN users u ON u.telegram_id = s.user_id
+                WHERE s.files > 0
+                ORDER BY s.bytes DESC
+                LIMIT ?
+            """, (limit,))
+            return [dict(row) for row in await cursor.fetchall()]
+
+    async def get_storage_totals(self) -> Dict[str, int]:
+        """Всего файлов и байт по счетчикам"""
+        async with self.connect() as db:
+            cursor = await db.execute("SELECT COALESCE(SUM(files), 0), COALESCE(SUM(bytes), 0) FROM storage_usage")
+            files, size = await cursor.fetchone()
+        return {'files': files, 'bytes': size}
+
+    async def set_quota_override(self, user_id: int, max_files: Optional[int], max_bytes: Optional[int],
+                                 set_by: int):
+        """Индивидуальная квота пользователя (None - по умолчанию, 0 - без ограничения)"""
+        async with self.connect() as db:
+            await db.execute("""
+                INSERT INTO quota_overrides (user_id, max_files, max_bytes, set_by) VALUES (?, ?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET max_files = excluded.max_files, max_bytes = excluded.max_bytes,
+                    set_by = excluded.set_by, set_date = CURRENT_TIMESTAMP
+            """, (user_id, max_files, max_bytes, set_by))
+            await db.commit()
+
+    async def delete_quota_override(self, user_id: int) -> bool:
+        """Вернуть пользователю квоту по умолчанию"""
+        async with self.connect() as db:
+            cursor = await db.execute("DELETE FROM quota_overrides WHERE user_id = ?", (user_id,))
+            await db.commit()
+            return cursor.rowcount > 0
+
     # === МЕТОДЫ ДЛЯ ЗАЯВОК НА РЕГИСТРАЦИЮ ===
 
     async def create_registration_request(self, telegram_id: int, username: str,
@@ -188,7 +697,7 @@ class DatabaseHandler:
                                           motivation: str) -> bool:
         """Создать заявку на регистрацию"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.connect() as db:
                 await db.execute("""
                     INSERT INTO registration_requests 
                     (telegram_id, username, first_name, last_name, phone, grade, parent_contact, motivation)
@@ -201,7 +710,7 @@ class DatabaseHandler:
 
     async def get_pending_requests(self) -> List[Dict]:
         """Получить все ожидающие заявки"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.connect() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("""
                 SELECT * FROM registration_requests 
@@ -213,7 +722,7 @@ class DatabaseHandler:
 
     async def approve_registration(self, request_id: int, admin_comment: str = "") -> bool:
         """Одобрить заявку и создать пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.connect() as db:
             # Получаем данные заявки
             cursor = await db.execute("""
                 SELECT * FROM registration_requests WHERE id = ? AND status = 'pending'
@@ -239,13 +748,76 @@ class DatabaseHandler:
                 """, (admin_comment, request_id))
 
                 await db.commit()
+                role_cache.invalidate()
+                roster_cache.add(request_data[1], request_data[6])
                 return True
             except Exception:
                 return False
 
+    async def get_registration_request(self, request_id: int) -> Optional[Dict]:
+        """Получить заявку по ID"""
+        async with self.connect() as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute("""
+                SELECT * FROM registration_requests WHERE id = ?
+            """, (request_id,))
+            row = await cursor.fetchone()
+            return dict(row) if row else None
+
+    async def approve_registrations_bulk(self, grade: Optional[int] = None,
+                                         admin_comment: str = "") -> List[Dict]:
+        """Одобрить все ожидающие заявки (или заявки одного класса) одной транзакцией.
+
+        Возвращает одобренные заявки для отправки приветствий.
+        """
+        async with self.connect() as db:
+            db.row_factory = aiosqlite.Row
+            await db.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = await db.execute("""
+                    SELECT id, telegram_id, first_name, last_name, grade
+                    FROM registration_requests
+                    WHERE status = 'pending' AND (? IS NULL OR grade = ?)
+                """, (grade, grade))
+                approved = [dict(row) for row in await cursor.fetchall()]
+
+                if approved:
+                    # Повторная заявка ранее деактивированного ученика обновляет его запись
+                    await db.execute("""
+                        INSERT INTO users (telegram_id, username, first_name, last_name, phone, grade, parent_contact)
+                        SELECT telegram_id, username, first_name, last_name, phone, grade, parent_contact
+                        FROM registration_requests
+                        WHERE status = 'pending' AND (? IS NULL OR grade = ?)
+                        ON CONFLICT (telegram_id) DO UPDATE SET
+                            username = excluded.username,
+                            first_name = excluded.first_name,
+                            last_name = excluded.last_name,
+                            phone = excluded.phone,
+                            grade = excluded.grade,
+                            parent_contact = excluded.parent_contact,
+                            is_active = TRUE
+                    """, (grade, grade))
+
+                    await db.execute("""
+                        UPDATE registration_requests
+                        SET status = 'approved', admin_comment = ?
+                        WHERE status = 'pending' AND (? IS NULL OR grade = ?)
+                    """, (admin_comment, grade, grade))
+
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+
+        if approved:
+            role_cache.invalidate()
+            for request in approved:
+                roster_cache.add(request['telegram_id'], request['grade'])
+        return approved
+
     async def reject_registration(self, request_id: int, admin_comment: str) -> bool:
         """Отклонить заявку"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.connect() as db:
             await db.execute("""
                 UPDATE registration_requests 
                 SET status = 'rejected', admin_comment = ?
@@ -258,15 +830,23 @@ class DatabaseHandler:
 
     async def is_user_registered(self, telegram_id: int) -> bool:
         """Проверить, зарегистрирован ли пользователь"""
-        async with aiosqlite.connect(self.db_path) as db:
+        await self._ensure_role_cache()
+        if role_cache.is_user(telegram_id):
+            return True
+
+        # Ученика могли одобрить в другом процессе бота: промах проверяем по базе
+        async with self.connect() as db:
             cursor = await db.execute("""
                 SELECT 1 FROM users WHERE telegram_id = ? AND is_active = TRUE
             """, (telegram_id,))
-            return await cursor.fetchone() is not None
+            if await cursor.fetchone() is None:
+                return False
+        role_cache.add_user(telegram_id)
+        return True
 
     async def has_pending_request(self, telegram_id: int) -> bool:
         """Проверить, есть ли ожидающая заявка"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.connect() as db:
             cursor = await db.execute("""
                 SELECT 1 FROM registration_requests 
                 WHERE telegram_id = ? AND status = 'pending'
@@ -275,7 +855,7 @@ class DatabaseHandler:
 
     async def get_user(self, telegram_id: int) -> Optional[Dict]:
         """Получить данные пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.connect() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("""
                 SELECT * FROM users WHERE telegram_id = ?
@@ -287,24 +867,119 @@ class DatabaseHandler:
 
     async def is_admin(self, telegram_id: int) -> bool:
         """Проверить, является ли пользователь администратором"""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute("""
-                SELECT 1 FROM admins WHERE telegram_id = ?
-            """, (telegram_id,))
-            return await cursor.fetchone() is not None
+        await self._ensure_role_cache()
+        return role_cache.is_admin(telegram_id)
+
+    async def _ensure_role_cache(self):
+        """Загрузить множества ролей, если кэш пуст или устарел"""
+        if role_cache.is_fresh():
+            return
+        async with self.connect() as db:
+            cursor = await db.execute("SELECT telegram_id FROM admins")
+            admin_ids = [row[0] for row in await cursor.fetchall()]
+            cursor = await db.execute("SELECT telegram_id FROM users WHERE is_active = TRUE")
+            user_ids = [row[0] for row in await cursor.fetchall()]
+        role_cache.load(admin_ids, user_ids)
 
     async def add_admin(self, telegram_id: int, username: str, first_name: str, is_super_admin: bool = False):
         """Добавить администратора"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.connect() as db:
             await db.execute("""
                 INSERT OR REPLACE INTO admins (telegram_id, username, first_name, is_super_admin)
                 VALUES (?, ?, ?, ?)
             """, (telegram_id, username, first_name, is_super_admin))
             await db.commit()
+        role_cache.invalidate()
+
+    async def deactivate_user(self, telegram_id: int) -> bool:
+        """Деактивировать ученика"""
+        async with self.connect() as db:
+            cursor = await db.execute("""
+                UPDATE users SET is_active = FALSE WHERE telegram_id = ? AND is_active = TRUE
+            """, (telegram_id,))
+            await db.commit()
+
+        if cursor.rowcount > 0:
+            role_cache.invalidate()
+            roster_cache.remove(telegram_id)
+            return True
+        return False
+
+    async def mark_users_unreachable(self, user_ids: List[int]) -> int:
+        """Отметить учеников, которым не доставляются сообщения"""
+        if not user_ids:
+            return 0
+
+        placeholders = ",".join("?" * len(user_ids))
+        async with self.connect() as db:
+            cursor = await db.execute(f"""
+                UPDATE users SET unreachable_since = CURRENT_TIMESTAMP
+                WHERE telegram_id IN ({placeholders}) AND unreachable_since IS NULL
+            """, user_ids)
+            await db.commit()
+
+        unreachable_cache.add(user_ids)
+        for telegram_id in user_ids:
+            roster_cache.remove(telegram_id)
+        return cursor.rowcount
+
+    async def restore_user_reachability(self, telegram_id: int) -> bool:
+        """Вернуть ученика в рассылки (он снова написал боту)"""
+        unreachable_cache.discard(telegram_id)
+        async with self.connect() as db:
+            cursor = await db.execute("""
+                UPDATE users SET unreachable_since = NULL
+                WHERE telegram_id = ? AND unreachable_since IS NOT NULL
+            """, (telegram_id,))
+            await db.commit()
+            if cursor.rowcount == 0:
+                return False
+
+            cursor = await db.execute("""
+                SELECT grade FROM users WHERE telegram_id = ? AND is_active = TRUE
+            """, (telegram_id,))
+            row = await cursor.fetchone()
+
+        if row:
+            roster_cache.add(telegram_id, row[0])
+        return True
+
+    async def load_unreachable_users(self):
+        """Загрузить множество недоступных учеников в кэш"""
+        async with self.connect() as db:
+            cursor = await db.execute("""
+                SELECT telegram_id FROM users WHERE unreachable_since IS NOT NULL
+            """)
+            unreachable_cache.load(row[0] for row in await cursor.fetchall())
+
+    async def get_users_by_grade(self, grade: Optional[int] = None) -> List[tuple]:
+        """Получить (telegram_id, grade) активных доступных учеников класса (None - всех)"""
+        async with self.connect() as db:
+            if grade is None:
+                cursor = await db.execute("""
+                    SELECT telegram_id, grade FROM users
+                    WHERE is_active = TRUE AND unreachable_since IS NULL
+                """)
+            else:
+                cursor = await db.execute("""
+                    SELECT telegram_id, grade FROM users
+                    WHERE grade = ? AND is_active = TRUE AND unreachable_since IS NULL
+                """, (grade,))
+            return await cursor.fetchall()
+
+    async def get_broadcast_recipients(self, grade_level: int) -> List[int]:
+        """Получить ID учеников для рассылки по заданию (0 - все классы)"""
+        if not roster_cache.has_grade(grade_level):
+            if grade_level == 0:
+                roster_cache.load_all(await self.get_users_by_grade())
+            else:
+                rows = await self.get_users_by_grade(grade_level)
+                roster_cache.load_grade(grade_level, [row[0] for row in rows])
+        return roster_cache.recipients(grade_level)
 
     async def get_all_users(self) -> List[Dict]:
         """Получить всех зарегистрированных пользователей"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.connect() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("""
                 SELECT * FROM users WHERE is_active = TRUE ORDER BY registration_date DESC
@@ -315,23 +990,25 @@ class DatabaseHandler:
     # === МЕТОДЫ ДЛЯ ЗАДАНИЙ ===
 
     async def create_assignment(self, title: str, description: str, grade_level: int,
-                                difficulty: str, created_by: int, due_date: str = None) -> int:
+                                difficulty: str, created_by: int, due_date: str = None,
+                                publish_date: str = None) -> int:
         """Создать новое задание"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.connect() as db:
             cursor = await db.execute("""
-                INSERT INTO assignments (title, description, grade_level, difficulty, created_by, due_date)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (title, description, grade_level, difficulty, created_by, due_date))
+                INSERT INTO assignments (title, description, grade_level, difficulty, created_by, due_date, publish_date)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (title, description, grade_level, difficulty, created_by, due_date, publish_date))
             await db.commit()
             return cursor.lastrowid
 
     async def get_assignments_for_grade(self, grade: int, is_active: bool = True) -> List[Dict]:
         """Получить задания для определенного класса"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.connect() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("""
                 SELECT * FROM assignments 
                 WHERE (grade_level = ? OR grade_level = 0) AND is_active = ?
+                  AND (publish_date IS NULL OR publish_date <= datetime('now', 'localtime'))
                 ORDER BY created_date DESC
             """, (grade, is_active))
             rows = await cursor.fetchall()
@@ -339,7 +1016,7 @@ class DatabaseHandler:
 
     async def get_assignment_by_id(self, assignment_id: int) -> Optional[Dict]:
         """Получить задание по ID"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.connect() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("""
                 SELECT * FROM assignments WHERE id = ?
@@ -349,7 +1026,7 @@ class DatabaseHandler:
 
     async def get_all_assignments(self) -> List[Dict]:
         """Получить все задания (для админа)"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.connect() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("""
                 SELECT a.*, u.first_name as creator_name 
@@ -362,45 +1039,336 @@ class DatabaseHandler:
 
     async def deactivate_assignment(self, assignment_id: int) -> bool:
         """Деактивировать задание"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.connect() as db:
             cursor = await db.execute("""
-                UPDATE assignments SET is_active = FALSE WHERE id = ?
+                UPDATE assignments SET is_active = FALSE, deactivated_date = CURRENT_TIMESTAMP
+                WHERE id = ? AND is_active = TRUE
             """, (assignment_id,))
             await db.commit()
             return cursor.rowcount > 0
 
-    # === МЕТОДЫ ДЛЯ РЕЗУЛЬТАТОВ ===
+    async def get_students_without_solution(self, assignment_id: int) -> List[int]:
+        """Получить ID активных учеников целевого класса, не сдавших задание"""
+        async with self.connect() as db:
+            cursor = await db.execute("""
+                SELECT u.telegram_id
+                FROM users u
+                JOIN assignments a ON a.id = ?
+                WHERE u.is_active = TRUE AND u.unreachable_since IS NULL
+                  AND (a.grade_level = 0 OR u.grade = a.grade_level)
+                  AND NOT EXISTS (
+                      SELECT 1 FROM results r
+                      WHERE r.user_id = u.telegram_id AND r.assignment_id = a.id
+                  )
+            """, (assignment_id,))
+            return [row[0] for row in await cursor.fetchall()]
+
+    # === МЕТОДЫ ДЛЯ ПЛАНИРОВЩИКА ===
 
-    async def submit_solution(self, user_id: int, assignment_id: int, solution_text: str) -> int:
-        """Отправить решение задания"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Проверяем, не отправлял ли уже решение
+    async def add_scheduled_job(self, kind: str, object_id: int, run_at: str) -> Optional[int]:
+        """Сохранить задачу; None, если такая задача уже запланирована"""
+        async with self.connect() as db:
             cursor = await db.execute("""
-                SELECT id FROM results WHERE user_id = ? AND assignment_id = ?
-            """, (user_id, assignment_id))
-            existing = await cursor.fetchone()
+                INSERT OR IGNORE INTO scheduled_jobs (kind, object_id, run_at)
+                VALUES (?, ?, ?)
+            """, (kind, object_id, run_at))
+            await db.commit()
+            return cursor.lastrowid if cursor.rowcount > 0 else None
 
-            if existing:
-                # Обновляем существующее решение
-                await db.execute("""
-                    UPDATE results SET solution_text = ?, completed_date = CURRENT_TIMESTAMP, score = NULL
-                    WHERE user_id = ? AND assignment_id = ?
-                """, (solution_text, user_id, assignment_id))
-                result_id = existing[0]
+    async def get_pending_jobs(self, after_id: int = 0) -> List[Dict]:
+        """Получить невыполненные задачи планировщика (after_id - только созданные позже этой)"""
+        async with self.connect() as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute("""
+                SELECT id, kind, object_id, run_at FROM scheduled_jobs
+                WHERE id > ? AND status = 'pending'
+                ORDER BY run_at ASC
+            """, (after_id,))
+            rows = await cursor.fetchall()
+            return [dict(row) for row in rows]
+
+    async def finish_scheduled_job(self, job_id: int, status: str = 'done'):
+        """Отметить задачу выполненной (или завершившейся ошибкой)"""
+        async with self.connect() as db:
+            await db.execute("""
+                UPDATE scheduled_jobs SET status = ? WHERE id = ?
+            """, (status, job_id))
+            await db.commit()
+
+    # === ПОИСК ===
+
+    async def search(self, text: str, user_id: Optional[int] = None, grade: Optional[int] = None,
+                     limit: int = 10, offset: int = 0) -> List[Dict]:
+        """Полнотекстовый поиск по заданиям и решениям, лучшие совпадения первыми.
+
+        user_id/grade - поиск ученика: опубликованные задания его класса и
+        только свои решения; без них (администратор) - все задания и решения.
+        Строка: kind ('assignment' или 'solution'), id, title, snippet,
+        для решений - user_id, first_name, last_name.
+        """
+        match = fts_query(text)
+        if match is None:
+            return []
+        # Слова ищутся только в тексте: автор (u<id>) - служебная колонка
+        text_match = f"{{solution_text comment}} : ({match})"
+        results_match = f"author:u{int(user_id)} AND ({text_match})" if user_id is not None else text_match
+
+        async with self.connect() as db:
+            # Сначала только ранжирование, фрагменты текста - для одной страницы
+            cursor = await db.execute("""
+                SELECT kind, id FROM (
+                    SELECT 'assignment' AS kind, assignments_fts.rowid AS id, assignments_fts.rank AS rank
+                    FROM assignments_fts
+                    JOIN assignments a ON a.id = assignments_fts.rowid
+                    WHERE assignments_fts MATCH ?
+                      AND (? IS NULL OR ((a.grade_level = ? OR a.grade_level = 0) AND a.is_active = TRUE
+                           AND (a.publish_date IS NULL OR a.publish_date <= datetime('now', 'localtime'))))
+                    UNION ALL
+                    SELECT 'solution', id, rank FROM (
+                        SELECT rowid AS id, rank FROM results_fts
+                        WHERE results_fts MATCH ?
+                        ORDER BY rowid DESC
+                        LIMIT ?
+                    )
+                )
+                ORDER BY rank
+                LIMIT ? OFFSET ?
+            """, (match, grade, grade, results_match, SEARCH_WINDOW, limit, offset))
+            page = await cursor.fetchall()
+
+            details = {}
+            assignment_ids = [row[1] for row in page if row[0] == 'assignment']
+            if assignment_ids:
+                cursor = await db.execute(f"""
+                    SELECT a.id, a.title, snippet(assignments_fts, -1, '«', '»', '…', 12)
+                    FROM assignments_fts
+                    JOIN assignments a ON a.id = assignments_fts.rowid
+                    WHERE assignments_fts MATCH ? AND assignments_fts.rowid IN ({",".join("?" * len(assignment_ids))})
+                """, [match, *assignment_ids])
+                for row_id, title, snippet in await cursor.fetchall():
+                    details['assignment', row_id] = {'title': title, 'snippet': snippet}
+
+            solution_ids = [row[1] for row in page if row[0] == 'solution']
+            if solution_ids:
+                cursor = await db.execute(f"""
+                    SELECT r.id, a.title, snippet(results_fts, -1, '«', '»', '…', 12),
+                           r.user_id, u.first_name, u.last_name
+                    FROM results_fts
+                    JOIN results r ON r.id = results_fts.rowid
+                    JOIN assignments a ON a.id = r.assignment_id
+                    LEFT JOIN users u ON u.telegram_id = r.user_id
+                    WHERE results_fts MATCH ? AND results_fts.rowid IN ({",".join("?" * len(solution_ids))})
+                """, [text_match, *solution_ids])
+                for row_id, title, snippet, owner, first_name, last_name in await cursor.fetchall():
+                    details['solution', row_id] = {'title': title, 'snippet': snippet, 'user_id': owner,
+                                                   'first_name': first_name, 'last_name': last_name}
+
+        return [{'kind': kind, 'id': row_id, **details[kind, row_id]}
+                for kind, row_id in page if (kind, row_id) in details]
+
+    # === МЕТОДЫ ДЛЯ АРХИВА ===
+
+    async def get_archivable_assignments(self, months: int) -> List[int]:
+        """Задания, деактивированные больше months месяцев назад и еще не перенесенные в архив"""
+        async with self.connect() as db:
+            cursor = await db.execute("""
+                SELECT id FROM assignments
+                WHERE is_active = FALSE AND archived_date IS NULL
+                  AND deactivated_date < datetime('now', ?)
+                ORDER BY deactivated_date
+            """, (f"-{months} months",))
+            return [row[0] for row in await cursor.fetchall()]
+
+    async def archive_assignment_batch(self, assignment_id: int, batch_size: int = 500) -> Dict[str, int]:
+        """Перенести в архив очередную порцию решений задания вместе с их файлами.
+
+        Когда решений не осталось, переносятся файлы самого задания и оно
+        помечается archived_date. Порция - две короткие транзакции: копия в
+        архив, затем удаление из основной базы. В режиме WAL транзакция по
+        двум базам не атомарна, поэтому копирование идет первым и
+        повторяемо (INSERT OR REPLACE): сбой между ними оставит дубль в
+        архиве, но не потеряет данных.
+        Возвращает {'results': ..., 'attachments': ..., 'files': ..., 'done': 0/1}.
+        """
+        async with self._connect_archive() as db:
+            cursor = await db.execute("""
+                SELECT id FROM results WHERE assignment_id = ? ORDER BY id LIMIT ?
+            """, (assignment_id, batch_size))
+            result_ids = [row[0] for row in await cursor.fetchall()]
+
+            if result_ids:
+                marks = ",".join("?" * len(result_ids))
+                attachment_filter = f"object_type IN ('solution', 'grade') AND object_id IN ({marks})"
+                params = result_ids
             else:
-                # Создаем новое решение
-                cursor = await db.execute("""
-                    INSERT INTO results (user_id, assignment_id, solution_text)
-                    VALUES (?, ?, ?)
-                """, (user_id, assignment_id, solution_text))
-                result_id = cursor.lastrowid
+                attachment_filter = "object_type = 'assignment' AND object_id = ?"
+                params = [assignment_id]
 
+            cursor = await db.execute(f"SELECT id, file_id FROM file_attachments WHERE {attachment_filter}", params)
+            attachments = await cursor.fetchall()
+            attachment_ids = [row[0] for row in attachments]
+            file_ids = sorted({row[1] for row in attachments})
+
+            for table, ids in (('results', result_ids), ('file_attachments', attachment_ids), ('files', file_ids)):
+                if ids:
+                    columns = ARCHIVE_COLUMNS[table]
+                    await db.execute(f"""
+                        INSERT OR REPLACE INTO archive.{table} ({columns})
+                        SELECT {columns} FROM main.{table} WHERE id IN ({",".join("?" * len(ids))})
+                    """, ids)
             await db.commit()
-            return result_id
 
-    async def get_user_solutions(self, user_id: int) -> List[Dict]:
-        """Получить все решения пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
+            files_deleted = 0
+            if attachment_ids:
+                await db.execute(f"DELETE FROM main.file_attachments WHERE id IN ({','.join('?' * len(attachment_ids))})",
+                                 attachment_ids)
+            if file_ids:
+                # Файл, привязанный еще к чему-то в основной базе, остается и там
+                cursor = await db.execute(f"""
+                    DELETE FROM main.files WHERE id IN ({",".join("?" * len(file_ids))})
+                      AND id NOT IN (SELECT file_id FROM main.file_attachments)
+                """, file_ids)
+                files_deleted = cursor.rowcount
+            if result_ids:
+                await db.execute(f"DELETE FROM main.results WHERE id IN ({','.join('?' * len(result_ids))})",
+                                 result_ids)
+            else:
+                await db.execute("""
+                    UPDATE main.assignments SET archived_date = CURRENT_TIMESTAMP WHERE id = ?
+                """, (assignment_id,))
+            await db.commit()
+
+        return {'results': len(result_ids), 'attachments': len(attachment_ids),
+                'files': files_deleted, 'done': int(not result_ids)}
+
+    async def get_archive_summary(self) -> Dict:
+        """Сколько заданий, решений и файлов в архиве и в основной базе"""
+        async with self._connect_archive() as db:
+            counts = {}
+            for key, sql in (
+                ('archived_assignments', "SELECT COUNT(*) FROM main.assignments WHERE archived_date IS NOT NULL"),
+                ('results', "SELECT COUNT(*) FROM main.results"),
+                ('files', "SELECT COUNT(*) FROM main.files"),
+                ('archive_results', "SELECT COUNT(*) FROM archive.results"),
+                ('archive_files', "SELECT COUNT(*) FROM archive.files"),
+            ):
+                cursor = await db.execute(sql)
+                counts[key] = (await cursor.fetchone())[0]
+        return counts
+
+    # === МЕТОДЫ ДЛЯ ОБСЛУЖИВАНИЯ БАЗЫ ===
+
+    async def add_maintenance_log(self, operation: str, object_name: Optional[str], started_at: str,
+                                  seconds: float, max_step_ms: float, amount: int, keep_days: int = 90):
+        """Записать операцию обслуживания; записи старше keep_days удаляются
+        (последний ANALYZE каждой таблицы остается - от него считаются изменения)"""
+        async with self.connect() as db:
+            await db.execute("""
+                INSERT INTO maintenance_log (operation, object, started_at, seconds, max_step_ms, amount)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (operation, object_name, started_at, seconds, max_step_ms, amount))
+            await db.execute("""
+                DELETE FROM maintenance_log
+                WHERE started_at < datetime('now', 'localtime', ?)
+                  AND id NOT IN (SELECT MAX(id) FROM maintenance_log WHERE operation = 'analyze' GROUP BY object)
+            """, (f"-{keep_days} days",))
+            await db.commit()
+
+    async def get_analyzed_row_counts(self) -> Dict[str, int]:
+        """Число строк каждой таблицы на момент ее последнего ANALYZE"""
+        async with self.connect() as db:
+            cursor = await db.execute("""
+                SELECT object, amount FROM maintenance_log
+                WHERE id IN (SELECT MAX(id) FROM maintenance_log WHERE operation = 'analyze' GROUP BY object)
+            """)
+            return {row[0]: row[1] for row in await cursor.fetchall()}
+
+    async def get_last_maintenance(self) -> List[Dict]:
+        """Последний запуск каждой операции обслуживания (ANALYZE - по каждой таблице)"""
+        async with self.connect() as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute("""
+                SELECT operation, object, started_at, seconds, max_step_ms, amount FROM maintenance_log
+                WHERE id IN (SELECT MAX(id) FROM maintenance_log GROUP BY operation, object)
+                ORDER BY operation, object
+            """)
+            return [dict(row) for row in await cursor.fetchall()]
+
+    # === МЕТОДЫ ДЛЯ РЕЗУЛЬТАТОВ ===
+
+    async def submit_solution(self, user_id: int, assignment_id: int, solution_text: str) -> Tuple[int, bool]:
+        """Отправить решение задания.
+
+        Возвращает id решения и признак первого решения по заданию: новая
+        строка, до которой решений задания не было. Повторная отправка
+        обновляет существующую строку и первой не считается.
+        """
+        async with self.connect() as db:
+            # Блокировка записи сразу: проверка "первое решение" и вставка не разделяются другой отправкой
+            await db.execute("BEGIN IMMEDIATE")
+            try:
+                # Проверяем, не отправлял ли уже решение
+                cursor = await db.execute("""
+                    SELECT id, completed_date FROM results WHERE user_id = ? AND assignment_id = ?
+                """, (user_id, assignment_id))
+                existing = await cursor.fetchone()
+
+                moments = []
+                if existing:
+                    # Обновляем существующее решение
+                    await db.execute("""
+                        UPDATE results SET solution_text = ?, completed_date = CURRENT_TIMESTAMP, score = NULL
+                        WHERE user_id = ? AND assignment_id = ?
+                    """, (solution_text, user_id, assignment_id))
+                    result_id = existing[0]
+                    moments.append(existing[1])
+                    is_first = False
+                else:
+                    cursor = await db.execute("""
+                        SELECT NOT EXISTS (SELECT 1 FROM results WHERE assignment_id = ?)
+                    """, (assignment_id,))
+                    is_first = bool((await cursor.fetchone())[0])
+
+                    # Создаем новое решение
+                    cursor = await db.execute("""
+                        INSERT INTO results (user_id, assignment_id, solution_text)
+                        VALUES (?, ?, ?)
+                    """, (user_id, assignment_id, solution_text))
+                    result_id = cursor.lastrowid
+
+                cursor = await db.execute("SELECT completed_date FROM results WHERE id = ?", (result_id,))
+                moments.append((await cursor.fetchone())[0])
+                await self._refresh_progress_buckets(db, user_id, moments)
+
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+        return result_id, is_first
+
+    async def count_assignment_solutions(self, assignment_id: int) -> int:
+        """Количество решений, отправленных по заданию"""
+        async with self.connect() as db:
+            cursor = await db.execute("""
+                SELECT COUNT(*) FROM results WHERE assignment_id = ?
+            """, (assignment_id,))
+            return (await cursor.fetchone())[0]
+
+    async def get_user_solutions(self, user_id: int, archived: bool = False) -> List[Dict]:
+        """Получить все решения пользователя (archived - решения из архива)"""
+        if archived:
+            async with self._connect_archive() as db:
+                db.row_factory = aiosqlite.Row
+                cursor = await db.execute("""
+                    SELECT r.*, a.title, a.description, a.difficulty
+                    FROM archive.results r
+                    JOIN main.assignments a ON r.assignment_id = a.id
+                    WHERE r.user_id = ?
+                    ORDER BY r.completed_date DESC
+                """, (user_id,))
+                return [dict(row) for row in await cursor.fetchall()]
+
+        async with self.connect() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("""
                 SELECT r.*, a.title, a.description, a.difficulty
@@ -414,7 +1382,7 @@ class DatabaseHandler:
 
     async def get_ungraded_solutions(self) -> List[Dict]:
         """Получить непроверенные решения"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.connect() as db:
             db.row_factory = aiosqlite.Row
             cursor = await db.execute("""
                 SELECT r.*, a.title, a.grade_level, u.first_name, u.last_name
@@ -429,18 +1397,27 @@ class DatabaseHandler:
 
     async def grade_solution(self, result_id: int, score: int, max_score: int, comment: str = "") -> bool:
         """Оценить решение"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.connect() as db:
             cursor = await db.execute("""
                 UPDATE results 
                 SET score = ?, max_score = ?, comment = ?
                 WHERE id = ?
             """, (score, max_score, comment, result_id))
+            if cursor.rowcount == 0:
+                return False
+
+            cursor = await db.execute("""
+                SELECT user_id, completed_date FROM results WHERE id = ?
+            """, (result_id,))
+            user_id, completed_date = await cursor.fetchone()
+            await self._refresh_progress_buckets(db, user_id, [completed_date])
+
             await db.commit()
-            return cursor.rowcount > 0
+            return True
 
     async def get_user_stats(self, user_id: int) -> Dict:
         """Получить статистику пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.connect() as db:
             # Общая статистика
             cursor = await db.execute("""
                 SELECT 
@@ -471,4 +1448,102 @@ class DatabaseHandler:
                 'avg_percentage': round(stats[2], 1) if stats and stats[2] else 0,
                 'difficulty_stats': {row[0]: {'count': row[1], 'avg_percentage': round(row[2], 1) if row[2] else 0}
                                      for row in difficulty_stats}
-            }
\ No newline at end of file
+            }
+
+    # === СВОДКИ ПРОГРЕССА ===
+
+    async def _refresh_progress_buckets(self, db: aiosqlite.Connection, user_id: int, moments: List[str]):
+        """Пересчитать недельную и месячную сводку, в которые попадают moments.
+
+        Вызывается в транзакции сдачи или оценки решения; пересчет
+        затрагивает только решения ученика за один период.
+        """
+        for moment in set(moments):
+            for period, (start_expr, end_expr) in PROGRESS_PERIODS.items():
+                await db.execute(f"""
+                    INSERT INTO progress_rollups
+                    (user_id, period, bucket_start, solutions_count, graded_count, percentage_sum, updated_at)
+                    SELECT ?, ?, {start_expr},
+                           COUNT(*), COUNT(CASE WHEN score IS NOT NULL AND max_score > 0 THEN 1 END),
+                           COALESCE(SUM(CASE WHEN score IS NOT NULL AND max_score > 0
+                                        THEN score * 100.0 / max_score END), 0),
+                           strftime('%Y-%m-%d %H:%M:%f', 'now')
+                    FROM results
+                    WHERE user_id = ? AND completed_date >= {start_expr} AND completed_date < {end_expr}
+                    ON CONFLICT (user_id, period, bucket_start) DO UPDATE SET
+                        solutions_count = excluded.solutions_count,
+                        graded_count = excluded.graded_count,
+                        percentage_sum = excluded.percentage_sum,
+                        updated_at = excluded.updated_at
+                """, (user_id, period, moment, user_id, moment, moment))
+
+    async def get_progress_buckets(self, user_id: int, period: str, limit: int = 12) -> List[Dict]:
+        """Получить последние сводки прогресса ученика (по возрастанию даты)"""
+        if period not in PROGRESS_PERIODS:
+            raise ValueError(f"Неизвестный период: {period}")
+
+        async with self.connect() as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute("""
+                SELECT bucket_start, solutions_count, graded_count, percentage_sum, updated_at
+                FROM progress_rollups
+                WHERE user_id = ? AND period = ? AND solutions_count > 0
+                ORDER BY bucket_start DESC
+                LIMIT ?
+            """, (user_id, period, limit))
+            rows = await cursor.fetchall()
+
+        buckets = []
+        for row in reversed(rows):
+            bucket = dict(row)
+            bucket['avg_percentage'] = (round(row['percentage_sum'] / row['graded_count'], 1)
+                                        if row['graded_count'] else None)
+            buckets.append(bucket)
+        return buckets
+
+    # === МЕТОДЫ ДЛЯ ВЫГРУЗКИ ЖУРНАЛА ===
+
+    async def get_gradebook_assignments(self, grade: Optional[int] = None) -> List[Dict]:
+        """Получить задания-столбцы журнала (для класса или все)"""
+        async with self.connect() as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute("""
+                SELECT id, title, grade_level, due_date FROM assignments
+                WHERE (? IS NULL OR grade_level = ? OR grade_level = 0) AND archived_date IS NULL
+                ORDER BY created_date ASC, id ASC
+            """, (grade, grade))
+            rows = await cursor.fetchall()
+            return [dict(row) for row in rows]
+
+    async def iter_gradebook_rows(self, grade: Optional[int] = None,
+                                  chunk_size: int = 500) -> AsyncIterator[List[tuple]]:
+        """Потоково выбрать оценки учеников порциями по chunk_size строк.
+
+        Строки упорядочены по ученику, поэтому журнал можно собирать
+        построчно, не загружая всю выборку в память.
+        Формат строки: (telegram_id, first_name, last_name, grade,
+        assignment_id, score, max_score); для учеников без решений
+        assignment_id равен None. Если решений одного задания несколько,
+        последней идет строка, которая должна попасть в журнал: последнее
+        оцененное решение, а без оценок - последнее отправленное.
+        """
+        async with self.connect() as db:
+            cursor = await db.execute("""
+                SELECT u.telegram_id, u.first_name, u.last_name, u.grade,
+                       r.assignment_id, r.score, r.max_score
+                FROM users u
+                LEFT JOIN (results r JOIN assignments a ON r.assignment_id = a.id)
+                    ON r.user_id = u.telegram_id
+                    AND (? IS NULL OR a.grade_level = ? OR a.grade_level = 0)
+                WHERE u.is_active = TRUE AND (? IS NULL OR u.grade = ?)
+                ORDER BY u.grade, u.telegram_id, r.assignment_id,
+                         r.score IS NOT NULL, r.completed_date, r.id
+            """, (grade, grade, grade, grade))
+            try:
+                while True:
+                    rows = await cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+            finally:
+                await cursor.close()
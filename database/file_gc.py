@@ -0,0 +1,97 @@
+# database/file_gc.py
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+from database.db_handler import DatabaseHandler
+from database.maintenance import DATETIME_FORMAT
+from utils.metrics import metrics
+
+BATCH_SIZE = 500  # Файлов за одну порцию удаления
+BATCH_PAUSE = 0.05  # Пауза между порциями: запись бота проходит без очереди
+
+metrics.gauge('file_gc_last_run_timestamp', 'Время последней сборки осиротевших файлов (unix)')
+metrics.gauge('file_gc_rows', 'Файлов удалено последней сборкой')
+metrics.gauge('file_gc_bytes', 'Размер файлов, удаленных последней сборкой')
+
+
+class FileCollector:
+    """Сборка осиротевших файлов.
+
+    Строка в files появляется, как только файл пришел боту, а привязка -
+    лишь в конце диалога (создание задания, решение, оценка). Брошенные
+    диалоги и delete_file_attachment оставляют строки без привязок; они
+    удаляются порциями по batch_size, если загружены больше grace_hours
+    часов назад и не числятся в незавершенных диалогах (in_use).
+    Сами файлы хранятся в Telegram и локально не кэшируются, поэтому
+    освобождаются только строки базы.
+    """
+
+    def __init__(self):
+        self.db = DatabaseHandler()
+        self.grace_hours = 48.0
+        self.batch_size = BATCH_SIZE
+        self.in_use: Optional[Callable[[], Awaitable[Set[int]]]] = None
+        self._lock = asyncio.Lock()
+        self._abort = False
+
+    def configure(self, db_path: str, grace_hours: float = 48.0, batch_size: int = BATCH_SIZE,
+                  in_use: Optional[Callable[[], Awaitable[Set[int]]]] = None):
+        self.db = DatabaseHandler(db_path)
+        self.grace_hours = grace_hours
+        self.batch_size = batch_size
+        self.in_use = in_use
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def abort(self):
+        """Остановить сборку после текущей порции (при остановке бота)"""
+        self._abort = True
+
+    async def run(self) -> Dict:
+        """Удалить осиротевшие файлы старше grace_hours; вернуть итоги"""
+        async with self._lock:
+            self._abort = False
+            started_at = datetime.now()
+            started = time.perf_counter()
+            keep = await self.in_use() if self.in_use else set()
+            totals = {'rows': 0, 'bytes': 0, 'kept': 0}
+            max_step = 0.0
+            after_id = 0
+            while not self._abort:
+                orphans = await self.db.get_orphan_files(self.grace_hours, after_id, self.batch_size)
+                if not orphans:
+                    break
+                after_id = orphans[-1]['id']
+                file_ids = [orphan['id'] for orphan in orphans if orphan['id'] not in keep]
+                totals['kept'] += len(orphans) - len(file_ids)
+
+                step_started = time.perf_counter()
+                deleted = await self.db.delete_orphan_files(file_ids)
+                max_step = max(max_step, time.perf_counter() - step_started)
+                totals['rows'] += deleted['rows']
+                totals['bytes'] += deleted['bytes']
+                await asyncio.sleep(BATCH_PAUSE)
+            if self._abort:
+                logging.warning("Сборка осиротевших файлов прервана остановкой бота")
+            totals['seconds'] = time.perf_counter() - started
+
+            await self.db.add_maintenance_log('file_gc', None, started_at.strftime(DATETIME_FORMAT),
+                                              totals['seconds'], max_step * 1000, totals['rows'])
+
+        metrics.set('file_gc_last_run_timestamp', time.time())
+        metrics.set('file_gc_rows', totals['rows'])
+        metrics.set('file_gc_bytes', totals['bytes'])
+        if totals['rows']:
+            logging.info(
+                f"Сборка файлов: удалено {totals['rows']} ({totals['bytes'] // 1024} КБ), "
+                f"в незавершенных диалогах {totals['kept']}, за {totals['seconds']:.1f} с"
+            )
+        return totals
+
+
+file_gc = FileCollector()
@@ -0,0 +1,79 @@
+# database/fsm_storage.py
+import json
+from typing import Any, Dict, List, Optional
+
+import aiosqlite
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище FSM в таблице fsm_states.
+
+    В отличие от MemoryStorage переживает перезапуск и доступно всем
+    процессам бота, поэтому используется в многопроцессном режиме.
+    Таблица создается в DatabaseHandler.init_db().
+    """
+
+    def __init__(self, db_path: str = "tutor_bot.db"):
+        self.db_path = db_path
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+    @staticmethod
+    async def _drop_if_empty(db: aiosqlite.Connection, storage_key: str):
+        """Удалить запись после state.clear(), чтобы таблица не росла"""
+        await db.execute("""
+            DELETE FROM fsm_states
+            WHERE storage_key = ? AND state IS NULL AND (data IS NULL OR data = '{}')
+        """, (storage_key,))
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state_name = state.state if isinstance(state, State) else state
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute("""
+                INSERT INTO fsm_states (storage_key, state) VALUES (?, ?)
+                ON CONFLICT(storage_key) DO UPDATE SET state = excluded.state
+            """, (self._key(key), state_name))
+            await self._drop_if_empty(db, self._key(key))
+            await db.commit()
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute("SELECT state FROM fsm_states WHERE storage_key = ?", (self._key(key),))
+            row = await cursor.fetchone()
+            return row[0] if row else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute("""
+                INSERT INTO fsm_states (storage_key, data) VALUES (?, ?)
+                ON CONFLICT(storage_key) DO UPDATE SET data = excluded.data
+            """, (self._key(key), json.dumps(data, ensure_ascii=False)))
+            await self._drop_if_empty(db, self._key(key))
+            await db.commit()
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute("SELECT data FROM fsm_states WHERE storage_key = ?", (self._key(key),))
+            row = await cursor.fetchone()
+            return json.loads(row[0]) if row and row[0] else {}
+
+    async def count_states(self) -> Dict[str, int]:
+        """Количество пользователей в каждом состоянии"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute("""
+                SELECT state, COUNT(*) FROM fsm_states WHERE state IS NOT NULL GROUP BY state
+            """)
+            return {state: count for state, count in await cursor.fetchall()}
+
+    async def all_data(self) -> List[Dict[str, Any]]:
+        """Данные всех незавершенных диалогов"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute("SELECT data FROM fsm_states WHERE data IS NOT NULL AND data != '{}'")
+            return [json.loads(row[0]) for row in await cursor.fetchall()]
+
+    async def close(self) -> None:
+        pass
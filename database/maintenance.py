@@ -0,0 +1,297 @@
+# database/maintenance.py
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, time as dt_time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import aiosqlite
+
+from database.db_handler import DatabaseHandler
+from utils.metrics import metrics
+
+ANALYSIS_LIMIT = 1000  # Строк индекса на ANALYZE таблицы (PRAGMA analysis_limit)
+ANALYZE_MIN_ROWS = 1000  # Изменение числа строк, после которого статистика таблицы устарела...
+ANALYZE_MIN_RATIO = 0.1  # ...если оно больше и этой доли таблицы
+VACUUM_MIN_PAGES = 256  # Свободных страниц, ради которых стоит запускать incremental_vacuum
+VACUUM_START_PAGES = 64  # Страниц за первый шаг; дальше шаг подстраивается под LOCK_MS
+VACUUM_MAX_PAGES = 4096
+STEP_PAUSE = 0.05  # Пауза между шагами: запись бота проходит без очереди
+BUSY_PAUSE = 1  # Пауза, пока бот обрабатывает обновления
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+metrics.gauge('db_maintenance_seconds', 'Длительность последней операции обслуживания базы')
+metrics.gauge('db_maintenance_max_step_seconds', 'Самый долгий шаг (удержание блокировки) последней операции')
+metrics.gauge('db_maintenance_last_timestamp', 'Время последней операции обслуживания (unix)')
+metrics.gauge('db_freelist_bytes', 'Свободное место внутри файла базы')
+metrics.gauge('db_wal_bytes', 'Размер файла WAL')
+
+
+def parse_quiet_hours(value: str) -> Optional[Tuple[dt_time, dt_time]]:
+    """'02:00-05:00' -> (начало, конец); окно может переходить через полночь. Пусто - None"""
+    if not value:
+        return None
+    start, end = (datetime.strptime(part.strip(), "%H:%M").time() for part in value.split("-"))
+    return start, end
+
+
+class DatabaseMaintenance:
+    """Обслуживание базы в фоне: ANALYZE, incremental_vacuum и сброс WAL.
+
+    Каждые interval секунд проверяется, насколько изменилось число строк
+    таблиц с их последнего ANALYZE, и устаревшая статистика обновляется
+    (ANALYZE по таблице, затем PRAGMA optimize, с PRAGMA analysis_limit). WAL больше wal_limit
+    переносится в базу. В тихие часы свободные страницы возвращаются
+    файловой системе шагами incremental_vacuum.
+
+    Каждая операция - короткие транзакции: шаг vacuum подстраивается так,
+    чтобы блокировка записи держалась не дольше lock_ms, между шагами
+    бот пишет без ожидания. Длительность операций пишется в maintenance_log
+    и в метрики.
+    """
+
+    def __init__(self):
+        self.db_path = "tutor_bot.db"
+        self.db = DatabaseHandler(self.db_path)
+        self.interval = 600.0
+        self.quiet_hours: Optional[Tuple[dt_time, dt_time]] = None
+        self.lock_ms = 50.0
+        self.wal_limit = 16 * 1024 * 1024
+        self._busy: Callable[[], int] = lambda: 0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+
+    def configure(self, db_path: str, interval: float = 600, quiet_hours: str = "",
+                  lock_ms: float = 50, wal_limit_mb: float = 16, busy: Optional[Callable[[], int]] = None):
+        """busy - число обновлений в обработке: пока оно не 0, vacuum ждет"""
+        self.db_path = db_path
+        self.db = DatabaseHandler(db_path)
+        self.interval = interval
+        self.quiet_hours = parse_quiet_hours(quiet_hours)
+        self.lock_ms = lock_ms
+        self.wal_limit = int(wal_limit_mb * 1024 * 1024)
+        if busy is not None:
+            self._busy = busy
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def in_quiet_hours(self, now: Optional[datetime] = None) -> bool:
+        if self.quiet_hours is None:
+            return False
+        start, end = self.quiet_hours
+        current = (now or datetime.now()).time()
+        return start <= current < end if start <= end else current >= start or current < end
+
+    def start(self):
+        if self.interval > 0 and self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: Optional[float] = None):
+        """Остановить цикл; идущая операция прерывается на границе шага"""
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            try:
+                await asyncio.wait_for(self._task, timeout=timeout)
+            except asyncio.TimeoutError:
+                logging.warning("Остановка: обслуживание базы не завершилось вовремя")
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await self.run(vacuum=self.in_quiet_hours())
+            except Exception as e:
+                logging.error(f"Ошибка обслуживания базы: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self, vacuum: bool = False, force: bool = False) -> Dict:
+        """Один проход: ANALYZE устаревших таблиц, при vacuum - incremental_vacuum, сброс большого WAL.
+
+        force (команда администратора) - WAL сбрасывается любого размера,
+        vacuum идет до конца независимо от тихих часов.
+        """
+        async with self._lock:
+            async with aiosqlite.connect(self.db_path, isolation_level=None) as conn:
+                report = {'analyzed': await self._analyze(conn)}
+                report['vacuumed_pages'] = await self._vacuum(conn, until_done=force) if vacuum or force else 0
+                # После vacuum: перенесенные страницы тоже попадают в WAL
+                report['checkpointed_bytes'] = await self._checkpoint(conn, 1 if force else self.wal_limit)
+                report.update(await self.status(conn))
+        return report
+
+    async def status(self, conn: Optional[aiosqlite.Connection] = None) -> Dict:
+        """Размер базы, свободное место и WAL"""
+        if conn is None:
+            async with aiosqlite.connect(self.db_path) as conn:
+                return await self.status(conn)
+        page_size = await self._pragma(conn, "page_size")
+        info = {
+            'db_bytes': await self._pragma(conn, "page_count") * page_size,
+            'freelist_bytes': await self._pragma(conn, "freelist_count") * page_size,
+            'wal_bytes': self._wal_size(),
+            'incremental_vacuum': await self._pragma(conn, "auto_vacuum") == 2
+        }
+        metrics.set('db_freelist_bytes', info['freelist_bytes'])
+        metrics.set('db_wal_bytes', info['wal_bytes'])
+        return info
+
+    @staticmethod
+    async def _pragma(conn: aiosqlite.Connection, name: str) -> int:
+        cursor = await conn.execute(f"PRAGMA {name}")
+        return (await cursor.fetchone())[0]
+
+    def _wal_size(self) -> int:
+        wal_path = self.db_path + "-wal"
+        return os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+
+    async def _record(self, operation: str, object_name: Optional[str], started: datetime,
+                      seconds: float, max_step: float, amount: int):
+        await self.db.add_maintenance_log(operation, object_name, started.strftime(DATETIME_FORMAT),
+                                          seconds, max_step * 1000, amount)
+        labels = {'operation': operation}
+        metrics.set('db_maintenance_seconds', seconds, **labels)
+        metrics.set('db_maintenance_max_step_seconds', max_step, **labels)
+        metrics.set('db_maintenance_last_timestamp', time.time(), **labels)
+        if max_step * 1000 > self.lock_ms:
+            target = f"{operation} {object_name}" if object_name else operation
+            logging.warning(f"Обслуживание базы: {target} держал блокировку "
+                            f"{max_step * 1000:.0f} мс (лимит {self.lock_ms:.0f} мс)")
+
+    async def stale_tables(self, conn: aiosqlite.Connection) -> List[Tuple[str, int]]:
+        """Таблицы, число строк которых ушло от значения при последнем ANALYZE: (таблица, строк сейчас)"""
+        analyzed = await self.db.get_analyzed_row_counts()
+        # Служебные таблицы FTS5 (<таблица>_fts_data и т.п.) планировщик запросов не использует
+        cursor = await conn.execute("""
+            SELECT name FROM sqlite_master
+            WHERE type = 'table' AND name NOT LIKE 'sqlite_%' AND sql NOT LIKE 'CREATE VIRTUAL%'
+              AND name NOT LIKE '%!_fts!_%' ESCAPE '!'
+        """)
+        stale = []
+        for (table,) in await cursor.fetchall():
+            count_cursor = await conn.execute(f'SELECT COUNT(*) FROM "{table}"')
+            rows = (await count_cursor.fetchone())[0]
+            baseline = analyzed.get(table, 0)
+            if abs(rows - baseline) >= max(ANALYZE_MIN_ROWS, baseline * ANALYZE_MIN_RATIO):
+                stale.append((table, rows))
+        return stale
+
+    async def _analyze(self, conn: aiosqlite.Connection) -> List[str]:
+        """ANALYZE таблиц с устаревшей статистикой, по одной на транзакцию, затем PRAGMA optimize.
+
+        PRAGMA optimize решает, что анализировать, только по таблицам, которые
+        читало само соединение; у бота соединения короткие, поэтому основной
+        отбор - по числу строк относительно maintenance_log. optimize после
+        него добирает то, что число строк не показывает (например, индексы без
+        статистики), с тем же analysis_limit.
+        """
+        await conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+        analyzed = []
+        for table, rows in await self.stale_tables(conn):
+            if self._stopping:
+                break
+            started_at = datetime.now()
+            started = time.perf_counter()
+            await conn.execute(f'ANALYZE "{table}"')
+            elapsed = time.perf_counter() - started
+            await self._record('analyze', table, started_at, elapsed, elapsed, rows)
+            analyzed.append(table)
+            await asyncio.sleep(STEP_PAUSE)
+        if analyzed:
+            logging.info(f"Обслуживание базы: обновлена статистика таблиц {', '.join(analyzed)}")
+
+        if not self._stopping:
+            started_at = datetime.now()
+            started = time.perf_counter()
+            await conn.execute("PRAGMA optimize")
+            elapsed = time.perf_counter() - started
+            await self._record('optimize', None, started_at, elapsed, elapsed, 0)
+        return analyzed
+
+    async def _checkpoint(self, conn: aiosqlite.Connection, limit: int) -> int:
+        """Перенести WAL не меньше limit байт в базу; вернуть его размер до сброса (0 - не требовалось).
+
+        PASSIVE не ждет ни читателей, ни писателей. Обрезка файла (TRUNCATE)
+        после полного переноса почти мгновенна; если база занята дольше
+        lock_ms, обрезка откладывается до следующего прохода.
+        """
+        wal_size = self._wal_size()
+        if wal_size < limit:
+            return 0
+        started_at = datetime.now()
+        started = time.perf_counter()
+        cursor = await conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        busy, log_frames, checkpointed = await cursor.fetchone()
+        passive = time.perf_counter() - started
+        truncate = 0.0
+        if not busy and log_frames == checkpointed:
+            await conn.execute(f"PRAGMA busy_timeout = {int(self.lock_ms)}")
+            step = time.perf_counter()
+            await conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            truncate = time.perf_counter() - step
+            await conn.execute("PRAGMA busy_timeout = 5000")
+        # PASSIVE блокировку записи не берет: шагом считается только обрезка
+        await self._record('checkpoint', None, started_at, passive + truncate, truncate, wal_size)
+        logging.info(f"Обслуживание базы: WAL {wal_size // 1024} КБ перенесен в базу "
+                     f"за {(passive + truncate) * 1000:.0f} мс")
+        return wal_size
+
+    async def _vacuum(self, conn: aiosqlite.Connection, until_done: bool = False) -> int:
+        """Вернуть свободные страницы шагами incremental_vacuum; вернуть число освобожденных.
+
+        Размер шага подбирается по скорости предыдущего так, чтобы шаг
+        занимал около половины lock_ms. Между шагами - пауза; пока бот
+        обрабатывает обновления, шаги не делаются. Без until_done проход
+        заканчивается вместе с тихими часами.
+        """
+        if await self._pragma(conn, "auto_vacuum") != 2:
+            return 0
+        free = await self._pragma(conn, "freelist_count")
+        if free < VACUUM_MIN_PAGES:
+            return 0
+
+        started_at = datetime.now()
+        started = time.perf_counter()
+        pages = VACUUM_START_PAGES
+        max_step = 0.0
+        freed = 0
+        while free > 0 and not self._stopping:
+            if not until_done and not self.in_quiet_hours():
+                break
+            if self._busy():
+                await asyncio.sleep(BUSY_PAUSE)
+                continue
+            step = time.perf_counter()
+            # executescript выполняет PRAGMA до конца; execute освободил бы одну страницу
+            await conn.executescript(f"PRAGMA incremental_vacuum({pages})")
+            elapsed = time.perf_counter() - step
+            max_step = max(max_step, elapsed)
+
+            left = await self._pragma(conn, "freelist_count")
+            freed += free - left
+            free = left
+            # Следующий шаг - на половину лимита по скорости этого, рост не больше чем вдвое
+            target = pages * self.lock_ms / 2 / max(elapsed * 1000, 0.1)
+            pages = max(1, min(VACUUM_MAX_PAGES, pages * 2, int(target)))
+            await asyncio.sleep(STEP_PAUSE)
+
+        elapsed = time.perf_counter() - started
+        await self._record('vacuum', None, started_at, elapsed, max_step, freed)
+        page_size = await self._pragma(conn, "page_size")
+        logging.info(f"Обслуживание базы: освобождено {freed * page_size // 1024} КБ за {elapsed:.1f} с, "
+                     f"самый долгий шаг {max_step * 1000:.0f} мс")
+        return freed
+
+
+maintenance = DatabaseMaintenance()
@@ -0,0 +1,189 @@
+# database/tracing.py
+import logging
+import re
+import sqlite3
+import time
+from typing import Optional, List, Dict
+
+import aiosqlite
+from aiosqlite.context import contextmanager
+
+SLOW_QUERY_MS = 100  # Порог записи в журнал медленных запросов
+MAX_SHAPES = 500  # Ограничение на число различных запросов в статистике
+
+# Запросы, для которых имеет смысл EXPLAIN QUERY PLAN
+PLANNABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+
+_WHITESPACE = re.compile(r"\s+")
+_PLACEHOLDER_LIST = re.compile(r"\?(\s*,\s*\?)+")
+
+
+class QueryStats:
+    """Накопленная статистика одного запроса (формы запроса)"""
+    __slots__ = ('shape', 'calls', 'total', 'max', 'slow', 'plan')
+
+    def __init__(self, shape: str):
+        self.shape = shape
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.slow = 0
+        self.plan: Optional[List[str]] = None
+
+
+class QueryTracer:
+    """Трассировка SQL-запросов DatabaseHandler (включается DB_TRACE=1).
+
+    Замеряет выполнение и выборку строк каждого запроса, копит статистику
+    по форме запроса (SQL без лишних пробелов, списки ? свернуты) и пишет
+    в журнал запросы дольше порога вместе с планом, который снимается
+    один раз на форму.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.slow_threshold = SLOW_QUERY_MS / 1000
+        self._stats: Dict[str, QueryStats] = {}
+
+    def configure(self, enabled: bool, slow_ms: float = SLOW_QUERY_MS):
+        self.enabled = enabled
+        self.slow_threshold = slow_ms / 1000
+
+    def connect(self, db_path: str) -> "TracedConnection":
+        """Аналог aiosqlite.connect() с трассировкой"""
+        return TracedConnection(lambda: sqlite3.connect(db_path), 64)
+
+    @staticmethod
+    def normalize(sql: str) -> str:
+        return _PLACEHOLDER_LIST.sub("?, ...", _WHITESPACE.sub(" ", sql).strip())
+
+    def stats_for(self, sql: str) -> Optional[QueryStats]:
+        shape = self.normalize(sql)
+        stats = self._stats.get(shape)
+        if stats is None and len(self._stats) < MAX_SHAPES:
+            stats = self._stats[shape] = QueryStats(shape)
+        return stats
+
+    def top(self, limit: int = 10) -> List[QueryStats]:
+        """Запросы с наибольшим суммарным временем"""
+        return sorted(self._stats.values(), key=lambda s: s.total, reverse=True)[:limit]
+
+    def reset(self):
+        self._stats = {}
+
+    def report(self, limit: int = 10, plan: bool = True) -> str:
+        """Текстовый отчет по самым затратным запросам"""
+        lines = []
+        for i, stats in enumerate(self.top(limit), 1):
+            avg = stats.total / stats.calls * 1000 if stats.calls else 0
+            lines.append(f"{i}. всего {stats.total * 1000:.0f} мс, вызовов {stats.calls}, "
+                         f"сред. {avg:.1f} мс, макс. {stats.max * 1000:.1f} мс, медленных {stats.slow}")
+            lines.append(f"   {stats.shape[:300]}")
+            if plan and stats.plan:
+                lines.extend(f"   | {row}" for row in stats.plan)
+        return "\n".join(lines)
+
+
+query_tracer = QueryTracer()
+
+
+def _format_plan(rows) -> List[str]:
+    """Строки EXPLAIN QUERY PLAN (id, parent, -, detail) с отступами по вложенности"""
+    depth = {0: -1}
+    lines = []
+    for row in rows:
+        node_id, parent, detail = row[0], row[1], row[3]
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node_id] + detail)
+    return lines
+
+
+class TracedCursor:
+    """Курсор, добавляющий время выборки строк к статистике запроса"""
+
+    def __init__(self, cursor: aiosqlite.Cursor, stats: Optional[QueryStats], elapsed: float):
+        self._cursor = cursor
+        self._stats = stats
+        self._elapsed = 0.0
+        self._logged = False
+        self._account(elapsed)
+
+    def _account(self, elapsed: float):
+        self._elapsed += elapsed
+        if self._stats is None:
+            return
+        self._stats.total += elapsed
+        self._stats.max = max(self._stats.max, self._elapsed)
+        # В журнал попадают только запросы к данным (DDL и PRAGMA без плана)
+        if not self._logged and self._stats.plan is not None and self._elapsed >= query_tracer.slow_threshold:
+            self._logged = True
+            self._stats.slow += 1
+            plan = "\n".join(self._stats.plan)
+            logging.warning(f"Медленный запрос ({self._elapsed * 1000:.1f} мс): "
+                            f"{self._stats.shape[:500]}\n{plan}")
+
+    async def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return await self._cursor.fetchone()
+        finally:
+            self._account(time.perf_counter() - started)
+
+    async def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return await self._cursor.fetchall()
+        finally:
+            self._account(time.perf_counter() - started)
+
+    async def fetchmany(self, size: Optional[int] = None):
+        started = time.perf_counter()
+        try:
+            return await self._cursor.fetchmany(size)
+        finally:
+            self._account(time.perf_counter() - started)
+
+    def __aiter__(self):
+        return self._cursor.__aiter__()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self._cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class TracedConnection(aiosqlite.Connection):
+    """Соединение aiosqlite с замером каждого запроса"""
+
+    @contextmanager
+    async def execute(self, sql: str, parameters=None) -> TracedCursor:
+        stats = query_tracer.stats_for(sql)
+        if stats is not None and stats.plan is None and sql.lstrip().upper().startswith(PLANNABLE):
+            # План снимается до выполнения: после INSERT/DELETE данные уже другие
+            stats.plan = await self._explain(sql, parameters)
+
+        started = time.perf_counter()
+        cursor = await super().execute(sql, parameters)
+        if stats is not None:
+            stats.calls += 1
+        return TracedCursor(cursor, stats, time.perf_counter() - started)
+
+    @contextmanager
+    async def executemany(self, sql: str, parameters) -> TracedCursor:
+        stats = query_tracer.stats_for(sql)
+        started = time.perf_counter()
+        cursor = await super().executemany(sql, parameters)
+        if stats is not None:
+            stats.calls += 1
+        return TracedCursor(cursor, stats, time.perf_counter() - started)
+
+    async def _explain(self, sql: str, parameters) -> List[str]:
+        try:
+            cursor = await super().execute(f"EXPLAIN QUERY PLAN {sql}", parameters)
+            return _format_plan(await cursor.fetchall())
+        except sqlite3.Error as e:
+            return [f"(план недоступен: {e})"]
@@ -2,16 +2,21 @@
 from aiogram import types, F
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
-from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, CallbackQuery
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, CallbackQuery, BufferedInputFile
 from datetime import datetime, timedelta
-import aiosqlite
+import logging
+import os
 
 from database.db_handler import DatabaseHandler
 from states.registration import AssignmentStates, SolutionStates, GradingStates, FileStates
-from utils.file_utils import FileProcessor
+from utils.file_utils import FileProcessor, QuotaError
+from utils.chart_utils import get_trend_chart
+from utils.scheduler import scheduler
 
 db = DatabaseHandler()
 
+ARCHIVE_PAGE_SIZE = 30  # Сколько архивных решений показывать в /archive
+
 
 # === КОМАНДЫ ДЛЯ АДМИНИСТРАТОРА ===
 
@@ -95,14 +100,39 @@ async def process_due_date(message: types.Message, state: FSMContext):
 
     if message.text.lower() not in ['нет', 'no', 'skip', '-']:
         try:
-            # Парсим дату
+            # Парсим дату; срок сдачи - до конца указанного дня
             date_str = message.text.strip()
-            due_date = datetime.strptime(date_str, "%d.%m.%Y").strftime("%Y-%m-%d %H:%M:%S")
+            due_date = datetime.strptime(date_str, "%d.%m.%Y").strftime("%Y-%m-%d 23:59:00")
         except ValueError:
             await message.answer("❌ Неверный формат даты. Попробуйте ДД.ММ.ГГГГ или напишите 'нет':")
             return
 
     await state.update_data(due_date=due_date)
+    await message.answer(
+        "📢 Когда опубликовать задание?\n\n"
+        "Введите дату и время в формате ДД.ММ.ГГГГ ЧЧ:ММ\n"
+        "или напишите 'сейчас' чтобы опубликовать сразу:"
+    )
+    await state.set_state(AssignmentStates.waiting_for_publish_date)
+
+
+async def process_publish_date(message: types.Message, state: FSMContext):
+    publish_date = None
+
+    if message.text.lower() not in ['сейчас', 'now', 'нет', 'no', '-']:
+        try:
+            publish_at = datetime.strptime(message.text.strip(), "%d.%m.%Y %H:%M")
+        except ValueError:
+            await message.answer("❌ Неверный формат. Попробуйте ДД.ММ.ГГГГ ЧЧ:ММ или напишите 'сейчас':")
+            return
+
+        if publish_at <= datetime.now():
+            await message.answer("❌ Время публикации уже прошло. Укажите будущее время или напишите 'сейчас':")
+            return
+
+        publish_date = publish_at.strftime("%Y-%m-%d %H:%M:%S")
+
+    await state.update_data(publish_date=publish_date)
 
     # НОВОЕ: Предлагаем добавить файлы
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -138,7 +168,7 @@ async def handle_add_assignment_files(callback: CallbackQuery, state: FSMContext
 
 async def handle_create_assignment_without_files(callback: CallbackQuery, state: FSMContext):
     """Создать задание без файлов"""
-    await create_assignment_final(callback.message, state, [])
+    return await create_assignment_final(callback.message, state, [], callback.from_user.id)
 
 
 async def process_assignment_files(message: types.Message, state: FSMContext):
@@ -147,11 +177,15 @@ async def process_assignment_files(message: types.Message, state: FSMContext):
         # Завершаем добавление файлов
         data = await state.get_data()
         assignment_files = data.get('assignment_files', [])
-        await create_assignment_final(message, state, assignment_files)
-        return
+        return await create_assignment_final(message, state, assignment_files)
 
-    # Обрабатываем файлы
-    files_data = await FileProcessor.process_message_files(message)
+    # Обрабатываем файлы (квоты считаются с уже собранными файлами)
+    data = await state.get_data()
+    try:
+        files_data = await FileProcessor.process_message_files(message, data.get('assignment_files', []))
+    except QuotaError as e:
+        await message.answer(f"{e}\n\nНажмите /done, чтобы продолжить с уже добавленными файлами.")
+        return
 
     if not files_data:
         await message.answer(
@@ -162,7 +196,6 @@ async def process_assignment_files(message: types.Message, state: FSMContext):
         return
 
     # Добавляем файлы к списку
-    data = await state.get_data()
     assignment_files = data.get('assignment_files', [])
     assignment_files.extend(files_data)
     await state.update_data(assignment_files=assignment_files)
@@ -178,7 +211,8 @@ async def process_assignment_files(message: types.Message, state: FSMContext):
     )
 
 
-async def create_assignment_final(message: types.Message, state: FSMContext, files_data: list):
+async def create_assignment_final(message: types.Message, state: FSMContext, files_data: list,
+                                  created_by: int = None):
     """Финальное создание задания с файлами"""
     data = await state.get_data()
 
@@ -188,8 +222,9 @@ async def create_assignment_final(message: types.Message, state: FSMContext, fil
         description=data['description'],
         grade_level=data['grade_level'],
         difficulty=data['difficulty'],
-        created_by=message.from_user.id,
-        due_date=data.get('due_date')
+        created_by=created_by or message.from_user.id,
+        due_date=data.get('due_date'),
+        publish_date=data.get('publish_date')
     )
 
     # Привязываем файлы к заданию
@@ -197,18 +232,27 @@ async def create_assignment_final(message: types.Message, state: FSMContext, fil
         file_db_ids = [f['db_id'] for f in files_data]
         await FileProcessor.attach_files_to_object(file_db_ids, 'assignment', assignment_id)
 
+    # Планируем отложенную публикацию и напоминания о сроке сдачи
+    await scheduler.schedule_assignment(assignment_id, data.get('due_date'), data.get('publish_date'))
+
     grade_text = f"класс {data['grade_level']}" if data['grade_level'] > 0 else "все классы"
     due_text = f"\n📅 Срок: {data['due_date'][:10]}" if data.get('due_date') else ""
+    publish_text = f"\n📢 Публикация: {data['publish_date'][:16]}" if data.get('publish_date') else ""
     files_text = f"\n📎 Файлов: {len(files_data)}" if files_data else ""
 
     await message.answer(
         f"✅ Задание создано!\n\n"
         f"📝 Название: {data['title']}\n"
         f"🎓 Для: {grade_text}\n"
-        f"⚡ Сложность: {data['difficulty']}{due_text}{files_text}\n\n"
+        f"⚡ Сложность: {data['difficulty']}{due_text}{publish_text}{files_text}\n\n"
         f"ID задания: {assignment_id}"
     )
 
+    # Отложенное задание: ученики получат уведомление при публикации
+    if data.get('publish_date'):
+        await state.clear()
+        return None
+
     # Уведомляем учеников о новом задании
     from handlers.assignments import notify_students_new_assignment
     notification_data = await notify_students_new_assignment(assignment_id, data)
@@ -232,6 +276,11 @@ async def show_all_assignments(message: types.Message):
     text = "📚 Все задания:\n\n"
     for assignment in assignments:
         status = "✅ Активно" if assignment['is_active'] else "❌ Неактивно"
+        if assignment['archived_date']:
+            status = "📦 В архиве"
+        if assignment['is_active'] and assignment['publish_date'] and \
+                assignment['publish_date'] > datetime.now().strftime("%Y-%m-%d %H:%M:%S"):
+            status = f"⏳ Публикация {assignment['publish_date'][:16]}"
         grade_text = f"класс {assignment['grade_level']}" if assignment['grade_level'] > 0 else "все классы"
         due_text = f" (до {assignment['due_date'][:10]})" if assignment['due_date'] else ""
 
@@ -319,6 +368,10 @@ async def show_assignment_detail(message: types.Message):
 
     # Проверяем доступ для ученика
     if not await db.is_admin(user_id):
+        if assignment['publish_date'] and assignment['publish_date'] > datetime.now().strftime("%Y-%m-%d %H:%M:%S"):
+            await message.answer("❌ Задание не найдено.")
+            return
+
         user_data = await db.get_user(user_id)
         if assignment['grade_level'] != 0 and assignment['grade_level'] != user_data['grade']:
             await message.answer("❌ Это задание не для вашего класса.")
@@ -426,7 +479,7 @@ async def handle_add_solution_files(callback: CallbackQuery, state: FSMContext):
 
 async def handle_submit_solution_without_files(callback: CallbackQuery, state: FSMContext):
     """Отправить решение без файлов"""
-    await submit_solution_final(callback.message, state, [])
+    return await submit_solution_final(callback.message, state, [], callback.from_user.id)
 
 
 async def process_solution_files(message: types.Message, state: FSMContext):
@@ -435,11 +488,15 @@ async def process_solution_files(message: types.Message, state: FSMContext):
         # Завершаем добавление файлов
         data = await state.get_data()
         solution_files = data.get('solution_files', [])
-        await submit_solution_final(message, state, solution_files)
-        return
+        return await submit_solution_final(message, state, solution_files)
 
-    # Обрабатываем файлы
-    files_data = await FileProcessor.process_message_files(message)
+    # Обрабатываем файлы (квоты считаются с уже собранными файлами)
+    data = await state.get_data()
+    try:
+        files_data = await FileProcessor.process_message_files(message, data.get('solution_files', []))
+    except QuotaError as e:
+        await message.answer(f"{e}\n\nНажмите /done, чтобы продолжить с уже добавленными файлами.")
+        return
 
     if not files_data:
         await message.answer(
@@ -449,7 +506,6 @@ async def process_solution_files(message: types.Message, state: FSMContext):
         return
 
     # Добавляем файлы к списку
-    data = await state.get_data()
     solution_files = data.get('solution_files', [])
     solution_files.extend(files_data)
     await state.update_data(solution_files=solution_files)
@@ -465,13 +521,14 @@ async def process_solution_files(message: types.Message, state: FSMContext):
     )
 
 
-async def submit_solution_final(message: types.Message, state: FSMContext, files_data: list):
+async def submit_solution_final(message: types.Message, state: FSMContext, files_data: list,
+                                user_id: int = None):
     """Финальная отправка решения с файлами"""
     data = await state.get_data()
     assignment_id = data['assignment_id']
-    user_id = message.from_user.id
+    user_id = user_id or message.from_user.id
 
-    result_id = await db.submit_solution(user_id, assignment_id, data['solution_text'])
+    result_id, is_first = await db.submit_solution(user_id, assignment_id, data['solution_text'])
 
     # Привязываем файлы к решению
     if files_data:
@@ -490,7 +547,7 @@ async def submit_solution_final(message: types.Message, state: FSMContext, files
 
     # Уведомляем админа о новом решении
     from handlers.assignments import notify_admin_new_solution
-    notification_data = await notify_admin_new_solution(user_id, assignment_id, result_id)
+    notification_data = await notify_admin_new_solution(user_id, assignment_id, result_id, is_first)
 
     await state.clear()
     return notification_data
@@ -637,7 +694,7 @@ async def handle_add_grade_files(callback: CallbackQuery, state: FSMContext):
 
 async def handle_submit_grade_without_files(callback: CallbackQuery, state: FSMContext):
     """Выставить оценку без файлов"""
-    await submit_grade_final(callback.message, state, [])
+    return await submit_grade_final(callback.message, state, [])
 
 
 async def process_grade_files(message: types.Message, state: FSMContext):
@@ -646,11 +703,15 @@ async def process_grade_files(message: types.Message, state: FSMContext):
         # Завершаем добавление файлов
         data = await state.get_data()
         grade_files = data.get('grade_files', [])
-        await submit_grade_final(message, state, grade_files)
-        return
+        return await submit_grade_final(message, state, grade_files)
 
-    # Обрабатываем файлы
-    files_data = await FileProcessor.process_message_files(message)
+    # Обрабатываем файлы (квоты считаются с уже собранными файлами)
+    data = await state.get_data()
+    try:
+        files_data = await FileProcessor.process_message_files(message, data.get('grade_files', []))
+    except QuotaError as e:
+        await message.answer(f"{e}\n\nНажмите /done, чтобы продолжить с уже добавленными файлами.")
+        return
 
     if not files_data:
         await message.answer(
@@ -660,7 +721,6 @@ async def process_grade_files(message: types.Message, state: FSMContext):
         return
 
     # Добавляем файлы к списку
-    data = await state.get_data()
     grade_files = data.get('grade_files', [])
     grade_files.extend(files_data)
     await state.update_data(grade_files=grade_files)
@@ -722,6 +782,11 @@ async def show_my_progress(message: types.Message):
         await message.answer("❌ Вы не зарегистрированы в системе.")
         return
 
+    args = message.text.split()[1:] if message.text else []
+    if args and args[0].lower() == 'trend':
+        await show_progress_trend(message, args[1].lower() if len(args) > 1 else 'week')
+        return
+
     solutions = await db.get_user_solutions(user_id)
     stats = await db.get_user_stats(user_id)
 
@@ -765,9 +830,75 @@ async def show_my_progress(message: types.Message):
     if len(solutions) > 5:
         text += f"\nИ еще {len(solutions) - 5} решений..."
 
+    text += "\n\n📈 Динамика: /progress trend [week|month]"
+    if os.path.exists(db.archive_path):
+        text += "\n📦 Решения прошлых лет: /archive"
+
+    await message.answer(text)
+
+
+async def show_my_archive(message: types.Message):
+    """Показать решения ученика, перенесенные в архив"""
+    user_id = message.from_user.id
+
+    if not await db.is_user_registered(user_id):
+        await message.answer("❌ Вы не зарегистрированы в системе.")
+        return
+
+    solutions = await db.get_user_solutions(user_id, archived=True) if os.path.exists(db.archive_path) else []
+    if not solutions:
+        await message.answer("📦 В архиве нет ваших решений.")
+        return
+
+    graded = [s for s in solutions if s['score'] is not None and s['max_score']]
+    avg_text = (f"{round(sum(s['score'] * 100 / s['max_score'] for s in graded) / len(graded), 1)}%"
+                if graded else "нет оценок")
+    text = (
+        f"📦 Архив решений\n\n"
+        f"📝 Решений: {len(solutions)}, средний балл: {avg_text}\n\n"
+    )
+    for solution in solutions[:ARCHIVE_PAGE_SIZE]:
+        status = "⏳ Не проверено" if solution['score'] is None else f"✅ {solution['score']}/{solution['max_score']}"
+        text += f"• {solution['completed_date'][:10]} {solution['title']} - {status} (/solution {solution['id']})\n"
+    if len(solutions) > ARCHIVE_PAGE_SIZE:
+        text += f"\nИ еще {len(solutions) - ARCHIVE_PAGE_SIZE} решений..."
+
     await message.answer(text)
 
 
+async def show_progress_trend(message: types.Message, period: str):
+    """Показать график прогресса по неделям или месяцам"""
+    if period not in ('week', 'month'):
+        await message.answer("❌ Используйте: /progress trend [week|month]")
+        return
+
+    buckets = await db.get_progress_buckets(message.from_user.id, period)
+    if not buckets:
+        await message.answer("📊 У вас пока нет отправленных решений.")
+        return
+
+    try:
+        png = await get_trend_chart(message.from_user.id, period, buckets)
+    except Exception as e:
+        logging.error(f"Ошибка при построении графика прогресса: {e}")
+        await message.answer("❌ Не удалось построить график. Попробуйте позже.")
+        return
+
+    period_name = "недели" if period == 'week' else "месяцы"
+    last = buckets[-1]
+    last_avg = f"{last['avg_percentage']}%" if last['avg_percentage'] is not None else "нет оценок"
+    caption = (
+        f"📈 Прогресс за последние {period_name}\n\n"
+        f"Текущий период: {last['solutions_count']} решений, "
+        f"проверено {last['graded_count']}, средний балл {last_avg}"
+    )
+
+    await message.answer_photo(
+        BufferedInputFile(png, filename=f"progress_{period}.png"),
+        caption=caption
+    )
+
+
 async def show_solution_details(message: types.Message):
     """Показать детали конкретного решения"""
     user_id = message.from_user.id
@@ -783,9 +914,14 @@ async def show_solution_details(message: types.Message):
         await message.answer("❌ Используйте: /solution <ID решения>")
         return
 
-    # Получаем решения пользователя
+    # Получаем решения пользователя; не найденное в основной базе ищется в архиве
     solutions = await db.get_user_solutions(user_id)
     solution = next((s for s in solutions if s['id'] == solution_id), None)
+    archived = False
+    if not solution and os.path.exists(db.archive_path):
+        solutions = await db.get_user_solutions(user_id, archived=True)
+        solution = next((s for s in solutions if s['id'] == solution_id), None)
+        archived = solution is not None
 
     if not solution:
         await message.answer("❌ Решение не найдено или не принадлежит вам.")
@@ -795,7 +931,7 @@ async def show_solution_details(message: types.Message):
                                     'score'] is None else f"✅ {solution['score']}/{solution['max_score']} ({round((solution['score'] / solution['max_score']) * 100, 1)}%)"
 
     text = (
-        f"📝 {solution['title']}\n\n"
+        f"📝 {solution['title']}{' 📦' if archived else ''}\n\n"
         f"📊 Статус: {status}\n"
         f"📅 Отправлено: {solution['completed_date'][:16]}\n\n"
         f"📄 Ваше решение:\n{solution['solution_text']}"
@@ -807,14 +943,14 @@ async def show_solution_details(message: types.Message):
     await message.answer(text)
 
     # Показываем файлы решения
-    solution_files = await db.get_object_files('solution', solution_id)
+    solution_files = await db.get_object_files('solution', solution_id, archived=archived)
     if solution_files:
         await message.answer(f"📎 Ваши файлы к решению:")
         await send_files_to_user(message, solution_files, "")
 
     # Показываем файлы оценки (если есть)
     if solution['score'] is not None:
-        grade_files = await db.get_object_files('grade', solution_id)
+        grade_files = await db.get_object_files('grade', solution_id, archived=archived)
         if grade_files:
             await message.answer(f"📋 Файлы от преподавателя:")
             await send_files_to_user(message, grade_files, "")
@@ -845,14 +981,8 @@ async def send_files_to_user(message: types.Message, files: list, caption: str =
 async def notify_students_new_assignment(assignment_id: int, assignment_data: dict):
     """Уведомить учеников о новом задании"""
     try:
-        # Получаем учеников для этого класса
-        all_users = await db.get_all_users()
-        target_users = []
-
-        if assignment_data['grade_level'] == 0:
-            target_users = all_users  # Для всех классов
-        else:
-            target_users = [u for u in all_users if u['grade'] == assignment_data['grade_level']]
+        # Получаем учеников для этого класса (0 - все классы)
+        target_users = await db.get_broadcast_recipients(assignment_data['grade_level'])
 
         difficulty_emoji = {"easy": "🟢", "medium": "🟡", "hard": "🔴"}
         notification_data = {
@@ -867,12 +997,12 @@ async def notify_students_new_assignment(assignment_id: int, assignment_data: di
         return notification_data
 
     except Exception as e:
-        print(f"Ошибка при подготовке уведомления о новом задании: {e}")
+        logging.error(f"Ошибка при подготовке уведомления о новом задании: {e}")
         return None
 
 
-async def notify_admin_new_solution(user_id: int, assignment_id: int, result_id: int):
-    """Подготовить данные для уведомления админа о новом решении"""
+async def notify_admin_new_solution(user_id: int, assignment_id: int, result_id: int, is_first: bool = False):
+    """Подготовить данные для уведомления админа о новом решении (is_first - от submit_solution)"""
     try:
         user_data = await db.get_user(user_id)
         assignment = await db.get_assignment_by_id(assignment_id)
@@ -885,10 +1015,11 @@ async def notify_admin_new_solution(user_id: int, assignment_id: int, result_id:
             'assignment': assignment,
             'result_id': result_id,
             'has_files': len(solution_files) > 0,
-            'files_count': len(solution_files)
+            'files_count': len(solution_files),
+            'is_first': is_first
         }
     except Exception as e:
-        print(f"Ошибка при подготовке уведомления админа: {e}")
+        logging.error(f"Ошибка при подготовке уведомления админа: {e}")
         return None
 
 
@@ -896,7 +1027,7 @@ async def notify_student_grade(solution_id: int, score: int, max_score: int, com
     """Подготовить данные для уведомления ученика о результате"""
     try:
         # Получаем данные решения через прямой запрос к базе
-        async with aiosqlite.connect(db.db_path) as conn:
+        async with db.connect() as conn:
             cursor = await conn.execute("""
                 SELECT r.user_id, a.title
                 FROM results r
@@ -924,5 +1055,5 @@ async def notify_student_grade(solution_id: int, score: int, max_score: int, com
             }
 
     except Exception as e:
-        print(f"Ошибка при подготовке уведомления ученика: {e}")
+        logging.error(f"Ошибка при подготовке уведомления ученика: {e}")
         return None
\ No newline at end of file
@@ -0,0 +1,177 @@
+# handlers/maintenance.py
+import logging
+
+from aiogram import types
+
+from database.archive import archiver
+from database.backup import backups, list_snapshots
+from database.file_gc import file_gc
+from database.maintenance import maintenance
+from database.db_handler import DatabaseHandler
+
+db = DatabaseHandler()
+
+SNAPSHOTS_SHOWN = 10
+
+
+def _size(size: int) -> str:
+    return f"{size / 1024 / 1024:.1f} МБ" if size >= 1024 * 1024 else f"{size // 1024} КБ"
+
+
+# === РЕЗЕРВНЫЕ КОПИИ ===
+
+async def backup_command(message: types.Message):
+    """Резервная копия базы: /backup - создать сейчас, /backup list - последние снимки"""
+    if not await db.is_admin(message.from_user.id):
+        await message.answer("❌ Доступ запрещен.")
+        return
+
+    if "list" in message.text.split()[1:]:
+        snapshots = list_snapshots(backups.directory)
+        if not snapshots:
+            await message.answer("📭 Резервных копий пока нет.")
+            return
+        lines = [f"🗄 Резервные копии ({len(snapshots)}):", ""]
+        lines += [f"• {s['created']:%d.%m.%Y %H:%M} - {_size(s['size'])}" for s in snapshots[:SNAPSHOTS_SHOWN]]
+        await message.answer("\n".join(lines))
+        return
+
+    if backups.running:
+        await message.answer("⏳ Резервная копия уже создается, подождите.")
+        return
+
+    await message.answer("⏳ Создаю резервную копию...")
+    try:
+        info = await backups.run()
+    except Exception as e:
+        logging.error(f"Ошибка резервного копирования: {e}")
+        await message.answer(f"❌ Не удалось создать резервную копию: {e}")
+        return
+
+    await message.answer(
+        f"✅ Резервная копия создана\n\n"
+        f"📦 {info['name']}\n"
+        f"💾 База {_size(info['db_size'])}, архив {_size(info['size'])}\n"
+        f"⏱ {info['seconds']:.1f} с\n"
+        f"🗑 Удалено старых копий: {len(info['removed'])}"
+    )
+
+
+# === ОБСЛУЖИВАНИЕ БАЗЫ ===
+
+OPERATION_NAMES = {'analyze': "ANALYZE", 'optimize': "PRAGMA optimize", 'checkpoint': "Сброс WAL", 'vacuum': "Vacuum", 'file_gc': "Сборка файлов"}
+
+
+async def maintenance_command(message: types.Message):
+    """Состояние базы и журнал обслуживания: /maintenance; /maintenance run - обслужить сейчас"""
+    if not await db.is_admin(message.from_user.id):
+        await message.answer("❌ Доступ запрещен.")
+        return
+
+    lines = []
+    if "run" in message.text.split()[1:]:
+        if maintenance.running:
+            await message.answer("⏳ Обслуживание базы уже идет, подождите.")
+            return
+        await message.answer("⏳ Обслуживаю базу...")
+        try:
+            report = await maintenance.run(force=True)
+        except Exception as e:
+            logging.error(f"Ошибка обслуживания базы: {e}")
+            await message.answer(f"❌ Обслуживание не удалось: {e}")
+            return
+        lines += [
+            "✅ Обслуживание выполнено",
+            f"📊 Статистика обновлена: {', '.join(report['analyzed']) or 'не требовалось'}",
+            f"🧹 Освобождено страниц: {report['vacuumed_pages']}",
+            ""
+        ]
+        status = report
+    else:
+        status = await maintenance.status()
+
+    lines += [
+        f"💾 База {_size(status['db_bytes'])}, свободно внутри {_size(status['freelist_bytes'])}, "
+        f"WAL {_size(status['wal_bytes'])}",
+    ]
+    if not status['incremental_vacuum']:
+        lines.append("⚠️ База без auto_vacuum=INCREMENTAL: свободное место не возвращается. "
+                     "Перевод - python tools/convert_auto_vacuum.py при остановленном боте")
+
+    history = await db.get_last_maintenance()
+    if history:
+        lines += ["", "🕒 Последние операции:"]
+        for entry in history:
+            name = OPERATION_NAMES.get(entry['operation'], entry['operation'])
+            target = f" {entry['object']}" if entry['object'] else ""
+            lines.append(f"• {name}{target}: {entry['started_at'][5:16]}, {entry['seconds'] * 1000:.0f} мс "
+                         f"(шаг до {entry['max_step_ms']:.0f} мс)")
+    await message.answer("\n".join(lines))
+
+
+# === АРХИВ ===
+
+async def archive_command(message: types.Message):
+    """Архив решений: /archive - сводка, /archive run - перенести подходящие задания сейчас"""
+    if not await db.is_admin(message.from_user.id):
+        await message.answer("❌ Доступ запрещен.")
+        return
+
+    lines = []
+    if "run" in message.text.split()[1:]:
+        if archiver.running:
+            await message.answer("⏳ Перенос в архив уже идет, подождите.")
+            return
+        await message.answer("⏳ Переношу в архив...")
+        try:
+            totals = await archiver.run()
+        except Exception as e:
+            logging.error(f"Ошибка переноса в архив: {e}")
+            await message.answer(f"❌ Перенос в архив не удался: {e}")
+            return
+        lines += [
+            f"✅ Перенесено за {totals['seconds']:.1f} с: заданий {totals['assignments']}, "
+            f"решений {totals['results']}, файлов {totals['files']}",
+            ""
+        ]
+
+    summary = await db.get_archive_summary()
+    waiting = await db.get_archivable_assignments(archiver.months) if archiver.months else []
+    lines += [
+        f"📦 В архиве: заданий {summary['archived_assignments']}, решений {summary['archive_results']}, "
+        f"файлов {summary['archive_files']}",
+        f"💾 В основной базе: решений {summary['results']}, файлов {summary['files']}",
+        f"⏳ Ждут переноса заданий: {len(waiting)}" if archiver.months else "⏸ Перенос выключен",
+    ]
+    await message.answer("\n".join(lines))
+
+
+# === ОСИРОТЕВШИЕ ФАЙЛЫ ===
+
+async def file_gc_command(message: types.Message):
+    """Файлы без привязок: /filegc - сводка, /filegc run - удалить старше срока сейчас"""
+    if not await db.is_admin(message.from_user.id):
+        await message.answer("❌ Доступ запрещен.")
+        return
+
+    lines = []
+    if "run" in message.text.split()[1:]:
+        if file_gc.running:
+            await message.answer("⏳ Сборка файлов уже идет, подождите.")
+            return
+        try:
+            totals = await file_gc.run()
+        except Exception as e:
+            logging.error(f"Ошибка сборки файлов: {e}")
+            await message.answer(f"❌ Сборка файлов не удалась: {e}")
+            return
+        lines += [
+            f"✅ Удалено за {totals['seconds']:.1f} с: файлов {totals['rows']} ({_size(totals['bytes'])}), "
+            f"оставлено в незавершенных диалогах {totals['kept']}",
+            ""
+        ]
+
+    summary = await db.get_orphan_summary()
+    lines.append(f"🗂 Файлов без привязок: {summary['rows']} ({_size(summary['bytes'])})")
+    lines.append(f"⏳ Удаляются через {file_gc.grace_hours:g} ч после загрузки")
+    await message.answer("\n".join(lines))
@@ -0,0 +1,126 @@
+# handlers/quotas.py
+import math
+
+from aiogram import types
+
+from database.db_handler import DatabaseHandler
+from utils.file_utils import FileProcessor
+
+db = DatabaseHandler()
+
+TOP_USERS_SHOWN = 10
+MB = 1024 * 1024
+MAX_LIMIT = 2 ** 63 - 1  # Наибольшее целое, которое хранит SQLite
+
+
+def _size(size: int) -> str:
+    return f"{size / MB:.1f} МБ" if size >= MB else f"{size // 1024} КБ"
+
+
+def _limits(usage: dict) -> tuple:
+    """Действующая квота (файлов, байт): индивидуальная или по умолчанию"""
+    default_files, default_bytes = FileProcessor.user_quota
+    max_files = usage['max_files'] if usage['max_files'] is not None else default_files
+    max_bytes = usage['max_bytes'] if usage['max_bytes'] is not None else default_bytes
+    return max_files, max_bytes
+
+
+def _usage_line(usage: dict) -> str:
+    max_files, max_bytes = _limits(usage)
+    files = f"{usage['files']} из {max_files}" if max_files else f"{usage['files']} (без ограничения)"
+    size = f"{_size(usage['bytes'])} из {_size(max_bytes)}" if max_bytes else f"{_size(usage['bytes'])} (без ограничения)"
+    personal = " ⭐ индивидуальная квота" if usage['max_files'] is not None or usage['max_bytes'] is not None else ""
+    return f"📁 Файлов: {files}\n💾 Объем: {size}{personal}"
+
+
+async def show_my_usage(message: types.Message):
+    """Объем загрузок ученика и его квота"""
+    user_id = message.from_user.id
+    if not await db.is_user_registered(user_id):
+        await message.answer("❌ Вы не зарегистрированы в системе.")
+        return
+
+    usage = await db.get_storage_usage(user_id)
+    await message.answer(
+        "📦 Ваши файлы\n\n"
+        f"{_usage_line(usage)}\n\n"
+        "Учитываются все загруженные файлы, включая прикрепленные к незавершенным решениям."
+    )
+
+
+async def usage_report(message: types.Message):
+    """Объем загрузок: /usage - сводка и лидеры, /usage <ID> - один пользователь"""
+    if not await db.is_admin(message.from_user.id):
+        await message.answer("❌ Доступ запрещен.")
+        return
+
+    args = message.text.split()[1:]
+    if args:
+        if not args[0].isdigit():
+            await message.answer("❌ Используйте: /usage [ID пользователя]")
+            return
+        usage = await db.get_storage_usage(int(args[0]))
+        await message.answer(f"📦 Файлы пользователя {args[0]}\n\n{_usage_line(usage)}")
+        return
+
+    totals = await db.get_storage_totals()
+    default_files, default_bytes = FileProcessor.user_quota
+    lines = [
+        f"📦 Всего файлов: {totals['files']} ({_size(totals['bytes'])})",
+        f"📏 Квота по умолчанию: {default_files or '∞'} файлов, "
+        f"{_size(default_bytes) if default_bytes else '∞'}",
+        "",
+        "👤 Больше всего загрузили:",
+    ]
+    for entry in await db.get_top_storage_usage(TOP_USERS_SHOWN):
+        name = f"{entry['first_name'] or ''} {entry['last_name'] or ''}".strip() or "?"
+        max_files, max_bytes = _limits(entry)
+        share = f" - {entry['bytes'] * 100 // max_bytes}% квоты" if max_bytes else ""
+        lines.append(f"• {name} ({entry['user_id']}): {entry['files']} файлов, {_size(entry['bytes'])}{share}")
+    await message.answer("\n".join(lines))
+
+
+async def quota_command(message: types.Message):
+    """Индивидуальная квота: /quota <ID> <файлов> <МБ> (0 - без ограничения), /quota <ID> reset"""
+    if not await db.is_admin(message.from_user.id):
+        await message.answer("❌ Доступ запрещен.")
+        return
+
+    args = message.text.split()[1:]
+    usage_text = (
+        "❌ Используйте:\n"
+        "/quota <ID> <файлов> <МБ> - индивидуальная квота (0 - без ограничения, - - по умолчанию)\n"
+        "/quota <ID> reset - вернуть квоту по умолчанию"
+    )
+    if not args or not args[0].isdigit():
+        await message.answer(usage_text)
+        return
+    user_id = int(args[0])
+
+    if len(args) == 2 and args[1] == "reset":
+        removed = await db.delete_quota_override(user_id)
+        await message.answer("✅ Квота по умолчанию восстановлена." if removed
+                             else "ℹ️ У пользователя и так квота по умолчанию.")
+        return
+
+    if len(args) != 3:
+        await message.answer(usage_text)
+        return
+    try:
+        max_files = None if args[1] == "-" else int(args[1])
+        megabytes = None if args[2] == "-" else float(args[2].replace(",", "."))
+    except ValueError:
+        await message.answer(usage_text)
+        return
+    # float() принимает inf и nan, в байты они не переводятся
+    if megabytes is not None and not math.isfinite(megabytes):
+        await message.answer(usage_text)
+        return
+    max_bytes = None if megabytes is None else int(megabytes * MB)
+    if any(limit is not None and not 0 <= limit <= MAX_LIMIT for limit in (max_files, max_bytes)):
+        await message.answer(usage_text)
+        return
+
+    await db.set_quota_override(user_id, max_files, max_bytes, message.from_user.id)
+    usage = await db.get_storage_usage(user_id)
+    await message.answer(f"✅ Квота пользователя {user_id} обновлена\n\n{_usage_line(usage)}")
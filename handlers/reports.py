@@ -0,0 +1,142 @@
+# handlers/reports.py
+import logging
+import os
+import time
+
+from aiogram import types
+from aiogram.types import FSInputFile
+
+from database.db_handler import DatabaseHandler
+from database.tracing import query_tracer
+from utils.export_utils import GradebookExporter, EXPORT_FORMATS
+from utils.metrics import metrics
+
+db = DatabaseHandler()
+
+
+# === ВЫГРУЗКА ЖУРНАЛА ===
+
+async def export_grades_command(message: types.Message):
+    """Выгрузить журнал оценок: /export_grades [класс] [csv|jsonl]"""
+    if not await db.is_admin(message.from_user.id):
+        await message.answer("❌ Доступ запрещен.")
+        return
+
+    grade = None
+    fmt = 'csv'
+    for arg in message.text.split()[1:]:
+        if arg.lower() in EXPORT_FORMATS:
+            fmt = arg.lower()
+            continue
+        try:
+            grade = int(arg)
+            if not 1 <= grade <= 11:
+                raise ValueError
+        except ValueError:
+            await message.answer("❌ Используйте: /export_grades [класс 1-11] [csv|jsonl]")
+            return
+
+    grade_text = f"класс {grade}" if grade else "все классы"
+    await message.answer(f"⏳ Формирую журнал ({grade_text})...")
+
+    path = None
+    try:
+        path, students = await GradebookExporter.export(grade, fmt)
+        if not students:
+            await message.answer("📋 Нет учеников для выгрузки.")
+            return
+
+        filename = f"gradebook_{grade or 'all'}.{fmt}"
+        await message.answer_document(
+            FSInputFile(path, filename=filename),
+            caption=f"📊 Журнал оценок: {grade_text}\n👥 Учеников: {students}"
+        )
+    except Exception as e:
+        logging.error(f"Ошибка при выгрузке журнала: {e}")
+        await message.answer("❌ Ошибка при формировании журнала.")
+    finally:
+        if path and os.path.exists(path):
+            os.remove(path)
+
+
+# === СТАТИСТИКА РАБОТЫ БОТА ===
+
+def _format_latency_table(series, label: str, limit: int = 8) -> list:
+    """Строки 'имя: p50/p95/p99 (вызовов)' для самых медленных по p95"""
+    rows = []
+    for labels, histogram in series.items():
+        name = dict(labels).get(label, "?")
+        p50, p95, p99 = histogram.quantiles(0.5, 0.95, 0.99)
+        rows.append((p95, f"• {name}: {p50 * 1000:.0f}/{p95 * 1000:.0f}/{p99 * 1000:.0f} мс ({histogram.count})"))
+    rows.sort(reverse=True)
+    return [line for _, line in rows[:limit]] or ["• нет данных"]
+
+
+async def botstats_command(message: types.Message, fsm_states: dict):
+    """Сводка задержек обработчиков, базы и Bot API (p50/p95/p99)"""
+    if not await db.is_admin(message.from_user.id):
+        await message.answer("❌ Доступ запрещен.")
+        return
+
+    uptime = int(time.time() - metrics.started_at)
+    updates = sum(h.count for h in metrics.histograms('update_seconds').values())
+    db_calls = metrics.histograms('db_calls_per_update').get((), None)
+    db_calls_text = f"{db_calls.quantiles(0.5)[0]:.0f} / {db_calls.quantiles(0.95)[0]:.0f}" if db_calls else "-"
+    api_errors = sum(metrics.counters('bot_api_errors_total').values())
+    handler_errors = sum(metrics.counters('handler_errors_total').values())
+    startup = {dict(labels)['stage']: value for labels, value in metrics.gauges('startup_seconds').items()}
+    first_response = metrics.gauges('first_response_seconds').get(())
+    startup_text = ", ".join(f"{stage} {value:.2f} с" for stage, value in startup.items()) or "-"
+    if first_response is not None:
+        startup_text += f"; первый ответ через {first_response:.2f} с"
+
+    lines = [
+        "📈 Статистика бота (p50/p95/p99, процесс)",
+        "",
+        f"⏱ Работает: {uptime // 3600} ч {uptime % 3600 // 60} мин",
+        f"🚀 Запуск: {startup_text}",
+        f"📨 Обновлений: {updates}, ошибок в обработчиках: {handler_errors}",
+        f"🗄 Вызовов базы на обновление (p50 / p95): {db_calls_text}",
+        "",
+        "🐢 Обработчики:",
+        *_format_latency_table(metrics.histograms('handler_seconds'), 'handler'),
+        "",
+        "🗄 Методы базы:",
+        *_format_latency_table(metrics.histograms('db_call_seconds'), 'method'),
+        "",
+        f"📡 Bot API (ошибок: {api_errors}):",
+        *_format_latency_table(metrics.histograms('bot_api_seconds'), 'method', limit=5),
+        "",
+        "🧭 Состояния FSM:",
+        *([f"• {state}: {count}" for state, count in sorted(fsm_states.items())] or ["• нет активных"])
+    ]
+    await message.answer("\n".join(lines)[:4000])
+
+
+# === МЕДЛЕННЫЕ ЗАПРОСЫ ===
+
+async def slow_queries_command(message: types.Message):
+    """Самые затратные SQL-запросы: /slowqueries [N] [reset]"""
+    if not await db.is_admin(message.from_user.id):
+        await message.answer("❌ Доступ запрещен.")
+        return
+
+    if not query_tracer.enabled:
+        await message.answer("ℹ️ Трассировка запросов выключена. Запустите бота с DB_TRACE=1.")
+        return
+
+    args = message.text.split()[1:]
+    if "reset" in args:
+        query_tracer.reset()
+        await message.answer("🧹 Статистика запросов сброшена.")
+        return
+
+    limit = next((int(arg) for arg in args if arg.isdigit()), 5)
+    report = query_tracer.report(limit)
+    if not report:
+        await message.answer("📭 Запросов пока не было.")
+        return
+
+    text = f"🐌 Топ-{limit} запросов по суммарному времени (процесс):\n\n{report}"
+    for i in range(0, len(text), 4000):
+        await message.answer(text[i:i + 4000])
@@ -0,0 +1,83 @@
+# handlers/search.py
+from aiogram import types
+from aiogram.fsm.context import FSMContext
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, CallbackQuery
+
+from database.db_handler import DatabaseHandler
+
+db = DatabaseHandler()
+
+SEARCH_PAGE_SIZE = 8
+SNIPPET_LENGTH = 200
+
+
+async def _search_scope(user_id: int):
+    """(user_id, grade) для поиска ученика; (None, None) - администратор видит все"""
+    if await db.is_admin(user_id):
+        return None, None
+    user = await db.get_user(user_id)
+    return user_id, user['grade']
+
+
+async def _render_page(user_id: int, query: str, page: int):
+    """Текст и клавиатура страницы результатов; страница берется с одной лишней строкой,
+    чтобы знать, есть ли следующая"""
+    owner, grade = await _search_scope(user_id)
+    hits = await db.search(query, user_id=owner, grade=grade,
+                           limit=SEARCH_PAGE_SIZE + 1, offset=page * SEARCH_PAGE_SIZE)
+    has_next = len(hits) > SEARCH_PAGE_SIZE
+    hits = hits[:SEARCH_PAGE_SIZE]
+
+    if not hits:
+        text = f"🔎 По запросу «{query}» ничего не найдено." if page == 0 else "🔎 Больше результатов нет."
+        return text, None
+
+    lines = [f"🔎 «{query}» - страница {page + 1}", ""]
+    for hit in hits:
+        if hit['kind'] == 'assignment':
+            lines.append(f"📚 Задание {hit['id']} - {hit['title']}")
+        else:
+            author = f" ({hit['first_name']} {hit['last_name'] or ''}".rstrip() + ")" if owner is None else ""
+            lines.append(f"📝 Решение {hit['id']} - {hit['title']}{author}")
+        lines.append(f"   {hit['snippet'][:SNIPPET_LENGTH]}")
+        lines.append("")
+    lines.append("Открыть: /assignment <ID>" + (", /solution <ID>" if owner is not None else ""))
+
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f"search_page_{page - 1}"))
+    if has_next:
+        buttons.append(InlineKeyboardButton(text="Далее ▶️", callback_data=f"search_page_{page + 1}"))
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+    return "\n".join(lines), keyboard
+
+
+async def search_command(message: types.Message, state: FSMContext):
+    """Полнотекстовый поиск: /search <слова>"""
+    user_id = message.from_user.id
+    if not await db.is_admin(user_id) and not await db.is_user_registered(user_id):
+        await message.answer("❌ Вы не зарегистрированы в системе.")
+        return
+
+    query = message.text.partition(" ")[2].strip()
+    if not query:
+        await message.answer("❌ Используйте: /search <слова из задания или решения>")
+        return
+
+    # Запрос - в данных FSM: кнопки листания несут только номер страницы
+    await state.update_data(search_query=query)
+    text, keyboard = await _render_page(user_id, query, 0)
+    await message.answer(text, reply_markup=keyboard)
+
+
+async def search_page_callback(callback: CallbackQuery, state: FSMContext):
+    """Листание результатов поиска"""
+    query = (await state.get_data()).get('search_query')
+    if not query:
+        await callback.answer("❌ Поиск устарел, повторите /search", show_alert=True)
+        return
+
+    page = int(callback.data.split("_")[2])
+    text, keyboard = await _render_page(callback.from_user.id, query, page)
+    await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
@@ -7,17 +7,46 @@ from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, CallbackQu
 import os
 import asyncio
 import logging
+import signal
+import time
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 
 from database.db_handler import DatabaseHandler
+from database.fsm_storage import SQLiteStorage
+from database.tracing import query_tracer
+from database.backup import backups
+from database.maintenance import maintenance
+from database.archive import archiver
+from database.file_gc import file_gc
 from states.registration import (
     RegistrationStates, AdminStates, AssignmentStates,
     SolutionStates, GradingStates, FileStates
 )
 from utils.file_utils import FileProcessor
+from utils.chart_utils import shutdown_chart_workers
+from utils.notifications import (
+    BulkSender, DeliveryReport, SolutionDigest, BULK_RATE_LIMIT,
+    DIGEST_WINDOW, DIGEST_MAX_EVENTS, DIGEST_URGENT_FIRST
+)
+from utils.cluster import Cluster, serve_updates
+from utils.metrics import (
+    metrics, start_metrics_server, UpdateMetricsMiddleware, HandlerMetricsMiddleware, BotApiMetricsMiddleware
+)
+from middlewares.reachability import ReachabilityMiddleware
+from middlewares.sharding import ShardingMiddleware
+from middlewares.ordering import UserOrderingMiddleware, setup_ordering
+from middlewares.throttling import ThrottlingMiddleware, parse_command_limits, COMMAND_LIMITS
+from middlewares.recorder import UpdateRecorder
+from middlewares.inflight import InFlightMiddleware
+from utils.scheduler import scheduler
+from utils.webhook import build_webhook_app, run_webhook
+from utils.log_utils import setup_logging, parse_sample_rates, LogContextMiddleware, HandlerLogMiddleware
 from handlers.assignments import (
     create_assignment_command, process_assignment_title, process_assignment_description,
-    process_assignment_grade, process_difficulty_choice, process_due_date,
+    process_assignment_grade, process_difficulty_choice, process_due_date, process_publish_date,
     handle_add_assignment_files, handle_create_assignment_without_files, process_assignment_files,
     show_all_assignments, show_my_assignments, show_assignment_detail, show_solution_details,
     start_solution_submission, process_solution_submission,
@@ -25,23 +54,193 @@ from handlers.assignments import (
     show_ungraded_solutions, view_solution_detail, start_grading,
     process_grading_score, process_grading_comment,
     handle_add_grade_files, handle_submit_grade_without_files, process_grade_files,
-    show_my_progress,
+    show_my_progress, show_my_archive,
     notify_students_new_assignment, notify_admin_new_solution, notify_student_grade
 )
-
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
+from handlers.reports import export_grades_command, botstats_command, slow_queries_command
+from handlers.maintenance import backup_command, maintenance_command, archive_command, file_gc_command
+from handlers.search import search_command, search_page_callback
+from handlers.quotas import show_my_usage, usage_report, quota_command
 
 # Загрузка переменных окружения
 load_dotenv()
+
+# Журнал: text или json (поля update_id, user_id, handler, latency_ms); вывод в фоновом потоке.
+# LOG_SAMPLE - доля записываемых массовых событий; медленные обновления и ошибки пишутся всегда
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_FILE = os.getenv("LOG_FILE", "")
+LOG_SAMPLE = os.getenv("LOG_SAMPLE", "update:0.1,delivery:0.1")
+LOG_SLOW_MS = float(os.getenv("LOG_SLOW_MS", "1000"))
+setup_logging(LOG_LEVEL, LOG_FORMAT, LOG_FILE, parse_sample_rates(LOG_SAMPLE))
+
 TOKEN = os.getenv("BOT_TOKEN")
 ADMIN_ID = int(os.getenv("ADMIN_ID"))
 
+# Сводка о новых решениях: окно накопления (0 - без сводок), размер, срочные первые решения;
+# значения по умолчанию - в utils/notifications.py
+DIGEST_WINDOW = float(os.getenv("DIGEST_WINDOW", DIGEST_WINDOW))
+DIGEST_MAX_EVENTS = int(os.getenv("DIGEST_MAX_EVENTS", DIGEST_MAX_EVENTS))
+DIGEST_URGENT_FIRST = os.getenv("DIGEST_URGENT_FIRST", "1" if DIGEST_URGENT_FIRST else "0") == "1"
+
+# Режим получения обновлений: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # Публичный адрес; пусто - вебхук в Telegram не регистрируется
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")  # Свой Bot API сервер (или тестовая заглушка)
+
+# Процессы-обработчики: 1 - все в одном процессе; больше - процесс-приемник
+# раскладывает обновления по процессам, FSM хранится в базе
+WORKERS = int(os.getenv("WORKERS", "1"))
+FSM_STORAGE = "sqlite" if WORKERS > 1 else os.getenv("FSM_STORAGE", "memory")
+SCHEDULER_SYNC_INTERVAL = 300  # Секунд; страховка, если уведомление о задаче обработчика не дошло
+
+# ordered - разные пользователи параллельно, один пользователь по очереди
+# (UPDATE_CONCURRENCY=1 - строго последовательно); concurrent - без упорядочивания
+CONCURRENCY_MODE = os.getenv("CONCURRENCY_MODE", "ordered")
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "32"))
+
+# Ограничение частоты запросов (THROTTLE_RATE=0 - выключено)
+THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", "1"))
+THROTTLE_BURST = float(os.getenv("THROTTLE_BURST", "5"))
+THROTTLE_COMMANDS = os.getenv("THROTTLE_COMMANDS")  # например: progress:0.2:2,assignments:0.2:3
+
+# Метрики Prometheus на GET /metrics (0 - выключено); обработчики слушают METRICS_PORT + 1 + номер
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Плавная остановка: сколько секунд ждать обработчиков и отправки очереди сообщений
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "20"))
+
+# Запись входящих обновлений (обезличенных) для tools/replay.py; пусто - выключено
+RECORD_UPDATES = os.getenv("RECORD_UPDATES", "")  # например: recorded_updates.jsonl
+RECORD_SALT = os.getenv("RECORD_SALT", "")  # ключ псевдонимов id; постоянный - id совпадают между запусками
+
+# Резервные копии базы: ежедневно в BACKUP_TIME (пусто - только по /backup),
+# хранятся BACKUP_KEEP последних и по одной на BACKUP_KEEP_WEEKLY предыдущих недель
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+BACKUP_TIME = os.getenv("BACKUP_TIME", "03:30")
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+BACKUP_KEEP_WEEKLY = int(os.getenv("BACKUP_KEEP_WEEKLY", "4"))
+
+# Обслуживание базы: проверка каждые MAINTENANCE_INTERVAL секунд (0 - выключено),
+# incremental_vacuum - только в тихие часы; шаг держит блокировку записи до MAINTENANCE_LOCK_MS
+MAINTENANCE_INTERVAL = float(os.getenv("MAINTENANCE_INTERVAL", "600"))
+MAINTENANCE_QUIET_HOURS = os.getenv("MAINTENANCE_QUIET_HOURS", "02:00-05:00")
+MAINTENANCE_LOCK_MS = float(os.getenv("MAINTENANCE_LOCK_MS", "50"))
+WAL_CHECKPOINT_MB = float(os.getenv("WAL_CHECKPOINT_MB", "16"))
+
+# Архив (archive.db рядом с базой): решения и файлы заданий, деактивированных больше
+# ARCHIVE_AFTER_MONTHS месяцев назад (0 - не переносить), переносятся ежедневно в ARCHIVE_TIME
+ARCHIVE_AFTER_MONTHS = int(os.getenv("ARCHIVE_AFTER_MONTHS", "6"))
+ARCHIVE_TIME = os.getenv("ARCHIVE_TIME", "04:00")
+ARCHIVE_BATCH = int(os.getenv("ARCHIVE_BATCH", "500"))
+
+# Сборка файлов без привязок (брошенные диалоги с файлами): ежедневно в FILE_GC_TIME
+# (пусто - только по /filegc run), удаляются загруженные больше FILE_GC_GRACE_HOURS часов назад
+FILE_GC_TIME = os.getenv("FILE_GC_TIME", "04:30")
+FILE_GC_GRACE_HOURS = float(os.getenv("FILE_GC_GRACE_HOURS", "48"))
+FILE_GC_BATCH = int(os.getenv("FILE_GC_BATCH", "500"))
+
+# Квота загрузок на пользователя по умолчанию (0 - без ограничения); индивидуальные - /quota
+USER_QUOTA_FILES = int(os.getenv("USER_QUOTA_FILES", "200"))
+USER_QUOTA_MB = float(os.getenv("USER_QUOTA_MB", "300"))
+
+# Трассировка SQL: статистика по запросам и журнал запросов дольше DB_SLOW_MS
+query_tracer.configure(enabled=os.getenv("DB_TRACE", "0") == "1", slow_ms=float(os.getenv("DB_SLOW_MS", "100")))
+
 # Инициализация бота и диспетчера
-bot = Bot(token=TOKEN)
-storage = MemoryStorage()
+session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+bot = Bot(token=TOKEN, session=session)
+bot.session.middleware(BotApiMetricsMiddleware())
+storage = SQLiteStorage() if FSM_STORAGE == "sqlite" else MemoryStorage()
 dp = Dispatcher(storage=storage)
 db = DatabaseHandler()
+backups.configure(db.db_path, BACKUP_DIR, keep_last=BACKUP_KEEP, keep_weekly=BACKUP_KEEP_WEEKLY)
+archiver.configure(db.db_path, ARCHIVE_AFTER_MONTHS, ARCHIVE_BATCH)
+FileProcessor.set_user_quota(USER_QUOTA_FILES, int(USER_QUOTA_MB * 1024 * 1024))
+# Лимит Telegram общий для бота, поэтому делится между процессами: обработчиками
+# и приемником (его планировщик рассылает напоминания, сводки и публикации)
+sender = BulkSender(bot, rate=BULK_RATE_LIMIT / (WORKERS + 1) if WORKERS > 1 else BULK_RATE_LIMIT)
+solution_digest = SolutionDigest(sender, ADMIN_ID, window=DIGEST_WINDOW,
+                                 max_events=DIGEST_MAX_EVENTS, urgent_first=DIGEST_URGENT_FIRST)
+
+# Учет обновлений в обработке - первым, чтобы при остановке дождаться и ждущих очереди
+inflight = InFlightMiddleware()
+dp.update.outer_middleware(inflight)
+
+# Запись - до упорядочивания, чтобы время обновления было временем прихода
+recorder = UpdateRecorder(RECORD_UPDATES, RECORD_SALT, admin_ids=[ADMIN_ID]) if RECORD_UPDATES else None
+if recorder and WORKERS == 1:
+    dp.update.outer_middleware(recorder)
+
+if CONCURRENCY_MODE == "ordered":
+    setup_ordering(dp, UserOrderingMiddleware(UPDATE_CONCURRENCY))
+
+# Задержки обновлений, обработчиков и число обращений к базе
+dp.update.outer_middleware(UpdateMetricsMiddleware())
+dp.message.middleware(HandlerMetricsMiddleware())
+dp.callback_query.middleware(HandlerMetricsMiddleware())
+
+# Контекст журнала (update_id, user_id, handler) и запись event=update на каждое обновление
+dp.update.outer_middleware(LogContextMiddleware(LOG_SLOW_MS))
+dp.message.middleware(HandlerLogMiddleware())
+dp.callback_query.middleware(HandlerLogMiddleware())
+
+# Лишние запросы отбрасываются до обращения к базе
+if THROTTLE_RATE > 0:
+    throttling = ThrottlingMiddleware(
+        THROTTLE_RATE, THROTTLE_BURST,
+        parse_command_limits(THROTTLE_COMMANDS) if THROTTLE_COMMANDS is not None else COMMAND_LIMITS
+    )
+    dp.message.outer_middleware(throttling)
+    dp.callback_query.outer_middleware(throttling)
+
+# Ученики, снова написавшие боту, возвращаются в рассылки
+dp.message.outer_middleware(ReachabilityMiddleware())
+dp.callback_query.outer_middleware(ReachabilityMiddleware())
+
+PENDING_PAGE_SIZE = 20  # Сколько заявок показывать в /pending
+
+WELCOME_TEXT = (
+    "🎉 Поздравляем! Ваша заявка одобрена!\n\n"
+    "Теперь вы можете пользоваться всеми функциями бота.\n"
+    "Введите /help для просмотра доступных команд."
+)
+
+
+async def count_fsm_states() -> dict:
+    """Количество пользователей в каждом состоянии FSM"""
+    if isinstance(storage, SQLiteStorage):
+        return await storage.count_states()
+    counts = {}
+    for record in storage.storage.values():
+        if record.state:
+            counts[record.state] = counts.get(record.state, 0) + 1
+    return counts
+
+
+async def pending_upload_ids() -> set:
+    """Файлы, загруженные в еще не завершенных диалогах (задание, решение, оценка)"""
+    if isinstance(storage, SQLiteStorage):
+        records = await storage.all_data()
+    else:
+        records = [record.data for record in storage.storage.values()]
+    return {f['db_id'] for data in records
+            for key in ('assignment_files', 'solution_files', 'grade_files') for f in data.get(key) or []}
+
+
+file_gc.configure(db.db_path, FILE_GC_GRACE_HOURS, FILE_GC_BATCH, in_use=pending_upload_ids)
+
+
+async def collect_fsm_metrics() -> dict:
+    return {('fsm_states', (('state', state),)): count for state, count in (await count_fsm_states()).items()}
+
+
+metrics.add_collector(collect_fsm_metrics)
 
 
 # === КОМАНДЫ ДЛЯ ВСЕХ ПОЛЬЗОВАТЕЛЕЙ ===
@@ -61,7 +260,7 @@ async def show_users(message: types.Message):
     text = "👥 Зарегистрированные ученики:\n\n"
     for user in users:
         text += (
-            f"👤 {user['first_name']} {user['last_name']}\n"
+            f"👤 {user['first_name']} {user['last_name']} (ID {user['telegram_id']})\n"
             f"🎓 Класс: {user['grade']}\n"
             f"📱 {user['phone']}\n"
             f"📅 Регистрация: {user['registration_date'][:10]}\n\n"
@@ -76,6 +275,44 @@ async def show_users(message: types.Message):
         await message.answer(text)
 
 
+@dp.message(Command("deactivate"))
+async def deactivate_user_command(message: types.Message):
+    if not await db.is_admin(message.from_user.id):
+        await message.answer("❌ Доступ запрещен.")
+        return
+
+    try:
+        telegram_id = int(message.text.split()[1])
+    except (IndexError, ValueError):
+        await message.answer("❌ Используйте: /deactivate <Telegram ID ученика>")
+        return
+
+    if await db.deactivate_user(telegram_id):
+        await message.answer(f"✅ Ученик {telegram_id} деактивирован.")
+    else:
+        await message.answer("❌ Активный ученик с таким ID не найден.")
+
+
+@dp.message(Command("deactivate_assignment"))
+async def deactivate_assignment_command(message: types.Message):
+    if not await db.is_admin(message.from_user.id):
+        await message.answer("❌ Доступ запрещен.")
+        return
+
+    try:
+        assignment_id = int(message.text.split()[1])
+    except (IndexError, ValueError):
+        await message.answer("❌ Используйте: /deactivate_assignment <ID задания>")
+        return
+
+    if await db.deactivate_assignment(assignment_id):
+        archive_text = (f"\n📦 Решения уйдут в архив через {ARCHIVE_AFTER_MONTHS} мес."
+                        if ARCHIVE_AFTER_MONTHS else "")
+        await message.answer(f"✅ Задание {assignment_id} снято.{archive_text}")
+    else:
+        await message.answer("❌ Активное задание с таким ID не найдено.")
+
+
 # === ОБРАБОТЧИКИ ЗАДАНИЙ ===
 
 # Команды для администратора
@@ -109,6 +346,11 @@ async def due_date_handler(message: types.Message, state: FSMContext):
     await process_due_date(message, state)
 
 
+@dp.message(StateFilter(AssignmentStates.waiting_for_publish_date))
+async def publish_date_handler(message: types.Message, state: FSMContext):
+    await process_publish_date(message, state)
+
+
 # НОВЫЕ ОБРАБОТЧИКИ ДЛЯ ФАЙЛОВ ЗАДАНИЙ
 @dp.callback_query(F.data == "add_assignment_files")
 async def add_assignment_files_handler(callback: CallbackQuery, state: FSMContext):
@@ -117,12 +359,16 @@ async def add_assignment_files_handler(callback: CallbackQuery, state: FSMContex
 
 @dp.callback_query(F.data == "create_assignment_without_files")
 async def create_assignment_without_files_handler(callback: CallbackQuery, state: FSMContext):
-    await handle_create_assignment_without_files(callback, state)
+    notification_data = await handle_create_assignment_without_files(callback, state)
+    if notification_data:
+        await send_assignment_notifications(notification_data)
 
 
 @dp.message(StateFilter(FileStates.waiting_for_assignment_files))
 async def assignment_files_handler(message: types.Message, state: FSMContext):
-    await process_assignment_files(message, state)
+    notification_data = await process_assignment_files(message, state)
+    if notification_data:
+        await send_assignment_notifications(notification_data)
 
 
 @dp.message(Command("assignments"))
@@ -172,12 +418,16 @@ async def add_solution_files_handler(callback: CallbackQuery, state: FSMContext)
 
 @dp.callback_query(F.data == "submit_solution_without_files")
 async def submit_solution_without_files_handler(callback: CallbackQuery, state: FSMContext):
-    await handle_submit_solution_without_files(callback, state)
+    notification_data = await handle_submit_solution_without_files(callback, state)
+    if notification_data:
+        await send_solution_notification(notification_data)
 
 
 @dp.message(StateFilter(FileStates.waiting_for_solution_files))
 async def solution_files_handler(message: types.Message, state: FSMContext):
-    await process_solution_files(message, state)
+    notification_data = await process_solution_files(message, state)
+    if notification_data:
+        await send_solution_notification(notification_data)
 
 
 # ОБРАБОТЧИКИ ОЦЕНИВАНИЯ
@@ -209,12 +459,79 @@ async def add_grade_files_handler(callback: CallbackQuery, state: FSMContext):
 
 @dp.callback_query(F.data == "submit_grade_without_files")
 async def submit_grade_without_files_handler(callback: CallbackQuery, state: FSMContext):
-    await handle_submit_grade_without_files(callback, state)
+    notification_data = await handle_submit_grade_without_files(callback, state)
+    if notification_data:
+        await send_grade_notification(notification_data)
 
 
 @dp.message(StateFilter(FileStates.waiting_for_grade_files))
 async def grade_files_handler(message: types.Message, state: FSMContext):
-    await process_grade_files(message, state)
+    notification_data = await process_grade_files(message, state)
+    if notification_data:
+        await send_grade_notification(notification_data)
+
+
+# ВЫГРУЗКА ЖУРНАЛА
+@dp.message(Command("export_grades"))
+async def export_grades_handler(message: types.Message):
+    await export_grades_command(message)
+
+
+@dp.message(Command("botstats"))
+async def botstats_handler(message: types.Message):
+    await botstats_command(message, await count_fsm_states())
+
+
+@dp.message(Command("slowqueries"))
+async def slow_queries_handler(message: types.Message):
+    await slow_queries_command(message)
+
+
+@dp.message(Command("backup"))
+async def backup_handler(message: types.Message):
+    await backup_command(message)
+
+
+@dp.message(Command("maintenance"))
+async def maintenance_handler(message: types.Message):
+    await maintenance_command(message)
+
+
+@dp.message(Command("archive"))
+async def archive_handler(message: types.Message):
+    if await db.is_admin(message.from_user.id):
+        await archive_command(message)
+    else:
+        await show_my_archive(message)
+
+
+@dp.message(Command("filegc"))
+async def file_gc_handler(message: types.Message):
+    await file_gc_command(message)
+
+
+@dp.message(Command("usage"))
+async def usage_handler(message: types.Message):
+    if await db.is_admin(message.from_user.id):
+        await usage_report(message)
+    else:
+        await show_my_usage(message)
+
+
+@dp.message(Command("quota"))
+async def quota_handler(message: types.Message):
+    await quota_command(message)
+
+
+# ПОИСК
+@dp.message(Command("search"))
+async def search_handler(message: types.Message, state: FSMContext):
+    await search_command(message, state)
+
+
+@dp.callback_query(F.data.startswith("search_page_"))
+async def search_page_handler(callback: CallbackQuery, state: FSMContext):
+    await search_page_callback(callback, state)
 
 
 @dp.message(Command("help"))
@@ -226,11 +543,24 @@ async def help_command(message: types.Message):
             "🔧 Команды администратора:\n\n"
             "👥 Управление пользователями:\n"
             "/pending - заявки на регистрацию\n"
-            "/users - список учеников\n\n"
+            "/approve_all [класс] - одобрить все заявки\n"
+            "/users - список учеников\n"
+            "/deactivate <ID> - деактивировать ученика\n\n"
             "📚 Управление заданиями:\n"
             "/create_assignment - создать задание\n"
             "/assignments - все задания\n"
-            "/ungraded - непроверенные решения\n\n"
+            "/deactivate_assignment <ID> - снять задание\n"
+            "/ungraded - непроверенные решения\n"
+            "/search <слова> - поиск по заданиям и решениям\n"
+            "/export_grades [класс] [csv|jsonl] - выгрузить журнал\n"
+            "/botstats - задержки обработчиков, базы и Bot API\n"
+            "/slowqueries [N] - самые затратные SQL-запросы\n"
+            "/backup [list] - резервная копия базы\n"
+            "/maintenance [run] - обслуживание базы\n"
+            "/archive [run] - архив старых решений\n"
+            "/filegc [run] - файлы брошенных загрузок\n"
+            "/usage [ID] - объем загрузок учеников\n"
+            "/quota <ID> <файлов> <МБ> - индивидуальная квота\n\n"
             "📎 При создании заданий и оценок можно прикреплять файлы\n"
             "/help - эта справка"
         )
@@ -240,7 +570,11 @@ async def help_command(message: types.Message):
             "/assignments - мои задания\n"
             "/assignment <ID> - детали задания\n"
             "/solution <ID> - детали решения\n"
-            "/progress - моя статистика\n\n"
+            "/search <слова> - поиск по заданиям и своим решениям\n"
+            "/progress - моя статистика\n"
+            "/progress trend [week|month] - график прогресса\n"
+            "/archive - решения прошлых лет\n"
+            "/usage - мои файлы и квота\n\n"
             "📎 К решениям можно прикреплять файлы\n"
             "/help - эта справка"
         )
@@ -263,11 +597,17 @@ async def handle_files_in_states(message: types.Message, state: FSMContext):
     current_state = await state.get_state()
 
     if current_state == FileStates.waiting_for_assignment_files:
-        await process_assignment_files(message, state)
+        notification_data = await process_assignment_files(message, state)
+        if notification_data:
+            await send_assignment_notifications(notification_data)
     elif current_state == FileStates.waiting_for_solution_files:
-        await process_solution_files(message, state)
+        notification_data = await process_solution_files(message, state)
+        if notification_data:
+            await send_solution_notification(notification_data)
     elif current_state == FileStates.waiting_for_grade_files:
-        await process_grade_files(message, state)
+        notification_data = await process_grade_files(message, state)
+        if notification_data:
+            await send_grade_notification(notification_data)
     else:
         # Если файл прислали не в том состоянии
         await message.answer(
@@ -283,62 +623,67 @@ async def send_assignment_notifications(notification_data):
     difficulty_emoji = {"easy": "🟢", "medium": "🟡", "hard": "🔴"}
     files_text = " 📎" if notification_data.get('has_files') else ""
 
-    for user in notification_data['target_users']:
-        try:
-            text = (
-                f"🆕 Новое задание!\n\n"
-                f"📝 {notification_data['title']}\n"
-                f"⚡ Сложность: {difficulty_emoji.get(notification_data['difficulty'], '⚡')} {notification_data['difficulty']}{files_text}\n\n"
-                f"Посмотреть: /assignment {notification_data['assignment_id']}"
-            )
-            await bot.send_message(user['telegram_id'], text)
-        except Exception as e:
-            logging.error(f"Не удалось уведомить пользователя {user['telegram_id']}: {e}")
+    text = (
+        f"🆕 Новое задание!\n\n"
+        f"📝 {notification_data['title']}\n"
+        f"⚡ Сложность: {difficulty_emoji.get(notification_data['difficulty'], '⚡')} {notification_data['difficulty']}{files_text}\n\n"
+        f"Посмотреть: /assignment {notification_data['assignment_id']}"
+    )
+    sender.enqueue_many([(user_id, text) for user_id in notification_data['target_users']],
+                        title=f"Новое задание «{notification_data['title']}»", summary=True)
 
 
 async def send_solution_notification(notification_data):
-    """Отправить уведомление админу о новом решении"""
+    """Отправить уведомление админу о новом решении (через сводку)"""
     try:
-        files_text = f" 📎{notification_data['files_count']}" if notification_data.get('has_files') else ""
-
-        text = (
-            f"📤 Новое решение!\n\n"
-            f"👤 {notification_data['user_data']['first_name']} {notification_data['user_data']['last_name']} "
-            f"({notification_data['user_data']['grade']} класс)\n"
-            f"📝 Задание: {notification_data['assignment']['title']}\n"
-            f"🆔 ID решения: {notification_data['result_id']}{files_text}\n\n"
-            "Используйте /ungraded для проверки."
-        )
-
-        await bot.send_message(ADMIN_ID, text)
+        solution_digest.add(notification_data)
     except Exception as e:
         logging.error(f"Ошибка при уведомлении админа: {e}")
 
 
 async def send_grade_notification(notification_data):
     """Отправить уведомление ученику об оценке"""
-    try:
-        grade_emoji = "🟢" if notification_data['percentage'] >= 80 else "🟡" if notification_data[
-                                                                                   'percentage'] >= 60 else "🔴"
-        files_text = f"\n📋 Файлов от преподавателя: {notification_data['files_count']}" if notification_data.get(
-            'has_files') else ""
+    grade_emoji = "🟢" if notification_data['percentage'] >= 80 else "🟡" if notification_data[
+                                                                               'percentage'] >= 60 else "🔴"
+    files_text = f"\n📋 Файлов от преподавателя: {notification_data['files_count']}" if notification_data.get(
+        'has_files') else ""
+
+    text = (
+        f"{grade_emoji} Ваше решение проверено!\n\n"
+        f"📝 Задание: {notification_data['assignment_title']}\n"
+        f"📊 Оценка: {notification_data['score']}/{notification_data['max_score']} ({notification_data['percentage']}%)\n"
+    )
 
-        text = (
-            f"{grade_emoji} Ваше решение проверено!\n\n"
-            f"📝 Задание: {notification_data['assignment_title']}\n"
-            f"📊 Оценка: {notification_data['score']}/{notification_data['max_score']} ({notification_data['percentage']}%)\n"
-        )
+    if notification_data['comment']:
+        text += f"💬 Комментарий: {notification_data['comment']}\n"
 
-        if notification_data['comment']:
-            text += f"💬 Комментарий: {notification_data['comment']}\n"
+    text += files_text
 
-        text += files_text
+    text += "\n\nПосмотреть детали: /solution <ID>"
 
-        text += "\n\nПосмотреть детали: /solution <ID>"
+    sender.enqueue(notification_data['user_id'], text)
 
-        await bot.send_message(notification_data['user_id'], text)
-    except Exception as e:
-        logging.error(f"Ошибка при уведомлении ученика: {e}")
+
+async def handle_delivery_report(report: DeliveryReport):
+    """Обработать итоги рассылки: исключить недоступных учеников, сообщить админу"""
+    if report.unreachable:
+        marked = await db.mark_users_unreachable(report.unreachable)
+        if marked:
+            logging.info(f"Отмечены недоступными: {marked} учеников")
+
+    if report.summary:
+        text = (
+            f"📨 Рассылка завершена: {report.title}\n\n"
+            f"✅ Доставлено: {report.delivered} из {report.total}"
+        )
+        if report.unreachable:
+            text += f"\n🚫 Заблокировали бота: {len(report.unreachable)} (исключены из рассылок)"
+        if report.failed:
+            text += f"\n⚠️ Ошибки доставки: {report.failed}"
+        sender.enqueue(ADMIN_ID, text)
+
+
+sender.on_report = handle_delivery_report
 
 
 async def notify_admin_new_request(request_data):
@@ -356,6 +701,88 @@ async def notify_admin_new_request(request_data):
         logging.error(f"Не удалось уведомить администратора: {e}")
 
 
+# === ЗАДАЧИ ПЛАНИРОВЩИКА ===
+
+async def send_deadline_reminders(job):
+    """Напомнить о сроке сдачи ученикам, которые еще не отправили решение"""
+    assignment = await db.get_assignment_by_id(job['object_id'])
+    if not assignment or not assignment['is_active'] or not assignment['due_date']:
+        return
+
+    due = datetime.strptime(assignment['due_date'], "%Y-%m-%d %H:%M:%S")
+    now = datetime.now()
+    if due <= now:
+        return
+
+    recipients = await db.get_students_without_solution(assignment['id'])
+    hours_left = max(round((due - now).total_seconds() / 3600), 1)
+    text = (
+        f"⏰ Напоминание о сроке сдачи!\n\n"
+        f"📝 {assignment['title']}\n"
+        f"📅 Срок: {assignment['due_date'][:16]} (осталось ~{hours_left} ч)\n\n"
+        f"Отправить решение: /assignment {assignment['id']}"
+    )
+    sender.enqueue_many([(user_id, text) for user_id in recipients],
+                        title=f"Напоминание «{assignment['title']}»", summary=True)
+    logging.info(f"Напоминание по заданию {assignment['id']}: {len(recipients)} учеников")
+
+
+async def publish_scheduled_assignment(job):
+    """Опубликовать отложенное задание: уведомить учеников"""
+    assignment = await db.get_assignment_by_id(job['object_id'])
+    if not assignment or not assignment['is_active']:
+        return
+
+    files = await db.get_object_files('assignment', assignment['id'])
+    notification_data = await notify_students_new_assignment(assignment['id'], {
+        'title': assignment['title'],
+        'grade_level': assignment['grade_level'],
+        'difficulty': assignment['difficulty'],
+        'assignment_files': files
+    })
+    if notification_data:
+        await send_assignment_notifications(notification_data)
+
+
+def next_daily_at(at: str) -> datetime:
+    """Ближайшее наступление времени суток at ('ЧЧ:ММ')"""
+    hour, minute = map(int, at.split(":"))
+    now = datetime.now()
+    run_at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    return run_at if run_at > now else run_at + timedelta(days=1)
+
+
+async def scheduled_backup(job):
+    """Ежедневная резервная копия; следующая планируется сразу"""
+    try:
+        await backups.run()
+    finally:
+        await scheduler.schedule('backup', 0, next_daily_at(BACKUP_TIME))
+
+
+async def scheduled_archive(job):
+    """Ежедневный перенос старых решений в архив; следующий планируется сразу"""
+    try:
+        await archiver.run()
+    finally:
+        await scheduler.schedule('archive', 0, next_daily_at(ARCHIVE_TIME))
+
+
+async def scheduled_file_gc(job):
+    """Ежедневная сборка осиротевших файлов; следующая планируется сразу"""
+    try:
+        await file_gc.run()
+    finally:
+        await scheduler.schedule('file_gc', 0, next_daily_at(FILE_GC_TIME))
+
+
+scheduler.register('reminder', send_deadline_reminders)
+scheduler.register('publish', publish_scheduled_assignment)
+scheduler.register('backup', scheduled_backup)
+scheduler.register('archive', scheduled_archive)
+scheduler.register('file_gc', scheduled_file_gc)
+
+
 # === ОБРАБОТКА УВЕДОМЛЕНИЙ ===
 
 async def handle_notifications_from_assignments():
@@ -364,9 +791,27 @@ async def handle_notifications_from_assignments():
     pass
 
 
-async def main():
-    # Инициализируем базу данных
-    await db.init_db()
+async def warm_up():
+    """Прогрев кэшей параллельно с началом приема обновлений"""
+    started = time.perf_counter()
+    try:
+        loaded = await db.warm_up()
+    except Exception as e:
+        logging.error(f"Ошибка прогрева кэшей: {e}")
+        return
+    elapsed = time.perf_counter() - started
+    metrics.set('startup_seconds', elapsed, stage='warmup')
+    logging.info(f"Кэши прогреты за {elapsed:.2f} с: учеников {loaded['students']}, "
+                 f"активных заданий {loaded['assignments']}")
+
+
+@dp.startup()
+async def on_startup():
+    # Инициализируем базу данных (DDL - только если версия схемы изменилась)
+    started = time.perf_counter()
+    if await db.init_db():
+        logging.info("Схема базы создана или обновлена")
+    metrics.set('startup_seconds', time.perf_counter() - started, stage='schema')
 
     # Добавляем главного администратора
     await db.add_admin(ADMIN_ID, "admin", "Администратор", is_super_admin=True)
@@ -374,12 +819,174 @@ async def main():
     # Создаем папку для временных файлов (если понадобится)
     os.makedirs("temp_files", exist_ok=True)
 
-    print("🤖 Бот запущен с поддержкой файлов!")
-    await dp.start_polling(bot)
+    await db.load_unreachable_users()
+    sender.start()
+    await scheduler.start(sync_interval=SCHEDULER_SYNC_INTERVAL if cluster else None)
+    if BACKUP_TIME:
+        await scheduler.schedule('backup', 0, next_daily_at(BACKUP_TIME))
+    if ARCHIVE_AFTER_MONTHS:
+        await scheduler.schedule('archive', 0, next_daily_at(ARCHIVE_TIME))
+    if FILE_GC_TIME:
+        await scheduler.schedule('file_gc', 0, next_daily_at(FILE_GC_TIME))
+    maintenance.start()
+
+    if BOT_MODE == "webhook":
+        if WEBHOOK_URL:
+            await bot.set_webhook(
+                WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET or None,
+                allowed_updates=dp.resolve_used_update_types()
+            )
+    else:
+        # Telegram не отдает обновления через getUpdates, пока установлен вебхук
+        await bot.delete_webhook()
+
+    # Процессы-обработчики запускаются после создания таблиц
+    if cluster:
+        cluster.start(on_job=scheduler.add, on_failure=stop_on_worker_failure)
+
+    global metrics_runner
+    if METRICS_PORT:
+        metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+
+    # В многопроцессном режиме кэши нужны процессам-обработчикам, они прогреваются сами
+    global warmup_task
+    if not cluster:
+        warmup_task = asyncio.create_task(warm_up())
+
+    # От запуска процесса до готовности принимать обновления
+    metrics.set('startup_seconds', time.time() - metrics.started_at, stage='startup')
+    logging.info(f"🤖 Бот запущен с поддержкой файлов! Режим: {BOT_MODE}, процессов: {WORKERS}")
+
+
+async def drain_work(timeout: float):
+    """Доделать начатое: обработчики, задачу планировщика, очередь сообщений (общий срок timeout)"""
+    deadline = time.monotonic() + timeout
+
+    def remaining() -> float:
+        return max(0.0, deadline - time.monotonic())
+
+    if inflight.in_flight():
+        logging.info(f"Остановка: ждем обновлений в обработке - {inflight.in_flight()}")
+    await inflight.drain(remaining())
+    await scheduler.stop(remaining())
+    await maintenance.stop(remaining())
+
+    # Сводка и уведомления, поставленные обработчиками, уходят до закрытия сессии
+    solution_digest.flush()
+    if not sender.queue.empty():
+        logging.info(f"Остановка: отправка сообщений из очереди - {sender.queue.qsize()}")
+    unsent = await sender.stop(remaining())
+    if unsent:
+        logging.warning(f"Остановка: не отправлено сообщений - {unsent}")
+
+
+@dp.shutdown()
+async def on_shutdown():
+    # Прием обновлений к этому моменту уже остановлен (polling или webhook-сервер)
+    started = time.monotonic()
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    backups.abort()  # Идущая резервная копия прерывается, а не задерживает остановку
+    archiver.abort()
+    file_gc.abort()
+    if cluster:
+        await cluster.stop()
+    await drain_work(SHUTDOWN_TIMEOUT)
+    shutdown_chart_workers()
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+    if recorder:
+        recorder.close()
+    if query_tracer.enabled:
+        logging.info(f"Самые затратные запросы:\n{query_tracer.report(10, plan=False)}")
+
+    # Все записи сделаны: журнал WAL переносится в файл базы
+    try:
+        busy, wal_size = await db.checkpoint()
+        if busy:
+            logging.warning("Остановка: база занята, WAL перенесен не полностью")
+        if wal_size:
+            logging.info(f"Остановка: WAL перенесен в базу ({wal_size // 1024} КБ)")
+        logging.info(f"Остановка завершена за {time.monotonic() - started:.1f} с")
+    except Exception as e:
+        logging.error(f"Ошибка при сбросе WAL: {e}")
 
 
-if __name__ == "__main__":
-    asyncio.run(main())
+def stop_on_worker_failure(index: int):
+    """Обработчик не запускается: без него часть учеников не получает ответов, бот останавливается"""
+    logging.critical(f"Обработчик {index} не удается запустить, остановка бота")
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def run_worker(index: int, updates, jobs, progress):
+    """Точка входа процесса-обработчика (многопроцессный режим)"""
+    asyncio.run(worker_main(index, updates, jobs, progress))
+
+
+async def worker_main(index: int, updates, jobs, progress):
+    # Задачи (публикация, напоминания) выполняет планировщик процесса-приемника
+    scheduler.forward_to(jobs.put)
+    await db.load_unreachable_users()
+    sender.start()
+    warmup = asyncio.create_task(warm_up())
+    runner = await start_metrics_server(METRICS_HOST, METRICS_PORT + 1 + index) if METRICS_PORT else None
+    logging.info(f"Обработчик {index} запущен")
+    try:
+        await serve_updates(dp, bot, updates, progress, index)
+    finally:
+        warmup.cancel()
+        await drain_work(SHUTDOWN_TIMEOUT)
+        shutdown_chart_workers()
+        if runner is not None:
+            await runner.cleanup()
+        await bot.session.close()
+
+
+# Процессу-обработчику - время на собственную плавную остановку
+cluster = Cluster(WORKERS, run_worker, stop_timeout=SHUTDOWN_TIMEOUT + 5) if WORKERS > 1 else None
+# Обслуживание идет в процессе-приемнике: в многопроцессном режиме занятость - обновления у обработчиков
+maintenance.configure(db.db_path, MAINTENANCE_INTERVAL, MAINTENANCE_QUIET_HOURS,
+                      lock_ms=MAINTENANCE_LOCK_MS, wal_limit_mb=WAL_CHECKPOINT_MB,
+                      busy=cluster.in_flight if cluster else inflight.in_flight)
+metrics_runner = None
+warmup_task = None
+
+# В многопроцессном режиме процесс-приемник только раскладывает обновления
+ingress_dp = dp
+if cluster:
+    ingress_dp = Dispatcher(disable_fsm=True)
+    if recorder:
+        ingress_dp.update.outer_middleware(recorder)
+    ingress_dp.update.outer_middleware(ShardingMiddleware(cluster))
+    ingress_dp.startup.register(on_startup)
+    ingress_dp.shutdown.register(on_shutdown)
+
+
+def webhook_health() -> dict:
+    """Состояние бота для GET /health"""
+    health = {
+        'mode': BOT_MODE,
+        'send_queue': sender.queue.qsize(),
+        'scheduled_jobs': scheduler.pending_count(),
+        'pending_digest': solution_digest.pending_count()
+    }
+    if cluster:
+        health['worker_queues'] = cluster.queue_sizes()
+        health['worker_restarts'] = cluster.restarts
+        health['worker_lost_updates'] = cluster.lost_updates
+    return health
+
+
+async def main():
+    if BOT_MODE == "webhook":
+        # Вебхук в Telegram не удаляется при остановке: обновления
+        # копятся на стороне Telegram и придут после перезапуска
+        app = build_webhook_app(ingress_dp, bot, WEBHOOK_PATH, WEBHOOK_SECRET, health=webhook_health)
+        await run_webhook(app, WEBAPP_HOST, WEBAPP_PORT)
+    else:
+        await ingress_dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+
 
 @dp.message(Command("start"))
 async def start_command(message: types.Message):
@@ -394,7 +1001,11 @@ async def start_command(message: types.Message):
             "/users - список учеников\n"
             "/create_assignment - создать задание\n"
             "/assignments - все задания\n"
+            "/deactivate_assignment <ID> - снять задание\n"
             "/ungraded - непроверенные решения\n"
+            "/export_grades - выгрузить журнал\n"
+            "/botstats - статистика работы бота\n"
+            "/slowqueries - медленные запросы\n"
             "/help - справка"
         )
     elif await db.is_user_registered(user_id):
@@ -556,7 +1167,7 @@ async def show_pending_requests(message: types.Message):
         await message.answer("📋 Нет ожидающих заявок.")
         return
 
-    for req in requests:
+    for req in requests[:PENDING_PAGE_SIZE]:
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [
                 InlineKeyboardButton(text="✅ Одобрить", callback_data=f"approve_{req['id']}"),
@@ -576,6 +1187,27 @@ async def show_pending_requests(message: types.Message):
 
         await message.answer(text, reply_markup=keyboard)
 
+    # Массовое одобрение: все заявки или заявки одного класса
+    grades = {}
+    for req in requests:
+        grades[req['grade']] = grades.get(req['grade'], 0) + 1
+
+    buttons = [[InlineKeyboardButton(text=f"✅ Одобрить все ({len(requests)})",
+                                     callback_data="bulk_approve_all")]]
+    grade_buttons = [InlineKeyboardButton(text=f"🎓 {grade} класс ({count})",
+                                          callback_data=f"bulk_approve_grade_{grade}")
+                     for grade, count in sorted(grades.items()) if grade is not None]
+    for i in range(0, len(grade_buttons), 3):
+        buttons.append(grade_buttons[i:i + 3])
+
+    shown_text = (f"Показано {PENDING_PAGE_SIZE} из {len(requests)} заявок.\n"
+                  if len(requests) > PENDING_PAGE_SIZE else "")
+    await message.answer(
+        f"{shown_text}📥 Всего ожидающих заявок: {len(requests)}\n"
+        "Массовое одобрение:",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons)
+    )
+
 
 @dp.callback_query(F.data.startswith("approve_"))
 async def approve_request(callback: CallbackQuery):
@@ -586,8 +1218,7 @@ async def approve_request(callback: CallbackQuery):
     request_id = int(callback.data.split("_")[1])
 
     # Получаем данные заявки для уведомления
-    requests = await db.get_pending_requests()
-    request_data = next((r for r in requests if r['id'] == request_id), None)
+    request_data = await db.get_registration_request(request_id)
 
     if request_data and await db.approve_registration(request_id, "Одобрено администратором"):
         await callback.message.edit_text(
@@ -596,19 +1227,62 @@ async def approve_request(callback: CallbackQuery):
         )
 
         # Уведомляем пользователя
-        try:
-            await bot.send_message(
-                request_data['telegram_id'],
-                "🎉 Поздравляем! Ваша заявка одобрена!\n\n"
-                "Теперь вы можете пользоваться всеми функциями бота.\n"
-                "Введите /help для просмотра доступных команд."
-            )
-        except Exception as e:
-            logging.error(f"Не удалось уведомить пользователя {request_data['telegram_id']}: {e}")
+        sender.enqueue(request_data['telegram_id'], WELCOME_TEXT)
     else:
         await callback.answer("❌ Ошибка при обработке заявки.")
 
 
+async def bulk_approve(grade=None) -> str:
+    """Одобрить ожидающие заявки одной транзакцией и разослать приветствия"""
+    try:
+        approved = await db.approve_registrations_bulk(grade, "Одобрено массово")
+    except Exception as e:
+        logging.error(f"Ошибка при массовом одобрении заявок: {e}")
+        return "❌ Ошибка при массовом одобрении заявок."
+
+    if not approved:
+        return "📋 Нет ожидающих заявок."
+
+    sender.enqueue_many([(req['telegram_id'], WELCOME_TEXT) for req in approved])
+
+    grade_text = f" ({grade} класс)" if grade is not None else ""
+    return (
+        f"✅ Одобрено заявок{grade_text}: {len(approved)}\n"
+        "📨 Приветственные сообщения отправляются в фоне."
+    )
+
+
+@dp.callback_query(F.data.startswith("bulk_approve_"))
+async def bulk_approve_callback(callback: CallbackQuery):
+    if not await db.is_admin(callback.from_user.id):
+        await callback.answer("❌ Доступ запрещен.")
+        return
+
+    grade = None
+    if callback.data.startswith("bulk_approve_grade_"):
+        grade = int(callback.data.split("_")[3])
+
+    await callback.message.edit_text(await bulk_approve(grade))
+
+
+@dp.message(Command("approve_all"))
+async def approve_all_command(message: types.Message):
+    if not await db.is_admin(message.from_user.id):
+        await message.answer("❌ Доступ запрещен.")
+        return
+
+    grade = None
+    args = message.text.split()[1:]
+    if args:
+        try:
+            grade = int(args[0])
+        except ValueError:
+            await message.answer("❌ Используйте: /approve_all [класс]")
+            return
+
+    await message.answer(await bulk_approve(grade))
+
+
 @dp.callback_query(F.data.startswith("reject_"))
 async def reject_request(callback: CallbackQuery, state: FSMContext):
     if not await db.is_admin(callback.from_user.id):
@@ -639,16 +1313,17 @@ async def process_rejection_reason(message: types.Message, state: FSMContext):
         await message.answer(f"❌ Заявка #{request_id} отклонена.")
 
         # Уведомляем пользователя
-        try:
-            await bot.send_message(
-                request_data['telegram_id'],
-                f"😔 К сожалению, ваша заявка была отклонена.\n\n"
-                f"Причина: {reason}\n\n"
-                "Вы можете подать новую заявку, исправив указанные недочеты."
-            )
-        except Exception as e:
-            logging.error(f"Не удалось уведомить пользователя {request_data['telegram_id']}: {e}")
+        sender.enqueue(
+            request_data['telegram_id'],
+            f"😔 К сожалению, ваша заявка была отклонена.\n\n"
+            f"Причина: {reason}\n\n"
+            "Вы можете подать новую заявку, исправив указанные недочеты."
+        )
     else:
         await message.answer("❌ Ошибка при отклонении заявки.")
 
     await state.clear()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,59 @@
+# middlewares/inflight.py
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+
+class InFlightMiddleware(BaseMiddleware):
+    """Учет обновлений в обработке для плавной остановки.
+
+    Вешается на dp.update первым: обновления, ждущие своей очереди в
+    UserOrderingMiddleware, тоже считаются. При остановке drain() ждет
+    их завершения до срока, оставшиеся обработчики отменяются.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[int, asyncio.Task] = {}  # update_id -> задача, в которой идет обработка
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self.completed = 0
+
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    async def drain(self, timeout: float) -> int:
+        """Дождаться обработки текущих обновлений; вернуть число прерванных"""
+        await asyncio.sleep(0)  # Только что созданные задачи успевают войти в обработку
+        if self._tasks:
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        tasks = [task for task in self._tasks.values() if not task.done()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            # Даем отмененным обработчикам выйти из блоков finally
+            await asyncio.wait(tasks, timeout=1)
+            logging.warning(f"Остановка: прервано обработчиков - {len(tasks)}")
+        return len(tasks)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        self._tasks[event.update_id] = asyncio.current_task()
+        self._idle.clear()
+        try:
+            return await handler(event, data)
+        finally:
+            self.completed += 1
+            self._tasks.pop(event.update_id, None)
+            if not self._tasks:
+                self._idle.set()
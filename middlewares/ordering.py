@@ -0,0 +1,67 @@
+# middlewares/ordering.py
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import TelegramObject
+
+UPDATE_CONCURRENCY = 32  # Сколько обновлений обрабатывается одновременно
+
+
+class UserOrderingMiddleware(BaseMiddleware):
+    """Конкурентная обработка обновлений с порядком внутри пользователя.
+
+    Обновления разных пользователей выполняются параллельно (не больше
+    max_concurrency одновременно), а обновления одного пользователя -
+    строго по очереди: части альбома и двойные нажатия не гоняются
+    друг с другом в get_data/update_data.
+    """
+
+    def __init__(self, max_concurrency: int = UPDATE_CONCURRENCY):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._waiting: Dict[int, int] = {}  # Сколько обновлений пользователя в работе
+
+    def in_flight(self) -> int:
+        """Сколько пользователей сейчас обрабатывается или ждет очереди"""
+        return len(self._locks)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        chat = data.get("event_chat")
+        key = user.id if user is not None else chat.id if chat is not None else None
+
+        if key is None:
+            async with self.semaphore:
+                return await handler(event, data)
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._waiting[key] = self._waiting.get(key, 0) + 1
+        try:
+            # Сначала очередь пользователя, затем общий лимит: ожидающие
+            # своей очереди обновления не занимают места в лимите
+            async with lock:
+                async with self.semaphore:
+                    return await handler(event, data)
+        finally:
+            self._waiting[key] -= 1
+            if not self._waiting[key]:
+                del self._waiting[key]
+                del self._locks[key]
+
+
+def setup_ordering(dp: Dispatcher, middleware: UserOrderingMiddleware):
+    """Подключить упорядочивание к диспетчеру.
+
+    FSMContextMiddleware читает состояние еще до обработчика, поэтому
+    перерегистрируется после нашего middleware - иначе второе обновление
+    пользователя прочитало бы состояние до завершения первого.
+    """
+    dp.update.outer_middleware.unregister(dp.fsm)
+    dp.update.outer_middleware(middleware)
+    dp.update.outer_middleware(dp.fsm)
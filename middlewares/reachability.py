@@ -0,0 +1,34 @@
+# middlewares/reachability.py
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from database.cache import unreachable_cache
+from database.db_handler import DatabaseHandler
+
+db = DatabaseHandler()
+
+
+class ReachabilityMiddleware(BaseMiddleware):
+    """Возвращает в рассылки ученика, который снова написал боту.
+
+    Проверка идет по множеству в памяти, так что обычные апдейты
+    не обращаются к базе; множество перечитывается, когда устареет.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+
+        if user is not None:
+            if not unreachable_cache.is_fresh():
+                await db.load_unreachable_users()
+            if user.id in unreachable_cache:
+                await db.restore_user_reachability(user.id)
+
+        return await handler(event, data)
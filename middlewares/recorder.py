@@ -0,0 +1,130 @@
+# middlewares/recorder.py
+import hashlib
+import hmac
+import json
+import logging
+import re
+import secrets
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+RECORD_VERSION = 1
+FLUSH_INTERVAL = 1.0  # Секунд между сбросами буфера на диск
+
+ANON_ID_BASE = 10 ** 9  # Обезличенные id не пересекаются с настоящими малыми id
+ANON_ID_RANGE = 10 ** 9
+
+NAME_KEYS = {'first_name', 'last_name', 'username', 'title', 'phone_number', 'vcard', 'bio'}
+TEXT_KEYS = {'text', 'caption'}
+FILE_KEYS = {'file_id', 'file_unique_id'}
+COORDINATE_KEYS = {'latitude', 'longitude'}
+MAX_KEPT_ARG_DIGITS = 6
+
+# Ответы, которые нужны обработчикам как есть: классы, оценки, даты, "нет"/"сейчас"
+KEEP_TEXT = re.compile(
+    r"^(\d{1,2}|\d+/\d+|\d{2}\.\d{2}\.\d{4}( \d{2}:\d{2})?|-|нет|no|skip|сейчас|now)$", re.IGNORECASE
+)
+
+
+def anonymize_id(salt: bytes, value: int) -> int:
+    """Стабильный обезличенный id (знак сохраняется: группы остаются группами)"""
+    digest = hmac.new(salt, str(abs(value)).encode(), hashlib.sha256).digest()
+    anon = ANON_ID_BASE + int.from_bytes(digest[:8], "big") % ANON_ID_RANGE
+    return -anon if value < 0 else anon
+
+
+def mask_text(text: str) -> str:
+    """Скрыть текст, сохранив длину (проверки длины в обработчиках) и команды"""
+    if KEEP_TEXT.match(text.strip()):
+        return text
+    if text.startswith("/"):
+        # Номера заданий и решений в аргументах нужны; длинные числа - это id пользователей
+        command, sep, rest = text.partition(" ")
+        return command + sep + " ".join(
+            arg if arg.isdigit() and len(arg) <= MAX_KEPT_ARG_DIGITS else mask_text(arg)
+            for arg in rest.split(" ")
+        ) if rest else command
+    return "".join("x" if c.isalpha() else "0" if c.isdigit() else c for c in text)
+
+
+class UpdateRecorder(BaseMiddleware):
+    """Запись входящих обновлений в JSONL для tools/replay.py.
+
+    Вешается на dp.update (в многопроцессном режиме - на процесс-приемник).
+    id пользователей и чатов заменяются стабильными HMAC-псевдонимами,
+    имена, телефоны и тексты ответов скрываются с сохранением длины,
+    команды и короткие ответы (классы, оценки, даты) остаются как есть.
+    Первая строка каждого сеанса записи - заголовок с псевдонимами
+    администраторов.
+    """
+
+    def __init__(self, path: str, salt: str = "", admin_ids: Iterable[int] = ()):
+        self.path = path
+        self.random_salt = not salt
+        self.salt = (salt or secrets.token_hex(16)).encode()
+        self.admin_ids = list(admin_ids)
+        self.recorded = 0
+        self._file = None
+        self._flushed_at = 0.0
+
+    def _anonymize(self, value: Any, key: Optional[str] = None) -> Any:
+        if isinstance(value, dict):
+            return {k: self._anonymize(v, k) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._anonymize(item, key) for item in value]
+        if key in ('id', 'user_id', 'chat_id') and isinstance(value, int) and not isinstance(value, bool):
+            return anonymize_id(self.salt, value)
+        if isinstance(value, str):
+            if key in NAME_KEYS or key in TEXT_KEYS:
+                return mask_text(value)
+            if key in FILE_KEYS:
+                return hmac.new(self.salt, value.encode(), hashlib.sha256).hexdigest()[:32]
+        if key in COORDINATE_KEYS:
+            return 0.0
+        return value
+
+    def _open(self):
+        if self.random_salt:
+            logging.warning("RECORD_SALT не задан: псевдонимы будут другими после перезапуска")
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._write({
+            'type': 'header', 'version': RECORD_VERSION,
+            'started': datetime.now().isoformat(timespec="seconds"),
+            'admins': [anonymize_id(self.salt, admin_id) for admin_id in self.admin_ids]
+        })
+
+    def _write(self, record: dict):
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def record(self, update: Update):
+        try:
+            if self._file is None:
+                self._open()
+            payload = update.model_dump(mode="json", exclude_unset=True, by_alias=True)
+            self._write({'ts': round(time.time(), 4), 'update': self._anonymize(payload)})
+            self.recorded += 1
+
+            now = time.monotonic()
+            if now - self._flushed_at >= FLUSH_INTERVAL:
+                self._file.flush()
+                self._flushed_at = now
+        except Exception as e:
+            logging.error(f"Ошибка записи обновления: {e}")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        self.record(event)
+        return await handler(event, data)
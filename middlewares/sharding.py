@@ -0,0 +1,36 @@
+# middlewares/sharding.py
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from utils.cluster import Cluster
+
+
+class ShardingMiddleware(BaseMiddleware):
+    """Передает обновления процессам-обработчикам вместо обработки на месте.
+
+    Вешается на dp.update процесса-приемника. Обновления одного
+    пользователя всегда уходят в один и тот же процесс.
+    """
+
+    def __init__(self, cluster: Cluster):
+        self.cluster = cluster
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        chat = data.get("event_chat")
+        if user is not None:
+            key = user.id
+        elif chat is not None:
+            key = chat.id
+        else:
+            key = event.update_id
+
+        self.cluster.dispatch(key, event.model_dump(mode="json", exclude_unset=True, by_alias=True))
+        return None
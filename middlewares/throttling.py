@@ -0,0 +1,171 @@
+# middlewares/throttling.py
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Message, CallbackQuery
+
+from database.db_handler import DatabaseHandler
+
+db = DatabaseHandler()
+
+THROTTLE_RATE = 1.0  # Запросов в секунду на пользователя (в среднем)
+THROTTLE_BURST = 5  # Сколько запросов подряд можно сделать без ожидания
+NOTICE_WINDOW = 30  # Секунд между предупреждениями одному пользователю
+IDLE_TTL = 600  # Секунд без запросов, после которых состояние пользователя удаляется
+
+# Тяжелые команды (много запросов к базе): (запросов в секунду, запас)
+COMMAND_LIMITS = {
+    'progress': (0.2, 2),
+    'assignments': (0.2, 3),
+    'export_grades': (0.05, 1),
+}
+
+SLOW_DOWN_TEXT = "⏳ Слишком много запросов. Подождите немного и попробуйте снова."
+
+
+class TokenBucket:
+    """Корзина токенов: запас burst, пополнение rate в секунду"""
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, rate: float, burst: float, now: float) -> bool:
+        """Пополнить запас; True, если есть токен на запрос"""
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        return self.tokens >= 1
+
+
+class UserThrottle:
+    """Состояние пользователя: общая корзина, корзины команд, время предупреждения"""
+    __slots__ = ('bucket', 'commands', 'notified_at', 'seen')
+
+    def __init__(self, burst: float, now: float):
+        self.bucket = TokenBucket(burst, now)
+        self.commands: Optional[Dict[str, TokenBucket]] = None  # Создаются по первому вызову
+        self.notified_at = 0.0
+        self.seen = now
+
+
+def parse_command_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    """Разобрать строку вида 'progress:0.2:2,assignments:0.2:3'; скорость 0 - без отдельного лимита"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        command, rate, burst = item.split(":")
+        limits[command.lstrip("/")] = (float(rate), float(burst))
+    return limits
+
+
+def _check_limit(name: str, rate: float, burst: float):
+    if rate < 0 or burst < 1:
+        raise ValueError(f"Лимит {name}: скорость должна быть >= 0, запас >= 1 (получено {rate}:{burst})")
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Ограничение частоты запросов от одного пользователя.
+
+    Общая корзина на пользователя и отдельные корзины для тяжелых команд.
+    Лишние запросы отбрасываются до обращения к базе, пользователь получает
+    вежливое предупреждение не чаще раза в NOTICE_WINDOW секунд.
+    Администраторы и части альбомов не ограничиваются. Состояние
+    пользователей хранится в OrderedDict по времени последнего запроса,
+    неактивные вытесняются с начала за O(1) на запрос.
+    """
+
+    def __init__(self, rate: float = THROTTLE_RATE, burst: float = THROTTLE_BURST,
+                 command_limits: Optional[Dict[str, Tuple[float, float]]] = None,
+                 notice_window: float = NOTICE_WINDOW, idle_ttl: float = IDLE_TTL):
+        if rate <= 0:
+            raise ValueError("THROTTLE_RATE должен быть больше 0 (0 - не подключать ограничение)")
+        _check_limit("THROTTLE", rate, burst)
+        command_limits = COMMAND_LIMITS if command_limits is None else command_limits
+        for command, (command_rate, command_burst) in command_limits.items():
+            _check_limit(f"/{command}", command_rate, command_burst)
+        self.rate = rate
+        self.burst = burst
+        # Скорость 0 - у команды нет отдельной корзины, действует только общая
+        self.command_limits = {command: limit for command, limit in command_limits.items() if limit[0] > 0}
+        self.notice_window = notice_window
+        # Корзина, простоявшая дольше burst/rate, полна - удалять ее без потерь
+        self.idle_ttl = max(idle_ttl, burst / rate,
+                            *(b / r for r, b in self.command_limits.values()))
+        self._users: "OrderedDict[int, UserThrottle]" = OrderedDict()
+        self.dropped = 0
+
+    def active_users(self) -> int:
+        return len(self._users)
+
+    def _evict(self, now: float):
+        while self._users:
+            user_id, throttle = next(iter(self._users.items()))
+            if now - throttle.seen < self.idle_ttl:
+                break
+            del self._users[user_id]
+
+    @staticmethod
+    def _command(event: TelegramObject) -> Optional[str]:
+        if not isinstance(event, Message) or not event.text or not event.text.startswith("/"):
+            return None
+        parts = event.text[1:].split(maxsplit=1)
+        return parts[0].split("@")[0].lower() if parts else None
+
+    def _allow(self, user_id: int, command: Optional[str], now: float) -> bool:
+        throttle = self._users.get(user_id)
+        if throttle is None:
+            throttle = self._users[user_id] = UserThrottle(self.burst, now)
+        else:
+            self._users.move_to_end(user_id)
+        throttle.seen = now
+
+        if not throttle.bucket.refill(self.rate, self.burst, now):
+            return False
+
+        # Токены списываются, только если запрос пропущен обеими корзинами
+        limit = self.command_limits.get(command) if command else None
+        if limit is not None:
+            if throttle.commands is None:
+                throttle.commands = {}
+            bucket = throttle.commands.get(command)
+            if bucket is None:
+                bucket = throttle.commands[command] = TokenBucket(limit[1], now)
+            if not bucket.refill(limit[0], limit[1], now):
+                return False
+            bucket.tokens -= 1
+
+        throttle.bucket.tokens -= 1
+        return True
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None or (isinstance(event, Message) and event.media_group_id):
+            return await handler(event, data)
+
+        now = time.monotonic()
+        self._evict(now)
+        if self._allow(user.id, self._command(event), now):
+            return await handler(event, data)
+
+        # Проверка роли только для отбрасываемых запросов (кэш ролей в памяти)
+        if await db.is_admin(user.id):
+            return await handler(event, data)
+
+        self.dropped += 1
+        throttle = self._users[user.id]
+        notify = now - throttle.notified_at >= self.notice_window
+        if notify:
+            throttle.notified_at = now
+
+        if isinstance(event, CallbackQuery):
+            await event.answer(SLOW_DOWN_TEXT if notify else None)
+        elif notify and isinstance(event, Message):
+            await event.answer(SLOW_DOWN_TEXT)
+        return None
@@ -18,6 +18,7 @@ class AssignmentStates(StatesGroup):
     waiting_for_grade = State()
     waiting_for_difficulty = State()
     waiting_for_due_date = State()
+    waiting_for_publish_date = State()
 
 class SolutionStates(StatesGroup):
     waiting_for_solution = State()
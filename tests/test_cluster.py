@@ -0,0 +1,102 @@
+# tests/test_cluster.py
+import asyncio
+import os
+import time
+
+from utils import cluster as cluster_module
+from utils.cluster import Cluster, serve_updates
+
+HANDLE_SECONDS = 0.5
+
+
+class SlowDispatcher:
+    """Диспетчер-заглушка: обновление обрабатывается HANDLE_SECONDS"""
+
+    async def feed_raw_update(self, bot, update):
+        await asyncio.sleep(HANDLE_SECONDS)
+
+
+def run_worker(index, updates, jobs, progress):
+    asyncio.run(serve_updates(SlowDispatcher(), None, updates, progress, index))
+
+
+async def wait_for(condition, timeout: float = 20):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "не дождались"
+        await asyncio.sleep(0.05)
+
+
+def test_in_flight_counts_updates_in_workers():
+    """Приемник видит обновления в очередях и в обработке у обработчиков"""
+
+    async def scenario():
+        cluster = Cluster(2, run_worker, stop_timeout=5)
+        cluster.start()
+        try:
+            assert cluster.in_flight() == 0
+            for key in range(4):
+                cluster.dispatch(key, {'update_id': key})
+            busy = cluster.in_flight()
+            await wait_for(lambda: cluster.in_flight() == 0)
+        finally:
+            await cluster.stop()
+        return busy
+
+    assert asyncio.run(scenario()) == 4
+
+
+class CrashingDispatcher(SlowDispatcher):
+    """Обновление с 'crash' роняет процесс"""
+
+    async def feed_raw_update(self, bot, update):
+        if update.get('crash'):
+            os._exit(1)
+        await super().feed_raw_update(bot, update)
+
+
+def run_crashing_worker(index, updates, jobs, progress):
+    asyncio.run(serve_updates(CrashingDispatcher(), None, updates, progress, index))
+
+
+def fail_at_start(index, updates, jobs, progress):
+    raise RuntimeError("ошибка конфигурации")
+
+
+def test_crashed_worker_restarted_with_new_queue():
+    """Перезапущенный обработчик получает новые обновления; потерянные учтены"""
+
+    async def scenario():
+        cluster = Cluster(1, run_crashing_worker, stop_timeout=5)
+        cluster.start()
+        try:
+            cluster.dispatch(0, {'update_id': 1, 'crash': True})
+            await wait_for(lambda: cluster.restarts == 1)
+            cluster.dispatch(0, {'update_id': 2})
+            assert cluster.in_flight() == 1
+            await wait_for(lambda: cluster.in_flight() == 0)
+        finally:
+            await cluster.stop()
+        return cluster.lost_updates
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_worker_failing_at_start_given_up(monkeypatch):
+    """Обработчик, падающий при запуске, перезапускается с растущей паузой, затем - on_failure"""
+    monkeypatch.setattr(cluster_module, "SUPERVISE_INTERVAL", 0.05)
+    monkeypatch.setattr(cluster_module, "MAX_QUICK_FAILURES", 3)
+    failed = []
+
+    async def scenario():
+        cluster = Cluster(1, fail_at_start, stop_timeout=5)
+        cluster.start(on_failure=failed.append)
+        try:
+            await wait_for(lambda: failed, timeout=60)
+            await asyncio.sleep(0.5)
+        finally:
+            await cluster.stop()
+        return cluster.restarts
+
+    assert asyncio.run(scenario()) == 2
+    assert failed == [0]
@@ -0,0 +1,46 @@
+# tests/test_export.py
+import asyncio
+import csv
+
+import aiosqlite
+
+from database.db_handler import DatabaseHandler
+from utils import export_utils
+from utils.export_utils import GradebookExporter
+
+STUDENT_ID = 100
+
+
+def test_duplicate_results_pick_latest_graded(tmp_path, monkeypatch):
+    """Из нескольких решений одного задания в журнал попадает последнее оцененное"""
+    db_path = str(tmp_path / "bot.db")
+    monkeypatch.setattr(export_utils, "db", DatabaseHandler(db_path))
+    monkeypatch.setattr(export_utils, "EXPORT_DIR", str(tmp_path / "export"))
+
+    async def scenario():
+        await export_utils.db.init_db()
+        async with aiosqlite.connect(db_path) as conn:
+            await conn.execute(
+                "INSERT INTO users (telegram_id, first_name, last_name, grade, is_active) VALUES (?, 'Иван', 'Иванов', 5, TRUE)",
+                (STUDENT_ID,))
+            cursor = await conn.execute(
+                "INSERT INTO assignments (title, description, grade_level) VALUES ('Дроби', '', 5)")
+            graded_only = cursor.lastrowid
+            cursor = await conn.execute(
+                "INSERT INTO assignments (title, description, grade_level) VALUES ('Уравнения', '', 5)")
+            mixed = cursor.lastrowid
+            await conn.executemany(
+                "INSERT INTO results (user_id, assignment_id, score, max_score, completed_date) VALUES (?, ?, ?, ?, ?)",
+                [(STUDENT_ID, graded_only, 9, 10, '2024-01-01 10:00:00'),
+                 (STUDENT_ID, graded_only, 4, 10, '2024-01-03 10:00:00'),
+                 (STUDENT_ID, graded_only, 7, 10, '2024-01-02 10:00:00'),
+                 (STUDENT_ID, mixed, 6, 10, '2024-01-01 10:00:00'),
+                 (STUDENT_ID, mixed, None, None, '2024-01-05 10:00:00')])
+            await conn.commit()
+        return await GradebookExporter.export(5, 'csv')
+
+    path, students = asyncio.run(scenario())
+    with open(path, encoding='utf-8-sig', newline='') as handle:
+        rows = list(csv.reader(handle))
+    assert students == 1
+    assert rows[1][4:] == ["4/10", "6/10"]
@@ -0,0 +1,65 @@
+# tests/test_maintenance.py
+import asyncio
+import logging
+import os
+import sqlite3
+import subprocess
+import sys
+
+import aiosqlite
+
+from database.db_handler import DatabaseHandler
+from database.maintenance import DatabaseMaintenance
+from tests.conftest import ROOT
+
+
+def test_run_with_fts_tables(tmp_path):
+    """Проход обслуживания на полной схеме (с таблицами FTS5) не падает и не трогает их служебные таблицы"""
+    db_path = str(tmp_path / "bot.db")
+
+    async def scenario():
+        await DatabaseHandler(db_path).init_db()
+        maintenance = DatabaseMaintenance()
+        maintenance.configure(db_path)
+        report = await maintenance.run(vacuum=True, force=True)
+        async with aiosqlite.connect(db_path) as conn:
+            tables = [table for table, _ in await maintenance.stale_tables(conn)]
+            cursor = await conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name LIKE '%fts%'")
+            fts_objects = (await cursor.fetchone())[0]
+        return report, tables, fts_objects
+
+    report, tables, fts_objects = asyncio.run(scenario())
+    assert fts_objects > 0
+    assert 'checkpointed_bytes' in report
+    assert not any('_fts' in table for table in report['analyzed'] + tables)
+
+
+def test_legacy_database_not_vacuumed_on_start(tmp_path, caplog):
+    """Старая база без auto_vacuum=INCREMENTAL при запуске не переписывается; перевод - отдельным скриптом"""
+    db_path = str(tmp_path / "bot.db")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE legacy (id INTEGER PRIMARY KEY, payload TEXT)")
+        conn.executemany("INSERT INTO legacy (payload) VALUES (?)", [("x" * 1000,)] * 200)
+        conn.execute("DELETE FROM legacy")
+    free_before = sqlite3.connect(db_path).execute("PRAGMA freelist_count").fetchone()[0]
+
+    async def scenario():
+        await DatabaseHandler(db_path).init_db()
+        maintenance = DatabaseMaintenance()
+        maintenance.configure(db_path)
+        return await maintenance.run(force=True), await DatabaseHandler(db_path).get_last_maintenance()
+
+    with caplog.at_level(logging.WARNING):
+        report, history = asyncio.run(scenario())
+    assert free_before > 0
+    assert not report['incremental_vacuum']
+    assert report['freelist_bytes'] > 0
+    assert "convert_auto_vacuum" in caplog.text
+    assert 'optimize' in {entry['operation'] for entry in history}
+
+    tool = os.path.join(ROOT, "tools", "convert_auto_vacuum.py")
+    result = subprocess.run([sys.executable, tool, "--db", db_path, "--convert"], capture_output=True, text=True)
+    assert result.returncode == 0, result.stdout + result.stderr
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
@@ -0,0 +1,14 @@
+# tests/test_metrics.py
+import asyncio
+
+from utils.metrics import PREFIX, MetricsRegistry
+
+
+def test_label_values_escaped():
+    """Обратная косая черта, кавычка и перевод строки в метке экранируются по формату Prometheus"""
+    registry = MetricsRegistry()
+    registry.counter('errors_total', 'Ошибки')
+    registry.inc('errors_total', handler='a\\b "c"\nd')
+
+    text = asyncio.run(registry.render())
+    assert f'{PREFIX}_errors_total{{handler="a\\\\b \\"c\\"\\nd"}} 1' in text.splitlines()
@@ -0,0 +1,48 @@
+# tests/test_quotas.py
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from handlers import quotas
+
+
+class FakeDb:
+    def __init__(self):
+        self.overrides = []
+
+    async def is_admin(self, user_id):
+        return True
+
+    async def set_quota_override(self, user_id, max_files, max_bytes, set_by):
+        self.overrides.append((user_id, max_files, max_bytes))
+
+    async def get_storage_usage(self, user_id):
+        return {'files': 0, 'bytes': 0, 'max_files': None, 'max_bytes': None}
+
+
+def run_command(monkeypatch, text):
+    fake_db = FakeDb()
+    monkeypatch.setattr(quotas, "db", fake_db)
+    answers = []
+
+    async def answer(reply):
+        answers.append(reply)
+
+    message = SimpleNamespace(text=text, from_user=SimpleNamespace(id=1), answer=answer)
+    asyncio.run(quotas.quota_command(message))
+    return fake_db.overrides, answers
+
+
+@pytest.mark.parametrize("args", ["1 inf", "1 -inf", "1 nan", "1 1e300", "99999999999999999999 1", "-1 1"])
+def test_quota_rejects_out_of_range(monkeypatch, args):
+    """Бесконечность, nan и значения за пределами INTEGER SQLite - подсказка, а не исключение"""
+    overrides, answers = run_command(monkeypatch, f"/quota 42 {args}")
+    assert overrides == []
+    assert answers[0].startswith("❌ Используйте")
+
+
+def test_quota_sets_limits(monkeypatch):
+    overrides, answers = run_command(monkeypatch, "/quota 42 10 1,5")
+    assert overrides == [(42, 10, int(1.5 * quotas.MB))]
+    assert answers[0].startswith("✅")
@@ -0,0 +1,63 @@
+# tests/test_reachability.py
+import asyncio
+import multiprocessing
+from types import SimpleNamespace
+
+import aiosqlite
+
+from database.cache import unreachable_cache
+from database.db_handler import DatabaseHandler
+from middlewares.reachability import ReachabilityMiddleware
+from middlewares import reachability
+
+STUDENT_ID = 100
+
+
+def mark_unreachable(db_path: str):
+    """Процесс-приемник: рассылка планировщика не доставлена ученику"""
+    asyncio.run(DatabaseHandler(db_path).mark_users_unreachable([STUDENT_ID]))
+
+
+def test_restored_when_marked_by_other_process(tmp_path, monkeypatch):
+    """Обработчик возвращает ученика в рассылки, хотя отметку поставил другой процесс"""
+    db_path = str(tmp_path / "bot.db")
+    db = DatabaseHandler(db_path)
+    monkeypatch.setattr(reachability, "db", db)
+    monkeypatch.setattr(unreachable_cache, "ttl", 0.2)
+
+    async def unreachable_since():
+        async with aiosqlite.connect(db_path) as conn:
+            cursor = await conn.execute("SELECT unreachable_since FROM users WHERE telegram_id = ?", (STUDENT_ID,))
+            return (await cursor.fetchone())[0]
+
+    async def handler(event, data):
+        return "handled"
+
+    async def student_writes():
+        data = {'event_from_user': SimpleNamespace(id=STUDENT_ID)}
+        return await ReachabilityMiddleware()(handler, object(), data)
+
+    async def prepare():
+        await db.init_db()
+        async with aiosqlite.connect(db_path) as conn:
+            await conn.execute("INSERT INTO users (telegram_id, first_name, grade, is_active) VALUES (?, 'Иван', 5, TRUE)",
+                               (STUDENT_ID,))
+            await conn.commit()
+        # Обработчик загрузил кэш при запуске, пока ученик был доступен
+        await db.load_unreachable_users()
+
+    asyncio.run(prepare())
+    process = multiprocessing.get_context("spawn").Process(target=mark_unreachable, args=(db_path,))
+    process.start()
+    process.join(30)
+    assert process.exitcode == 0
+
+    async def scenario():
+        marked = await unreachable_since()
+        await asyncio.sleep(unreachable_cache.ttl)
+        assert await student_writes() == "handled"
+        return marked, await unreachable_since()
+
+    marked, restored = asyncio.run(scenario())
+    assert marked is not None
+    assert restored is None
@@ -0,0 +1,32 @@
+# tests/test_registration.py
+import ast
+import os
+
+from tests.conftest import ROOT
+
+MAIN_PATH = os.path.join(ROOT, "main.py")
+
+
+def _is_main_guard(node: ast.stmt) -> bool:
+    return (isinstance(node, ast.If) and isinstance(node.test, ast.Compare)
+            and isinstance(node.test.left, ast.Name) and node.test.left.id == "__name__")
+
+
+def test_main_guard_is_last():
+    """asyncio.run(main()) блокирует модуль: обработчики ниже него не регистрируются при python main.py"""
+    with open(MAIN_PATH, encoding="utf-8") as f:
+        body = ast.parse(f.read()).body
+    guards = [index for index, node in enumerate(body) if _is_main_guard(node)]
+    assert guards == [len(body) - 1]
+
+
+def test_bulk_approval_handlers_registered(monkeypatch):
+    """Команда /approve_all и кнопки массового одобрения зарегистрированы в диспетчере"""
+    monkeypatch.setenv("BOT_TOKEN", "123456:" + "A" * 35)
+    monkeypatch.setenv("ADMIN_ID", "1")
+    monkeypatch.setenv("TELEGRAM_API_URL", "http://127.0.0.1:9")
+    import main
+
+    names = {handler.callback.__name__ for observer in (main.dp.message, main.dp.callback_query)
+             for handler in observer.handlers}
+    assert {"approve_all_command", "bulk_approve_callback"} <= names
@@ -0,0 +1,93 @@
+# tests/test_scheduler.py
+import asyncio
+import sqlite3
+from datetime import datetime, timedelta
+
+import utils.scheduler as scheduler_module
+from database.db_handler import DatabaseHandler
+from utils.scheduler import Scheduler
+
+
+def test_worker_jobs_reach_ingress_without_polling(tmp_path, monkeypatch):
+    """Задача, созданная в процессе-обработчике, передается планировщику и выполняется один раз"""
+    db = DatabaseHandler(str(tmp_path / "bot.db"))
+    monkeypatch.setattr(scheduler_module, "db", db)
+    reads = []
+    get_pending_jobs = db.get_pending_jobs
+
+    async def counting_get_pending_jobs(after_id=0):
+        jobs = await get_pending_jobs(after_id)
+        reads.append((after_id, len(jobs)))
+        return jobs
+
+    monkeypatch.setattr(db, "get_pending_jobs", counting_get_pending_jobs)
+
+    async def scenario():
+        await db.init_db()
+        fired = []
+
+        async def handler(job):
+            fired.append(job['object_id'])
+
+        ingress, worker = Scheduler(), Scheduler()
+        ingress.register('publish', handler)
+        # Проверка базы - только страховка: без уведомления задача не пришла бы минуту
+        await ingress.start(sync_interval=60)
+        worker.forward_to(ingress.add)
+        await worker.schedule('publish', 7, datetime.now() + timedelta(seconds=0.2))
+        await asyncio.sleep(0.6)
+
+        # Уведомление потерялось: задачу находит проверка базы, читая только новые строки
+        lost_id = await db.add_scheduled_job('publish', 8, (datetime.now() + timedelta(seconds=0.2))
+                                             .strftime(scheduler_module.DATETIME_FORMAT))
+        await ingress._load_pending()
+        await ingress._load_pending()
+        await asyncio.sleep(0.6)
+        await ingress.stop(1)
+        return fired, lost_id
+
+    fired, lost_id = asyncio.run(scenario())
+    assert fired == [7, 8]
+    assert [after_id for after_id, _ in reads] == [0, 0, lost_id]
+
+
+def test_loop_survives_database_errors(tmp_path, monkeypatch):
+    """Ошибка базы при отметке задачи не останавливает планировщик: следующие задачи выполняются"""
+    db = DatabaseHandler(str(tmp_path / "bot.db"))
+    monkeypatch.setattr(scheduler_module, "db", db)
+    monkeypatch.setattr(scheduler_module, "ERROR_PAUSE", 0.05)
+    finish_scheduled_job = db.finish_scheduled_job
+    failures = []
+
+    async def locked_for_first_job(job_id, status):
+        # И отметка 'done', и отметка 'failed' после нее
+        if len(failures) < 2:
+            failures.append(status)
+            raise sqlite3.OperationalError("database is locked")
+        await finish_scheduled_job(job_id, status)
+
+    monkeypatch.setattr(db, "finish_scheduled_job", locked_for_first_job)
+
+    async def scenario():
+        await db.init_db()
+        fired = []
+
+        async def handler(job):
+            fired.append(job['object_id'])
+
+        scheduler = Scheduler()
+        scheduler.register('publish', handler)
+        await scheduler.start()
+        soon = datetime.now() + timedelta(seconds=0.1)
+        await scheduler.schedule('publish', 1, soon)
+        await scheduler.schedule('unknown', 2, soon)  # Без обработчика - тоже отметка в базе
+        await scheduler.schedule('publish', 3, soon + timedelta(seconds=0.2))
+        await asyncio.sleep(0.8)
+        alive = not scheduler._task.done()
+        await scheduler.stop(1)
+        return fired, alive
+
+    fired, alive = asyncio.run(scenario())
+    assert failures == ['done', 'failed']
+    assert alive
+    assert fired == [1, 3]
@@ -0,0 +1,158 @@
+# tests/test_shutdown.py
+"""SIGTERM посреди нагрузки: бот запускается отдельным процессом (python main.py,
+polling) против локальной заглушки Bot API и останавливается настоящим
+сигналом, как при деплое."""
+import asyncio
+import itertools
+import os
+import signal
+import sys
+import time
+
+from aiohttp import web
+
+from database.db_handler import DatabaseHandler
+from tests.conftest import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+from loadtest import FAKE_TOKEN, FakeBotApi  # noqa: E402
+
+ADMIN_ID = 1
+STUDENTS = [100000 + i for i in range(40)]
+VISITORS = [900000 + i for i in range(10)]  # Их /start в обработке в момент SIGTERM
+STUDENT_LATENCY = 0.1  # Рассылка 40 уведомлений идет несколько секунд
+VISITOR_LATENCY = 2.0
+
+
+class PollingBotApi(FakeBotApi):
+    """Заглушка Bot API с getUpdates: бот получает обновления как от Telegram"""
+
+    def __init__(self):
+        super().__init__()
+        self.updates = []
+        self.offset = 0
+        self.polls = 0
+        self.delivered = []  # (chat_id, text) - ответ на sendMessage получен ботом
+        self._new_updates = asyncio.Event()
+        self._ids = itertools.count(1)
+
+    def push(self, user_id: int, text: str = None, callback: str = None):
+        update_id = next(self._ids)
+        sender = {'id': user_id, 'is_bot': False, 'first_name': f"U{user_id}"}
+        message = {'message_id': update_id, 'date': int(time.time()),
+                   'chat': {'id': user_id, 'type': 'private'}, 'from': sender}
+        if callback is None:
+            message['text'] = text
+            if text.startswith("/"):
+                message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+            self.updates.append({'update_id': update_id, 'message': message})
+        else:
+            self.updates.append({'update_id': update_id, 'callback_query': {
+                'id': str(update_id), 'from': sender, 'chat_instance': str(user_id),
+                'data': callback, 'message': {**message, 'text': "…"}
+            }})
+        self._new_updates.set()
+        return update_id
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        params = await request.post()
+        self.calls[method] += 1
+
+        if method == "getupdates":
+            self.polls += 1
+            self.offset = int(params.get("offset") or 0)
+            pending = [u for u in self.updates if u['update_id'] >= self.offset]
+            if not pending:
+                self._new_updates.clear()
+                try:
+                    await asyncio.wait_for(self._new_updates.wait(), min(float(params.get("timeout") or 0), 0.5))
+                except asyncio.TimeoutError:
+                    pass
+                pending = [u for u in self.updates if u['update_id'] >= self.offset]
+            return web.json_response({'ok': True, 'result': pending})
+
+        if method == "sendmessage":
+            chat_id = int(params["chat_id"])
+            await asyncio.sleep(VISITOR_LATENCY if chat_id in VISITORS else STUDENT_LATENCY)
+            self.delivered.append((chat_id, params.get("text") or ""))
+        return web.json_response({'ok': True, 'result': self._result(method, params)})
+
+
+async def wait_for(condition, timeout: float = 20):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "не дождались"
+        await asyncio.sleep(0.05)
+
+
+async def seed(db_path: str):
+    db = DatabaseHandler(db_path)
+    await db.init_db()
+    for sid in STUDENTS:
+        await db.create_registration_request(sid, f"s{sid}", f"Ученик{sid}", f"Фамилия{sid}",
+                                             f"+7900{sid:07d}", sid % 11 + 1, "Мама", "Подготовка")
+    await db.approve_registrations_bulk(None, "Тест")
+
+
+def test_sigterm_under_load(tmp_path):
+    db_path = tmp_path / "tutor_bot.db"
+    log_path = tmp_path / "bot.log"
+
+    async def scenario():
+        await seed(str(db_path))
+        api = PollingBotApi()
+        await api.start()
+        env = {**os.environ, 'BOT_TOKEN': FAKE_TOKEN, 'ADMIN_ID': str(ADMIN_ID), 'TELEGRAM_API_URL': api.url,
+               'BOT_MODE': 'polling', 'WORKERS': '1', 'METRICS_PORT': '0', 'DIGEST_WINDOW': '0',
+               'SHUTDOWN_TIMEOUT': '20', 'BACKUP_TIME': '', 'ARCHIVE_AFTER_MONTHS': '0', 'FILE_GC_TIME': '',
+               'MAINTENANCE_INTERVAL': '0', 'LOG_FILE': str(log_path)}
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.join(ROOT, "main.py"), cwd=str(tmp_path), env=env,
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+        try:
+            await wait_for(lambda: api.polls > 0)
+
+            # Администратор создает задание для всех классов: уведомления встают в очередь рассылки
+            for step in ("/create_assignment", "Задание", "Решите задачи", "0"):
+                api.push(ADMIN_ID, step)
+            api.push(ADMIN_ID, callback="difficulty_medium")
+            api.push(ADMIN_ID, "нет")
+            api.push(ADMIN_ID, "сейчас")
+            api.push(ADMIN_ID, callback="create_assignment_without_files")
+            await wait_for(lambda: any(chat_id in STUDENTS for chat_id, _ in api.delivered))
+
+            # Новые посетители: их ответы ждут медленный Bot API
+            last = max(api.push(visitor, "/start") for visitor in VISITORS)
+            await wait_for(lambda: api.offset > last)
+            await asyncio.sleep(0.3)
+
+            notified_before = sum(chat_id in STUDENTS for chat_id, _ in api.delivered)
+            visitors_before = sum(chat_id in VISITORS for chat_id, _ in api.delivered)
+            process.send_signal(signal.SIGTERM)
+            returncode = await asyncio.wait_for(process.wait(), 40)
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            await api.stop()
+        return api, returncode, notified_before, visitors_before
+
+    api, returncode, notified_before, visitors_before = asyncio.run(scenario())
+
+    # Сигнал пришел посреди нагрузки
+    assert visitors_before == 0
+    assert notified_before < len(STUDENTS)
+
+    assert returncode == 0
+    # Обработчики в работе доработали: каждый посетитель получил ответ на /start
+    assert sorted(chat_id for chat_id, _ in api.delivered if chat_id in VISITORS) == VISITORS
+    # Очередь рассылки отправлена до закрытия сессии
+    notified = [chat_id for chat_id, text in api.delivered if chat_id in STUDENTS and "Новое задание" in text]
+    assert sorted(notified) == STUDENTS
+
+    log = log_path.read_text(encoding="utf-8")
+    assert "Остановка завершена" in log
+    # WAL перенесен в базу
+    wal = str(db_path) + "-wal"
+    assert not os.path.exists(wal) or os.path.getsize(wal) == 0
@@ -0,0 +1,46 @@
+# tests/test_solutions.py
+import asyncio
+
+import aiosqlite
+
+from database.db_handler import DatabaseHandler
+
+STUDENTS = [100, 101, 102, 103]
+
+
+async def prepare(db: DatabaseHandler) -> int:
+    await db.init_db()
+    async with aiosqlite.connect(db.db_path) as conn:
+        await conn.executemany("INSERT INTO users (telegram_id, first_name, grade, is_active) VALUES (?, 'Ученик', 5, TRUE)",
+                               [(sid,) for sid in STUDENTS])
+        cursor = await conn.execute("INSERT INTO assignments (title, description, grade_level) VALUES ('Дроби', '', 5)")
+        await conn.commit()
+        return cursor.lastrowid
+
+
+def test_resubmission_is_not_first(tmp_path):
+    """Первое решение - только новая строка; повторная отправка того же ученика первой не считается"""
+    db = DatabaseHandler(str(tmp_path / "bot.db"))
+
+    async def scenario():
+        assignment_id = await prepare(db)
+        first = await db.submit_solution(STUDENTS[0], assignment_id, "x = 1")
+        again = await db.submit_solution(STUDENTS[0], assignment_id, "x = 2")
+        other = await db.submit_solution(STUDENTS[1], assignment_id, "x = 2")
+        return first, again, other
+
+    (first_id, first), (again_id, again), (_, other) = asyncio.run(scenario())
+    assert first and not again and not other
+    assert again_id == first_id
+
+
+def test_concurrent_submissions_single_first(tmp_path):
+    """Одновременные отправки разных учеников: первое решение ровно одно"""
+    db = DatabaseHandler(str(tmp_path / "bot.db"))
+
+    async def scenario():
+        assignment_id = await prepare(db)
+        return await asyncio.gather(*(db.submit_solution(sid, assignment_id, "x = 1") for sid in STUDENTS))
+
+    results = asyncio.run(scenario())
+    assert sum(is_first for _, is_first in results) == 1
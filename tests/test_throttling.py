@@ -0,0 +1,128 @@
+# tests/test_throttling.py
+import asyncio
+import itertools
+from types import SimpleNamespace
+
+import pytest
+from aiogram.types import CallbackQuery, Message
+
+from middlewares import throttling
+from middlewares.throttling import SLOW_DOWN_TEXT, ThrottlingMiddleware, parse_command_limits
+
+USER_ID = 100
+ADMIN_ID = 1
+
+_ids = itertools.count(1)
+
+
+def message(text: str = "привет", user_id: int = USER_ID, media_group_id: str = None) -> Message:
+    return Message.model_validate({
+        'message_id': next(_ids), 'date': 0, 'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': "U"},
+        'text': text, 'media_group_id': media_group_id
+    })
+
+
+def callback(data: str = "grade_1", user_id: int = USER_ID) -> CallbackQuery:
+    return CallbackQuery.model_validate({
+        'id': str(next(_ids)), 'chat_instance': "1", 'data': data,
+        'from': {'id': user_id, 'is_bot': False, 'first_name': "U"}
+    })
+
+
+class Harness:
+    """Middleware с заглушками обработчика, проверки роли, часов и ответов пользователю"""
+
+    def __init__(self, monkeypatch, *args, **kwargs):
+        self.now = 1000.0
+        self.handled = []
+        self.replies = []
+        monkeypatch.setattr(throttling, "time", SimpleNamespace(monotonic=lambda: self.now))
+        monkeypatch.setattr(throttling, "db", SimpleNamespace(is_admin=self._is_admin))
+        monkeypatch.setattr(Message, "answer", self._reply)
+        monkeypatch.setattr(CallbackQuery, "answer", self._reply)
+        self.middleware = ThrottlingMiddleware(*args, **kwargs)
+
+    @staticmethod
+    async def _is_admin(user_id: int) -> bool:
+        return user_id == ADMIN_ID
+
+    async def _reply(self, text=None, **kwargs):
+        self.replies.append(text)
+
+    async def _handler(self, event, data):
+        self.handled.append(event)
+        return "handled"
+
+    def send(self, *events) -> list:
+        async def run():
+            return [await self.middleware(self._handler, event, {'event_from_user': event.from_user})
+                    for event in events]
+        return asyncio.run(run())
+
+
+def test_excess_updates_dropped_with_one_notice(monkeypatch):
+    harness = Harness(monkeypatch, rate=1, burst=2, command_limits={})
+    results = harness.send(*(message() for _ in range(4)))
+
+    assert results == ["handled", "handled", None, None]
+    assert len(harness.handled) == 2
+    assert harness.middleware.dropped == 2
+    # Предупреждение - одно на NOTICE_WINDOW
+    assert harness.replies == [SLOW_DOWN_TEXT]
+
+    harness.now += 1
+    assert harness.send(message()) == ["handled"]
+
+
+def test_callback_dropped_answers_query(monkeypatch):
+    harness = Harness(monkeypatch, rate=1, burst=1, command_limits={})
+    results = harness.send(callback(), callback(), callback())
+
+    assert results == ["handled", None, None]
+    # Кнопка не "зависает": ответ на каждый отброшенный запрос, текст - только в первом
+    assert harness.replies == [SLOW_DOWN_TEXT, None]
+
+
+def test_admin_not_throttled(monkeypatch):
+    harness = Harness(monkeypatch, rate=1, burst=1, command_limits={})
+    results = harness.send(*(message(user_id=ADMIN_ID) for _ in range(5)))
+
+    assert results == ["handled"] * 5
+    assert harness.replies == []
+
+
+def test_album_parts_not_throttled(monkeypatch):
+    harness = Harness(monkeypatch, rate=1, burst=1, command_limits={})
+    results = harness.send(*(message(media_group_id="album") for _ in range(10)))
+
+    assert results == ["handled"] * 10
+    assert harness.middleware.dropped == 0
+
+
+def test_command_limit(monkeypatch):
+    harness = Harness(monkeypatch, rate=1, burst=5, command_limits=parse_command_limits("progress:0.2:1"))
+    results = harness.send(message("/progress"), message("/progress@tutor_bot"), message("привет"))
+
+    # Вторая /progress отброшена отдельной корзиной, общий запас остался
+    assert results == ["handled", None, "handled"]
+
+
+def test_zero_command_rate_means_no_command_limit(monkeypatch):
+    harness = Harness(monkeypatch, rate=1, burst=5, command_limits=parse_command_limits("progress:0:1,assignments:0.2:3"))
+    assert 'progress' not in harness.middleware.command_limits
+    assert harness.middleware.command_limits['assignments'] == (0.2, 3)
+
+    # Запросы /progress ограничивает только общая корзина
+    results = harness.send(*(message("/progress") for _ in range(6)))
+    assert results == ["handled"] * 5 + [None]
+
+
+@pytest.mark.parametrize("rate, burst, commands", [
+    (0, 5, {}),
+    (1, 5, {'progress': (-1, 2)}),
+    (1, 0.5, {}),
+])
+def test_invalid_limits_rejected(rate, burst, commands):
+    with pytest.raises(ValueError):
+        ThrottlingMiddleware(rate, burst, commands)
@@ -0,0 +1,131 @@
+# tools/bench_concurrency.py
+"""Сравнение режимов обработки обновлений.
+
+Имитирует всплеск: USERS учеников одновременно шлют по одному тяжелому
+запросу (как /assignments) и по нескольку частей альбома, которые
+сохраняются через get_data/update_data (как process_solution_files).
+
+Режимы:
+  sequential - обновления по одному (handle_as_tasks=False)
+  concurrent - все параллельно, без упорядочивания (как start_polling по умолчанию)
+  ordered    - UserOrderingMiddleware: параллельно по пользователям, по очереди внутри
+
+Запуск из корня проекта:
+    python tools/bench_concurrency.py --users 50 --parts 9 --heavy-ms 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Bot, Dispatcher, Router, F, types  # noqa: E402
+from aiogram.filters import Command  # noqa: E402
+from aiogram.fsm.context import FSMContext  # noqa: E402
+from aiogram.types import Update  # noqa: E402
+
+from middlewares.ordering import UserOrderingMiddleware, setup_ordering  # noqa: E402
+
+FAKE_TOKEN = "123456:" + "A" * 35  # Бот не обращается к Telegram
+
+
+def build_dispatcher(mode: str, heavy_delay: float, io_delay: float, concurrency: int) -> Dispatcher:
+    dp = Dispatcher()
+    router = Router()
+
+    @router.message(Command("heavy"))
+    async def heavy(message: types.Message):
+        await asyncio.sleep(heavy_delay)
+
+    @router.message(F.photo)
+    async def album_part(message: types.Message, state: FSMContext):
+        data = await state.get_data()
+        await asyncio.sleep(io_delay)  # Запрос к базе между чтением и записью
+        await state.update_data(files=data.get('files', []) + [message.message_id])
+
+    dp.include_router(router)
+    if mode == "ordered":
+        setup_ordering(dp, UserOrderingMiddleware(concurrency))
+    return dp
+
+
+def build_updates(bot: Bot, users: int, parts: int):
+    updates = []
+    update_id = 0
+    for part in range(parts + 1):
+        for user_id in range(1, users + 1):
+            update_id += 1
+            message = {
+                'message_id': update_id, 'date': 0,
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': {'id': user_id, 'is_bot': False, 'first_name': 'Student'}
+            }
+            if part == 0:
+                message['text'] = '/heavy'
+            else:
+                message['photo'] = [{'file_id': f'f{update_id}', 'file_unique_id': f'u{update_id}',
+                                     'width': 1, 'height': 1}]
+            updates.append(Update.model_validate({'update_id': update_id, 'message': message},
+                                                 context={'bot': bot}))
+    return updates
+
+
+async def run_mode(mode: str, args) -> dict:
+    bot = Bot(FAKE_TOKEN)
+    dp = build_dispatcher(mode, args.heavy_ms / 1000, args.io_ms / 1000, args.concurrency)
+    updates = build_updates(bot, args.users, args.parts)
+    latencies = []  # От начала всплеска (все обновления пришли разом) до ответа
+
+    async def feed(update: Update):
+        await dp.feed_update(bot, update)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    if mode == "sequential":
+        for update in updates:
+            await feed(update)
+    else:
+        # Порядок создания задач совпадает с порядком прихода обновлений
+        await asyncio.gather(*(feed(update) for update in updates))
+    elapsed = time.perf_counter() - started
+
+    saved = 0
+    for user_id in range(1, args.users + 1):
+        state = dp.fsm.resolve_context(bot, chat_id=user_id, user_id=user_id)
+        saved += len((await state.get_data()).get('files', []))
+    await bot.session.close()
+
+    latencies.sort()
+    return {
+        'mode': mode,
+        'updates': len(updates),
+        'seconds': elapsed,
+        'per_second': len(updates) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        'lost_files': args.users * args.parts - saved
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--parts", type=int, default=9, help="частей альбома на ученика")
+    parser.add_argument("--heavy-ms", type=float, default=200, help="длительность тяжелого обработчика")
+    parser.add_argument("--io-ms", type=float, default=5, help="задержка между get_data и update_data")
+    parser.add_argument("--concurrency", type=int, default=32, help="лимит для режима ordered")
+    parser.add_argument("--modes", default="sequential,concurrent,ordered")
+    args = parser.parse_args()
+
+    print(f"{'режим':<12}{'обновл.':>8}{'сек':>9}{'в сек':>10}{'p50 мс':>10}{'p95 мс':>10}{'потеряно':>10}")
+    for mode in args.modes.split(","):
+        r = await run_mode(mode, args)
+        print(f"{r['mode']:<12}{r['updates']:>8}{r['seconds']:>9.2f}{r['per_second']:>10.1f}"
+              f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['lost_files']:>10}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
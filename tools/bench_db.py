@@ -0,0 +1,322 @@
+# tools/bench_db.py
+"""Замеры методов DatabaseHandler на базе реалистичного размера.
+
+База заполняется синтетическими данными заданной формы (ученики, задания,
+решения, файлы и их привязки), затем каждый метод вызывается:
+
+  cold - первый вызов: кэши процесса (роли, ростер) сброшены, страницы
+         файла базы вытеснены из кэша ОС (posix_fadvise, где доступно)
+  warm - повторные вызовы со случайными аргументами: p50, p95, среднее
+
+Результаты пишутся в JSON (--json) и сравниваются с сохраненным прогоном
+(--baseline): методы, у которых теплый p50 вырос больше чем в --threshold
+раз, отмечаются как регрессии, и скрипт завершается с кодом 1.
+
+Запуск из корня проекта:
+    python tools/bench_db.py --json bench_base.json
+    python tools/bench_db.py --json bench_new.json --baseline bench_base.json
+    python tools/bench_db.py --users 500 --assignments 200 --results 20000 --files 30000 --repeat 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.cache import role_cache, roster_cache  # noqa: E402
+from database.db_handler import DatabaseHandler  # noqa: E402
+from database.tracing import query_tracer  # noqa: E402
+
+ADMIN_ID = 1
+FIRST_STUDENT_ID = 100000
+DIFFICULTIES = ("easy", "medium", "hard")
+OBJECT_TYPES = (("solution", 0.8), ("assignment", 0.1), ("grade", 0.1))
+
+
+# === ЗАПОЛНЕНИЕ БАЗЫ ===
+
+def seed(db_path: str, args, rng: random.Random):
+    """Заполнить базу (схема уже создана init_db) одной транзакцией"""
+    now = datetime.now()
+
+    def moment(days: int) -> str:
+        return (now - timedelta(seconds=rng.randint(0, days * 86400))).strftime("%Y-%m-%d %H:%M:%S")
+
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute("INSERT OR IGNORE INTO admins (telegram_id, username, first_name, is_super_admin) "
+                     "VALUES (?, 'admin', 'Администратор', TRUE)", (ADMIN_ID,))
+        conn.executemany("""
+            INSERT INTO users (telegram_id, username, first_name, last_name, phone, grade,
+                               parent_contact, registration_date, is_active, unreachable_since)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, ((FIRST_STUDENT_ID + i, f"s{i}", f"Ученик{i}", f"Фамилия{i}", f"+7900{i:07d}",
+               rng.randint(1, 11), "Мама, +7911", moment(365),
+               rng.random() > 0.03, moment(30) if rng.random() < 0.02 else None)
+              for i in range(args.users)))
+
+        conn.executemany("""
+            INSERT INTO assignments (title, description, grade_level, difficulty, created_date,
+                                     due_date, is_active, created_by)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, ((f"Задание {i}", "Решите задачи из раздела. " * 8, rng.choice((0,) + tuple(range(1, 12))),
+               rng.choice(DIFFICULTIES), moment(365), moment(300) if rng.random() < 0.5 else None,
+               rng.random() > 0.1, ADMIN_ID)
+              for i in range(args.assignments)))
+
+        # Одно решение на пару (ученик, задание), как в submit_solution
+        pairs = set()
+        limit = min(args.results, args.users * args.assignments)
+        while len(pairs) < limit:
+            pairs.add((FIRST_STUDENT_ID + rng.randrange(args.users), rng.randint(1, args.assignments)))
+
+        def results():
+            for user_id, assignment_id in pairs:
+                graded = rng.random() < args.graded_share
+                max_score = rng.choice((5, 10, 20)) if graded else None
+                yield (user_id, assignment_id, "Решение: " + "x = 2; " * 20,
+                       rng.randint(0, max_score) if graded else None, max_score, moment(365),
+                       "Хорошо" if graded else None)
+
+        conn.executemany("""
+            INSERT INTO results (user_id, assignment_id, solution_text, score, max_score, completed_date, comment)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, results())
+        args.results = len(pairs)
+
+        conn.executemany("""
+            INSERT INTO files (file_id, file_unique_id, file_name, file_size, mime_type, file_type,
+                               uploaded_date, uploaded_by)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, ((f"file{i}", f"u{i}", f"photo_{i}.jpg", rng.randint(50_000, 3_000_000), "image/jpeg",
+               "photo", moment(365), FIRST_STUDENT_ID + rng.randrange(args.users))
+              for i in range(args.files)))
+
+        kinds, weights = zip(*OBJECT_TYPES)
+        object_ranges = {'solution': args.results, 'assignment': args.assignments, 'grade': args.results}
+
+        def attachments():
+            for file_id in range(1, args.files + 1):
+                kind = rng.choices(kinds, weights)[0]
+                yield file_id, kind, rng.randint(1, object_ranges[kind]), moment(365)
+
+        conn.executemany("""
+            INSERT INTO file_attachments (file_id, object_type, object_id, attached_date)
+            VALUES (?, ?, ?, ?)
+        """, attachments())
+
+        # Сводки прогресса пересчитает init_db при следующем запуске
+        conn.execute("DELETE FROM progress_rollups")
+    # Сброс версии схемы, иначе init_db пропустит DDL и пересчет сводок
+    conn.execute("PRAGMA user_version = 0")
+    conn.close()
+
+
+def evict_os_cache(db_path: str) -> bool:
+    """Вытеснить файл базы из кэша страниц ОС (для холодного вызова)"""
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    for path in (db_path, db_path + "-wal"):
+        if os.path.exists(path):
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+    return True
+
+
+# === МЕТОДЫ ДЛЯ ЗАМЕРА ===
+
+def build_cases(db: DatabaseHandler, args, rng: random.Random) -> dict:
+    """Имя метода -> функция, делающая один вызов со случайными аргументами"""
+
+    def student() -> int:
+        return FIRST_STUDENT_ID + rng.randrange(args.users)
+
+    def assignment() -> int:
+        return rng.randint(1, args.assignments)
+
+    def result() -> int:
+        return rng.randint(1, args.results)
+
+    async def iter_gradebook_rows():
+        async for _ in db.iter_gradebook_rows(rng.randint(1, 11)):
+            pass
+
+    return {
+        # Чтение
+        'get_user': lambda: db.get_user(student()),
+        'is_user_registered': lambda: db.is_user_registered(student()),
+        'is_admin': lambda: db.is_admin(student()),
+        'get_object_files': lambda: db.get_object_files('solution', result()),
+        'get_file_by_id': lambda: db.get_file_by_id(rng.randint(1, args.files)),
+        'get_user_stats': lambda: db.get_user_stats(student()),
+        'get_user_solutions': lambda: db.get_user_solutions(student()),
+        'get_progress_buckets': lambda: db.get_progress_buckets(student(), rng.choice(('week', 'month'))),
+        'get_ungraded_solutions': lambda: db.get_ungraded_solutions(),
+        'get_assignment_by_id': lambda: db.get_assignment_by_id(assignment()),
+        'get_assignments_for_grade': lambda: db.get_assignments_for_grade(rng.randint(1, 11)),
+        'get_all_assignments': lambda: db.get_all_assignments(),
+        'count_assignment_solutions': lambda: db.count_assignment_solutions(assignment()),
+        'get_students_without_solution': lambda: db.get_students_without_solution(assignment()),
+        'get_broadcast_recipients': lambda: db.get_broadcast_recipients(rng.randint(0, 11)),
+        'get_all_users': lambda: db.get_all_users(),
+        'get_pending_requests': lambda: db.get_pending_requests(),
+        'get_gradebook_assignments': lambda: db.get_gradebook_assignments(rng.randint(1, 11)),
+        'iter_gradebook_rows': iter_gradebook_rows,
+        # Запись
+        'submit_solution': lambda: db.submit_solution(student(), assignment(), "Решение: x = 2"),
+        'grade_solution': lambda: db.grade_solution(result(), rng.randint(0, 10), 10, "Хорошо"),
+        'save_file': lambda: db.save_file(f"new{rng.random()}", "u", "photo.jpg", 100_000,
+                                          "image/jpeg", "photo", student()),
+        'attach_file_to_object': lambda: db.attach_file_to_object(rng.randint(1, args.files), 'solution', result()),
+    }
+
+
+async def measure(call, db_path: str, args) -> dict:
+    role_cache.invalidate()
+    roster_cache.invalidate()
+    evicted = evict_os_cache(db_path)
+
+    started = time.perf_counter()
+    await call()
+    cold = time.perf_counter() - started
+
+    warm = []
+    deadline = time.perf_counter() + args.max_seconds
+    while len(warm) < args.repeat and (len(warm) < 3 or time.perf_counter() < deadline):
+        started = time.perf_counter()
+        await call()
+        warm.append(time.perf_counter() - started)
+
+    warm.sort()
+    return {
+        'cold_ms': round(cold * 1000, 3),
+        'cold_os_cache_evicted': evicted,
+        'warm_p50_ms': round(statistics.median(warm) * 1000, 3),
+        'warm_p95_ms': round(warm[min(len(warm) - 1, int(len(warm) * 0.95))] * 1000, 3),
+        'warm_mean_ms': round(statistics.fmean(warm) * 1000, 3),
+        'runs': len(warm)
+    }
+
+
+# === СРАВНЕНИЕ С БАЗОВЫМ ПРОГОНОМ ===
+
+def compare(current: dict, baseline: dict, threshold: float, min_delta_ms: float) -> list:
+    """Строки сравнения: (метод, метрика, было, стало, отношение, регрессия)"""
+    if baseline.get('shape') != current['shape']:
+        print("⚠️ Форма данных базового прогона отличается, сравнение приблизительное")
+
+    rows = []
+    for name, now in current['methods'].items():
+        before = baseline.get('methods', {}).get(name)
+        if not before:
+            continue
+        for metric in ('warm_p50_ms', 'cold_ms'):
+            ratio = now[metric] / before[metric] if before[metric] else float('inf')
+            # Холодный вызов - один замер, поэтому только для сведения
+            regression = (metric == 'warm_p50_ms' and ratio > threshold
+                          and now[metric] - before[metric] > min_delta_ms)
+            rows.append((name, metric, before[metric], now[metric], ratio, regression))
+    return rows
+
+
+# === ЗАПУСК ===
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix="tutorbot-benchdb-") if not args.workdir else args.workdir
+    os.makedirs(workdir, exist_ok=True)
+    db_path = os.path.join(workdir, "bench.db")
+
+    try:
+        db = DatabaseHandler(db_path)
+        await db.init_db()
+        started = time.perf_counter()
+        seed(db_path, args, rng)
+        await db.init_db()  # Первичное заполнение progress_rollups
+        seed_seconds = time.perf_counter() - started
+        print(f"База заполнена за {seed_seconds:.1f} с ({os.path.getsize(db_path) / 2 ** 20:.0f} МБ)")
+
+        query_tracer.configure(enabled=args.trace)
+        cases = build_cases(db, args, rng)
+        selected = args.methods.split(",") if args.methods else list(cases)
+
+        methods = {}
+        for name in selected:
+            methods[name] = await measure(cases[name], db_path, args)
+            r = methods[name]
+            print(f"{name:<32}{r['cold_ms']:>10.2f}{r['warm_p50_ms']:>10.2f}"
+                  f"{r['warm_p95_ms']:>10.2f}{r['runs']:>6}")
+
+        if args.trace:
+            print(f"\nСамые затратные запросы:\n{query_tracer.report(10)}")
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'created': datetime.now().isoformat(timespec="seconds"),
+        'shape': {'users': args.users, 'assignments': args.assignments, 'results': args.results,
+                  'files': args.files, 'graded_share': args.graded_share, 'seed': args.seed},
+        'environment': {'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+                        'platform': platform.platform()},
+        'seed_seconds': round(seed_seconds, 2),
+        'methods': methods
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--assignments", type=int, default=2000)
+    parser.add_argument("--results", type=int, default=200_000)
+    parser.add_argument("--files", type=int, default=300_000, help="файлов (у каждого одна привязка)")
+    parser.add_argument("--graded-share", type=float, default=0.7, help="доля оцененных решений")
+    parser.add_argument("--repeat", type=int, default=50, help="теплых вызовов на метод")
+    parser.add_argument("--max-seconds", type=float, default=10, help="предел времени теплых вызовов метода")
+    parser.add_argument("--methods", help="через запятую (по умолчанию все)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workdir", help="каталог для базы (не удаляется); по умолчанию временный")
+    parser.add_argument("--trace", action="store_true", help="включить трассировку SQL и показать топ запросов")
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--threshold", type=float, default=1.25, help="замедление, считающееся регрессией")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5, help="игнорировать разницу меньше этой")
+    args = parser.parse_args()
+
+    print(f"{'метод':<32}{'cold мс':>10}{'p50 мс':>10}{'p95 мс':>10}{'вызов':>6}")
+    report = asyncio.run(run(args))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare(report, baseline, args.threshold, args.min_delta_ms)
+        print(f"\n{'метод':<32}{'метрика':<13}{'было':>10}{'стало':>10}{'x':>7}")
+        for name, metric, before, now, ratio, regression in rows:
+            mark = "  ⚠️ регрессия" if regression else ""
+            print(f"{name:<32}{metric:<13}{before:>10.2f}{now:>10.2f}{ratio:>7.2f}{mark}")
+        regressions = [row for row in rows if row[5]]
+        if regressions:
+            print(f"\nРегрессий: {len(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
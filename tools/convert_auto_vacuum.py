@@ -0,0 +1,78 @@
+# tools/convert_auto_vacuum.py
+"""Перевод существующей базы в auto_vacuum=INCREMENTAL.
+
+Новая база создается сразу в этом режиме. Базу, созданную прежними
+версиями бота, переводит только полный VACUUM: он переписывает весь
+файл под монопольной блокировкой, поэтому выполняется отдельным шагом
+при остановленном боте. Без аргументов скрипт показывает размер базы и
+режим; --convert выполняет перевод. Для VACUUM нужно свободное место на
+диске не меньше размера базы.
+
+Запуск из корня проекта:
+    python tools/convert_auto_vacuum.py
+    python tools/convert_auto_vacuum.py --db tutor_bot.db --convert
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import time
+
+MODES = {0: "NONE", 1: "FULL", 2: "INCREMENTAL"}
+
+
+def describe(conn: sqlite3.Connection) -> dict:
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    return {
+        'mode': conn.execute("PRAGMA auto_vacuum").fetchone()[0],
+        'db_bytes': conn.execute("PRAGMA page_count").fetchone()[0] * page_size,
+        'freelist_bytes': conn.execute("PRAGMA freelist_count").fetchone()[0] * page_size
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="tutor_bot.db", help="база бота")
+    parser.add_argument("--convert", action="store_true", help="выполнить VACUUM (бот должен быть остановлен)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        parser.error(f"нет файла {args.db}")
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    try:
+        info = describe(conn)
+        print(f"База {args.db}: {info['db_bytes'] // 1024} КБ, свободно внутри {info['freelist_bytes'] // 1024} КБ, "
+              f"auto_vacuum={MODES.get(info['mode'], info['mode'])}")
+        if info['mode'] == 2:
+            print("✅ Перевод не нужен")
+            return
+        if not args.convert:
+            print("Остановите бота и запустите с --convert")
+            return
+
+        free_disk = shutil.disk_usage(os.path.dirname(os.path.abspath(args.db))).free
+        if free_disk < info['db_bytes']:
+            print(f"❌ На диске {free_disk // 1024} КБ, для VACUUM нужно не меньше {info['db_bytes'] // 1024} КБ")
+            sys.exit(1)
+
+        # Не ждем: если бот еще пишет в базу, перевод откладывается
+        conn.execute("PRAGMA busy_timeout = 0")
+        started = time.perf_counter()
+        try:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+        except sqlite3.OperationalError as e:
+            print(f"❌ База занята ({e}): остановите бота")
+            sys.exit(1)
+        elapsed = time.perf_counter() - started
+        info = describe(conn)
+        print(f"✅ Переведено за {elapsed:.1f} с: {info['db_bytes'] // 1024} КБ, "
+              f"auto_vacuum={MODES.get(info['mode'], info['mode'])}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,479 @@
+# tools/loadtest.py
+"""Нагрузочный тест бота без доступа к Telegram.
+
+Настоящие dp и обработчики из main.py работают с временной базой и
+локальной заглушкой Bot API (aiohttp на 127.0.0.1). Сценарии:
+
+  registration - ученики проходят /register и все шаги анкеты, затем /approve_all
+  broadcast    - администратор создает задание для всех классов (рассылка всем)
+  album        - ученики отправляют решение с альбомом фото и /done
+  grading      - администратор просматривает и оценивает все решения
+
+Сценарии выполняются по порядку; если предыдущий не выбран, нужные данные
+(ученики, задание, решения) создаются напрямую в базе. Ученики начинают
+сессии с частотой --rate в секунду (0 - все сразу), шаги внутри сессии
+идут по очереди с паузой --think-ms.
+
+--sigterm-after N посылает процессу SIGTERM через N секунд нагрузки:
+новые обновления перестают поступать (как после остановки polling),
+выполняется остановка бота (on_shutdown), отчет показывает, сколько
+обработчиков доработало и было прервано, сколько сообщений не ушло и
+нет ли решений без прикрепленных файлов. Это замер внутри одного
+процесса; настоящий путь остановки (сигнал процессу python main.py)
+проверяет tests/test_shutdown.py.
+
+Запуск из корня проекта:
+    python tools/loadtest.py --students 1000 --rate 100 --photos 5
+    python tools/loadtest.py --scenarios album,grading --api-latency-ms 50 --send-rate 1000
+    python tools/loadtest.py --scenarios album --students 500 --api-latency-ms 20 --sigterm-after 3
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import shutil
+import signal
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FAKE_TOKEN = "123456:" + "A" * 35  # Бот не обращается к Telegram
+ADMIN_ID = 1
+FIRST_STUDENT_ID = 100000
+SCENARIOS = ("registration", "broadcast", "album", "grading")
+
+
+# === ЗАГЛУШКА BOT API ===
+
+class FakeBotApi:
+    """Локальный Bot API: отвечает на методы бота и считает вызовы"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self._message_ids = itertools.count(1)
+        self._runner = None
+        self.url = ""
+
+    def _message(self, params) -> dict:
+        chat_id = int(params.get("chat_id") or 0)
+        return {
+            'message_id': next(self._message_ids), 'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'text': params.get("text") or params.get("caption") or ""
+        }
+
+    def _result(self, method: str, params):
+        if method == "getme":
+            return {'id': 42, 'is_bot': True, 'first_name': 'LoadTest', 'username': 'loadtest_bot'}
+        if method == "sendmediagroup":
+            return [self._message(params)]
+        if method.startswith("send") or method.startswith("edit"):
+            return self._message(params)
+        return True  # answerCallbackQuery, deleteWebhook и прочие
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = await request.post()
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.json_response({'ok': True, 'result': self._result(method.lower(), params)})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+
+# === ОБНОВЛЕНИЯ ===
+
+class UpdateFactory:
+    """Обновления Telegram от имени учеников и администратора"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._ids = itertools.count(1)
+
+    @staticmethod
+    def _user(user_id: int) -> dict:
+        return {'id': user_id, 'is_bot': False, 'first_name': f"Ученик{user_id}", 'username': f"s{user_id}"}
+
+    def _message(self, user_id: int, **fields) -> dict:
+        return {
+            'message_id': next(self._ids), 'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'}, 'from': self._user(user_id), **fields
+        }
+
+    def _update(self, payload: dict):
+        from aiogram.types import Update
+        return Update.model_validate({'update_id': next(self._ids), **payload}, context={'bot': self.bot})
+
+    def text(self, user_id: int, text: str):
+        entities = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}] \
+            if text.startswith("/") else None
+        message = self._message(user_id, text=text)
+        if entities:
+            message['entities'] = entities
+        return self._update({'message': message})
+
+    def photo(self, user_id: int, media_group_id: str, size: int = 200_000):
+        file_id = f"photo{next(self._ids)}"
+        return self._update({'message': self._message(user_id, media_group_id=media_group_id, photo=[
+            {'file_id': file_id, 'file_unique_id': file_id, 'width': 1280, 'height': 960, 'file_size': size}
+        ])})
+
+    def callback(self, user_id: int, data: str):
+        return self._update({'callback_query': {
+            'id': str(next(self._ids)), 'from': self._user(user_id), 'chat_instance': str(user_id),
+            'data': data, 'message': self._message(user_id, text="…")
+        }})
+
+
+# === ПРОГОН СЦЕНАРИЕВ ===
+
+class Runner:
+    def __init__(self, main, api: FakeBotApi, args):
+        self.main = main
+        self.api = api
+        self.args = args
+        self.updates = UpdateFactory(main.bot)
+        self.random = random.Random(args.seed)
+        self.students = [FIRST_STUDENT_ID + i for i in range(args.students)]
+        self.assignment_id = None
+        self.stopping = False  # После SIGTERM новые обновления не подаются
+        self.cancelled = 0
+
+    async def feed(self, update, latencies: list, errors: Counter):
+        started = time.perf_counter()
+        try:
+            await self.main.dp.feed_update(self.main.bot, update)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        except Exception as e:
+            errors[type(e).__name__] += 1
+        latencies.append(time.perf_counter() - started)
+
+    async def run_sessions(self, sessions: list) -> dict:
+        """Сессии стартуют с частотой --rate, шаги сессии идут по очереди"""
+        latencies, errors = [], Counter()
+        think = self.args.think_ms / 1000
+        api_before = self.api.calls.copy()
+
+        async def session(delay: float, steps):
+            await asyncio.sleep(delay)
+            for step in steps:
+                if self.stopping:
+                    return
+                await self.feed(step() if callable(step) else step, latencies, errors)
+                if think:
+                    await asyncio.sleep(think * self.random.uniform(0.5, 1.5))
+
+        started = time.perf_counter()
+        rate = self.args.rate
+        await asyncio.gather(*(session(i / rate if rate else 0, steps) for i, steps in enumerate(sessions)))
+        elapsed = time.perf_counter() - started
+
+        # Рассылка идет в фоне с ограничением скорости: замеряется отдельно
+        drain_started = time.perf_counter()
+        await self.main.sender.join()
+        drain = time.perf_counter() - drain_started
+
+        return {
+            'updates': len(latencies), 'seconds': elapsed, 'drain_seconds': drain,
+            'latencies': latencies, 'errors': dict(errors),
+            'api_calls': dict(self.api.calls - api_before)
+        }
+
+    # --- Сценарии ---
+
+    async def registration(self) -> dict:
+        u = self.updates
+        sessions = [[
+            u.text(sid, "/register"), u.text(sid, f"Фамилия{sid}"), u.text(sid, f"+7900{sid:07d}"),
+            u.text(sid, str(sid % 11 + 1)), u.text(sid, f"Мама, +7911{sid:07d}"),
+            u.text(sid, "Подготовка к экзамену по математике")
+        ] for sid in self.students]
+        result = await self.run_sessions(sessions)
+        # Одобрение - после всех заявок; рассылка приветствий входит в сценарий
+        approve = await self.run_sessions([[u.text(ADMIN_ID, "/approve_all")]])
+        result['updates'] += approve['updates']
+        result['seconds'] += approve['seconds']
+        result['drain_seconds'] += approve['drain_seconds']
+        result['latencies'] += approve['latencies']
+        result['api_calls'] = dict(Counter(result['api_calls']) + Counter(approve['api_calls']))
+        result['errors'] = dict(Counter(result['errors']) + Counter(approve['errors']))
+        result['check'] = f"учеников в базе: {len(await self.main.db.get_all_users())}"
+        return result
+
+    async def broadcast(self) -> dict:
+        u = self.updates
+        result = await self.run_sessions([[
+            u.text(ADMIN_ID, "/create_assignment"), u.text(ADMIN_ID, "Нагрузочное задание"),
+            u.text(ADMIN_ID, "Решите все задачи из раздела и приложите фото"), u.text(ADMIN_ID, "0"),
+            u.callback(ADMIN_ID, "difficulty_medium"), u.text(ADMIN_ID, "нет"), u.text(ADMIN_ID, "сейчас"),
+            u.callback(ADMIN_ID, "create_assignment_without_files")
+        ]])
+        assignments = await self.main.db.get_all_assignments()
+        self.assignment_id = max(a['id'] for a in assignments)
+        result['check'] = f"уведомлений отправлено: {result['api_calls'].get('sendMessage', 0)}"
+        return result
+
+    async def album(self) -> dict:
+        u = self.updates
+
+        def steps(sid: int) -> list:
+            group = f"album{sid}"
+            return [
+                u.callback(sid, f"solve_{self.assignment_id}"),
+                u.text(sid, "Решение: x = 2, проверка подстановкой"),
+                u.callback(sid, "add_solution_files"),
+                *(u.photo(sid, group) for _ in range(self.args.photos)),
+                u.text(sid, "/done")
+            ]
+
+        result = await self.run_sessions([steps(sid) for sid in self.students])
+        self.main.solution_digest.flush()
+        await self.main.sender.join()
+        result['check'] = f"решений на проверке: {len(await self.main.db.get_ungraded_solutions())}"
+        return result
+
+    async def grading(self) -> dict:
+        u = self.updates
+        solutions = await self.main.db.get_ungraded_solutions()
+        steps = [u.text(ADMIN_ID, "/ungraded")]
+        for solution in solutions:
+            steps += [
+                u.callback(ADMIN_ID, f"view_solution_{solution['id']}"),
+                u.callback(ADMIN_ID, f"grade_{solution['id']}"),
+                u.text(ADMIN_ID, f"{self.random.randint(5, 10)}/10"), u.text(ADMIN_ID, "-"),
+                u.callback(ADMIN_ID, "submit_grade_without_files")
+            ]
+        result = await self.run_sessions([steps])
+        result['check'] = f"осталось непроверенных: {len(await self.main.db.get_ungraded_solutions())}"
+        return result
+
+    # --- Данные для пропущенных сценариев ---
+
+    async def seed_students(self):
+        db = self.main.db
+        for sid in self.students:
+            await db.create_registration_request(sid, f"s{sid}", f"Ученик{sid}", f"Фамилия{sid}",
+                                                 f"+7900{sid:07d}", sid % 11 + 1, "Мама", "Подготовка")
+        await db.approve_registrations_bulk(None, "Нагрузочный тест")
+
+    async def seed_assignment(self):
+        self.assignment_id = await self.main.db.create_assignment(
+            "Нагрузочное задание", "Решите все задачи из раздела", 0, "medium", ADMIN_ID)
+
+    async def seed_solutions(self):
+        for sid in self.students:
+            await self.main.db.submit_solution(sid, self.assignment_id, "Решение: x = 2")
+
+    async def shutdown(self) -> dict:
+        """Остановка бота посреди нагрузки (как по SIGTERM при деплое)"""
+        main = self.main
+        self.stopping = True
+        in_flight, completed_before = main.inflight.in_flight(), main.inflight.completed
+        queued = main.sender.queue.qsize()
+
+        started = time.perf_counter()
+        await main.on_shutdown()
+        elapsed = time.perf_counter() - started
+
+        async with main.db.connect() as conn:
+            cursor = await conn.execute("""
+                SELECT COUNT(*), SUM(NOT EXISTS (
+                    SELECT 1 FROM file_attachments a WHERE a.object_type = 'solution' AND a.object_id = r.id
+                )) FROM results r
+            """)
+            solutions, without_files = await cursor.fetchone()
+        return {
+            'in_flight': in_flight, 'queued_messages': queued, 'shutdown_seconds': elapsed,
+            'finished': main.inflight.completed - completed_before - self.cancelled,
+            'cancelled': self.cancelled, 'unsent_messages': main.sender.queue.qsize(),
+            'solutions': solutions, 'solutions_without_files': without_files or 0
+        }
+
+    async def run(self, selected: list) -> list:
+        results = []
+        for name in SCENARIOS:
+            if name in selected:
+                result = await getattr(self, name)()
+                result['scenario'] = name
+                results.append(result)
+            elif name == "registration":
+                await self.seed_students()
+            elif name == "broadcast":
+                await self.seed_assignment()
+            elif name == "album" and "grading" in selected:
+                await self.seed_solutions()
+        return results
+
+
+# === ОТЧЕТ ===
+
+def percentile(ordered: list, q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def summarize(result: dict) -> dict:
+    ordered = sorted(result.pop('latencies'))
+    result.update({
+        'per_second': result['updates'] / result['seconds'] if result['seconds'] else 0.0,
+        'p50_ms': percentile(ordered, 0.50) * 1000,
+        'p95_ms': percentile(ordered, 0.95) * 1000,
+        'p99_ms': percentile(ordered, 0.99) * 1000,
+        'max_ms': (ordered[-1] if ordered else 0.0) * 1000
+    })
+    return result
+
+
+def print_shutdown(report: dict):
+    print(f"\nSIGTERM: в обработке {report['in_flight']} обновл., в очереди {report['queued_messages']} сообщ.; "
+          f"остановка за {report['shutdown_seconds']:.2f} с")
+    print(f"  доработано {report['finished']}, прервано {report['cancelled']}, "
+          f"не отправлено сообщений {report['unsent_messages']}")
+    print(f"  решений в базе {report['solutions']}, из них без файлов {report['solutions_without_files']}")
+
+
+def print_report(results: list):
+    print(f"\n{'сценарий':<14}{'обновл.':>8}{'сек':>8}{'в сек':>9}{'p50 мс':>9}{'p95 мс':>9}"
+          f"{'p99 мс':>9}{'макс мс':>9}{'рассылка с':>12}")
+    for r in results:
+        print(f"{r['scenario']:<14}{r['updates']:>8}{r['seconds']:>8.2f}{r['per_second']:>9.1f}"
+              f"{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['max_ms']:>9.1f}"
+              f"{r['drain_seconds']:>12.2f}")
+    for r in results:
+        calls = ", ".join(f"{method} {count}" for method, count in sorted(r['api_calls'].items()))
+        print(f"\n{r['scenario']}: {r['check']}")
+        print(f"  вызовы Bot API: {calls or 'нет'}")
+        if r['errors']:
+            print(f"  ошибки: {r['errors']}")
+
+
+async def run_until_sigterm(runner: Runner, selected: list, after: float):
+    """Нагрузка, SIGTERM через after секунд, затем остановка бота"""
+    loop = asyncio.get_running_loop()
+    received = asyncio.Event()
+    loop.add_signal_handler(signal.SIGTERM, received.set)
+    loop.call_later(after, os.kill, os.getpid(), signal.SIGTERM)
+
+    work = asyncio.create_task(runner.run(selected))
+    waiter = asyncio.create_task(received.wait())
+    await asyncio.wait([work, waiter], return_when=asyncio.FIRST_COMPLETED)
+    loop.remove_signal_handler(signal.SIGTERM)
+    if not received.is_set():
+        waiter.cancel()
+        print(f"⚠️ Нагрузка закончилась раньше SIGTERM ({after} с)")
+        return [summarize(r) for r in work.result()], None
+
+    report = await runner.shutdown()
+    work.cancel()
+    try:
+        await work
+    except (asyncio.CancelledError, Exception):
+        pass  # Сценарий прерван на середине: его итоговые проверки не имеют смысла
+    return [], report
+
+
+async def run(args):
+    api = FakeBotApi(args.api_latency_ms / 1000)
+    await api.start()
+
+    # Настройки читаются main.py при импорте; .env не переопределяет заданные здесь
+    os.environ.update({
+        'BOT_TOKEN': FAKE_TOKEN, 'ADMIN_ID': str(ADMIN_ID), 'TELEGRAM_API_URL': api.url,
+        'BOT_MODE': 'polling', 'WORKERS': '1', 'METRICS_PORT': '0', 'DIGEST_WINDOW': '0',
+        'THROTTLE_RATE': str(args.throttle_rate), 'FSM_STORAGE': args.fsm,
+        'CONCURRENCY_MODE': args.concurrency_mode
+    })
+    import main
+    logging.getLogger().setLevel(args.log_level)
+
+    if args.send_rate:
+        main.sender.interval = 1 / args.send_rate
+    await main.on_startup()
+    shutdown = None
+    try:
+        runner = Runner(main, api, args)
+        if args.sigterm_after:
+            results, shutdown = await run_until_sigterm(runner, args.scenarios.split(","), args.sigterm_after)
+        else:
+            results = [summarize(r) for r in await runner.run(args.scenarios.split(","))]
+    finally:
+        if shutdown is None:
+            await main.on_shutdown()
+        await main.bot.session.close()
+        await api.stop()
+    return results, shutdown
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=50, help="новых сессий учеников в секунду (0 - все сразу)")
+    parser.add_argument("--think-ms", type=float, default=0, help="пауза между шагами одной сессии")
+    parser.add_argument("--photos", type=int, default=5, help="фото в альбоме решения")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--api-latency-ms", type=float, default=0, help="задержка ответа заглушки Bot API")
+    parser.add_argument("--send-rate", type=float, default=0,
+                        help="скорость рассылки, сообщений в секунду (0 - как в боте)")
+    parser.add_argument("--throttle-rate", type=float, default=0, help="THROTTLE_RATE (0 - без ограничения)")
+    parser.add_argument("--fsm", choices=("memory", "sqlite"), default="memory")
+    parser.add_argument("--concurrency-mode", choices=("ordered", "concurrent"), default="ordered")
+    parser.add_argument("--sigterm-after", type=float, default=0,
+                        help="послать SIGTERM через столько секунд и проверить остановку")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    parser.add_argument("--keep-db", action="store_true", help="не удалять временный каталог с базой")
+    args = parser.parse_args()
+
+    unknown = set(args.scenarios.split(",")) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"неизвестные сценарии: {', '.join(sorted(unknown))}")
+    if args.json:
+        args.json = os.path.abspath(args.json)
+
+    # База, временные файлы и состояние бота - во временном каталоге
+    workdir = tempfile.mkdtemp(prefix="tutorbot-loadtest-")
+    os.chdir(workdir)
+    print(f"Временный каталог: {workdir}")
+    try:
+        results, shutdown = asyncio.run(run(args))
+    finally:
+        os.chdir(ROOT)
+        if not args.keep_db:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if results:
+        print_report(results)
+    if shutdown:
+        print_shutdown(shutdown)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({'args': vars(args), 'results': results, 'shutdown': shutdown},
+                      f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
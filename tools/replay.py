@@ -0,0 +1,272 @@
+# tools/replay.py
+"""Воспроизведение записанных обновлений (RECORD_UPDATES) без доступа к Telegram.
+
+Обновления из JSONL подаются в настоящий dp из main.py с исходными
+интервалами (--speed 1), ускоренно (--speed 10) или сразу все (--speed 0);
+ответы бота принимает локальная заглушка Bot API из tools/loadtest.py.
+Паузы длиннее --max-gap (например, между сеансами записи) сокращаются.
+При ускорении порядок гарантирован только внутри пользователя: зависящие
+друг от друга действия разных пользователей (задание создано - ученик
+его решает) могут поменяться местами, поэтому прогоны сравниваются на
+одной скорости.
+
+База - временная: пустая или копия снимка (--db). Чтобы id в снимке
+совпали с псевдонимами из записи, укажите тот же ключ (--salt = RECORD_SALT).
+
+Отчет: задержки обновлений, время каждого обработчика, вызовы Bot API;
+--json сохраняет результаты, --compare сравнивает с прошлым прогоном
+(код выхода 1 при регрессии).
+
+Запуск из корня проекта:
+    python tools/replay.py recorded_updates.jsonl --speed 10 --json replay_base.json
+    python tools/replay.py recorded_updates.jsonl --speed 0 --db tutor_bot.db --salt "$RECORD_SALT" \\
+        --json replay_new.json --compare replay_base.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from middlewares.recorder import anonymize_id  # noqa: E402
+from tools.loadtest import FakeBotApi, FAKE_TOKEN, percentile  # noqa: E402
+
+DEFAULT_ADMIN_ID = 1
+
+# Колонки с id пользователей, которые в снимке заменяются псевдонимами
+USER_ID_COLUMNS = (
+    ('users', 'telegram_id'), ('registration_requests', 'telegram_id'), ('admins', 'telegram_id'),
+    ('results', 'user_id'), ('files', 'uploaded_by'), ('progress_rollups', 'user_id'),
+    ('assignments', 'created_by'),
+)
+
+
+def load_records(path: str, limit: int = 0):
+    """Обновления и псевдонимы администраторов из файла записи"""
+    records, admins = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get('type') == 'header':
+                admins.extend(a for a in record.get('admins', []) if a not in admins)
+            elif 'update' in record:
+                records.append(record)
+                if limit and len(records) >= limit:
+                    break
+    return records, admins
+
+
+def prepare_snapshot(source: str, target: str, salt: str):
+    """Скопировать снимок базы и заменить id пользователей псевдонимами"""
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target)
+    src.backup(dst)
+    src.close()
+    if salt:
+        key = salt.encode()
+        dst.create_function("anon", 1, lambda value: anonymize_id(key, value) if value is not None else None)
+        with dst:
+            for table, column in USER_ID_COLUMNS:
+                dst.execute(f"UPDATE {table} SET {column} = anon({column})")
+            dst.execute("DELETE FROM fsm_states")
+    dst.close()
+
+
+def handler_stats(metrics) -> dict:
+    """Время обработчиков из HandlerMetricsMiddleware (квантили по последним вызовам)"""
+    errors = Counter()
+    for labels, value in metrics.counters('handler_errors_total').items():
+        errors[dict(labels)['handler']] += value
+
+    stats = {}
+    for labels, histogram in metrics.histograms('handler_seconds').items():
+        name = dict(labels)['handler']
+        p50, p95 = histogram.quantiles(0.5, 0.95)
+        stats[name] = {
+            'calls': histogram.count, 'errors': int(errors[name]),
+            'p50_ms': round(p50 * 1000, 3), 'p95_ms': round(p95 * 1000, 3),
+            'mean_ms': round(histogram.sum / histogram.count * 1000, 3) if histogram.count else 0.0
+        }
+    return dict(sorted(stats.items()))
+
+
+async def replay(args, records: list, admin_id: int) -> dict:
+    api = FakeBotApi(args.api_latency_ms / 1000)
+    await api.start()
+
+    os.environ.update({
+        'BOT_TOKEN': FAKE_TOKEN, 'ADMIN_ID': str(admin_id), 'TELEGRAM_API_URL': api.url,
+        'BOT_MODE': 'polling', 'WORKERS': '1', 'METRICS_PORT': '0', 'RECORD_UPDATES': '',
+        'THROTTLE_RATE': str(args.throttle_rate), 'CONCURRENCY_MODE': args.concurrency_mode
+    })
+    import main
+    from aiogram.types import Update
+    logging.getLogger().setLevel(args.log_level)
+
+    if args.send_rate:
+        main.sender.interval = 1 / args.send_rate
+    await main.on_startup()
+
+    latencies, errors = [], Counter()
+
+    async def feed(update: Update):
+        started = time.perf_counter()
+        try:
+            await main.dp.feed_update(main.bot, update)
+        except Exception as e:
+            errors[type(e).__name__] += 1
+        latencies.append(time.perf_counter() - started)
+
+    try:
+        tasks = []
+        started = time.perf_counter()
+        offset, previous_ts, lag = 0.0, None, 0.0
+        for record in records:
+            if previous_ts is not None and args.speed:
+                offset += min(max(record['ts'] - previous_ts, 0), args.max_gap) / args.speed
+            previous_ts = record['ts']
+            delay = started + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                lag = max(lag, -delay)
+            update = Update.model_validate(record['update'], context={'bot': main.bot})
+            # Задачи создаются в порядке записи: порядок внутри пользователя сохраняется
+            tasks.append(asyncio.create_task(feed(update)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+        drain_started = time.perf_counter()
+        main.solution_digest.flush()
+        await main.sender.join()
+        drain = time.perf_counter() - drain_started
+    finally:
+        await main.on_shutdown()
+        await main.bot.session.close()
+        await api.stop()
+
+    latencies.sort()
+    return {
+        'source': args.file,
+        'updates': len(records), 'speed': args.speed,
+        'seconds': round(elapsed, 3), 'drain_seconds': round(drain, 3), 'max_lag_seconds': round(lag, 3),
+        'latency': {
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+            'max_ms': round((latencies[-1] if latencies else 0.0) * 1000, 3)
+        },
+        'errors': dict(errors),
+        'handlers': handler_stats(main.metrics),
+        'api_calls': dict(sorted(api.calls.items()))
+    }
+
+
+def print_report(report: dict):
+    lat = report['latency']
+    print(f"\nОбновлений: {report['updates']} за {report['seconds']:.2f} с "
+          f"(скорость x{report['speed'] or '∞'}), рассылка еще {report['drain_seconds']:.2f} с, "
+          f"отставание до {report['max_lag_seconds']:.2f} с")
+    print(f"Задержка обновления: p50 {lat['p50_ms']:.1f} мс, p95 {lat['p95_ms']:.1f} мс, "
+          f"p99 {lat['p99_ms']:.1f} мс, макс. {lat['max_ms']:.1f} мс")
+    if report['errors']:
+        print(f"Ошибки: {report['errors']}")
+
+    print(f"\n{'обработчик':<40}{'вызовов':>8}{'p50 мс':>9}{'p95 мс':>9}{'сред. мс':>10}{'ошибок':>8}")
+    for name, h in report['handlers'].items():
+        print(f"{name:<40}{h['calls']:>8}{h['p50_ms']:>9.1f}{h['p95_ms']:>9.1f}{h['mean_ms']:>10.1f}{h['errors']:>8}")
+    calls = ", ".join(f"{method} {count}" for method, count in report['api_calls'].items())
+    print(f"\nВызовы Bot API: {calls or 'нет'}")
+
+
+def compare(report: dict, baseline: dict, threshold: float, min_delta_ms: float) -> int:
+    """Напечатать разницу с прошлым прогоном; вернуть число регрессий"""
+    if baseline.get('updates') != report['updates'] or baseline.get('speed') != report['speed']:
+        print("⚠️ Прошлый прогон был на другой записи или скорости, сравнение приблизительное")
+
+    regressions = 0
+    print(f"\n{'обработчик':<40}{'вызовов':>12}{'p50 было':>10}{'стало':>9}{'x':>7}")
+    names = sorted(set(report['handlers']) | set(baseline.get('handlers', {})))
+    for name in names:
+        now = report['handlers'].get(name)
+        before = baseline.get('handlers', {}).get(name)
+        if not now or not before:
+            print(f"{name:<40}{'только ' + ('новый' if now else 'прошлый'):>12}")
+            continue
+        ratio = now['p50_ms'] / before['p50_ms'] if before['p50_ms'] else float('inf')
+        regression = ratio > threshold and now['p50_ms'] - before['p50_ms'] > min_delta_ms
+        regressions += regression
+        calls = f"{before['calls']}→{now['calls']}"
+        mark = "  ⚠️ регрессия" if regression else ""
+        print(f"{name:<40}{calls:>12}{before['p50_ms']:>10.1f}{now['p50_ms']:>9.1f}{ratio:>7.2f}{mark}")
+
+    lat_before, lat_now = baseline.get('latency', {}), report['latency']
+    if lat_before:
+        print(f"\nЗадержка обновления p95: {lat_before['p95_ms']:.1f} → {lat_now['p95_ms']:.1f} мс")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file", help="файл записи (RECORD_UPDATES)")
+    parser.add_argument("--speed", type=float, default=1, help="ускорение времени (0 - без пауз)")
+    parser.add_argument("--max-gap", type=float, default=5, help="наибольшая пауза между обновлениями, с")
+    parser.add_argument("--limit", type=int, default=0, help="воспроизвести только первые N обновлений")
+    parser.add_argument("--db", help="снимок базы, с которого начинается воспроизведение")
+    parser.add_argument("--salt", default=os.getenv("RECORD_SALT", ""), help="ключ псевдонимов для снимка")
+    parser.add_argument("--api-latency-ms", type=float, default=0, help="задержка ответа заглушки Bot API")
+    parser.add_argument("--send-rate", type=float, default=0,
+                        help="скорость рассылки, сообщений в секунду (0 - как в боте)")
+    parser.add_argument("--throttle-rate", type=float, default=0, help="THROTTLE_RATE (0 - без ограничения)")
+    parser.add_argument("--concurrency-mode", choices=("ordered", "concurrent"), default="ordered")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--threshold", type=float, default=1.25, help="замедление, считающееся регрессией")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5, help="игнорировать разницу меньше этой")
+    args = parser.parse_args()
+
+    records, admins = load_records(args.file, args.limit)
+    if not records:
+        parser.error("в файле нет записанных обновлений")
+    for name in ("file", "db", "json", "compare"):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+
+    # База, временные файлы и состояние бота - во временном каталоге
+    workdir = tempfile.mkdtemp(prefix="tutorbot-replay-")
+    try:
+        if args.db:
+            prepare_snapshot(args.db, os.path.join(workdir, "tutor_bot.db"), args.salt)
+        os.chdir(workdir)
+        report = asyncio.run(replay(args, records, admins[0] if admins else DEFAULT_ADMIN_ID))
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"\nРегрессий: {regressions}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
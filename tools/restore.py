@@ -0,0 +1,126 @@
+# tools/restore.py
+"""Восстановление базы из резервной копии (BACKUP_DIR/tutor_bot-*.db.gz).
+
+Снимок распаковывается во временный файл рядом с базой и проверяется:
+PRAGMA integrity_check, версия схемы (не новее, чем у кода), наличие
+основных таблиц. Только после успешной проверки текущая база вместе с
+файлами -wal/-shm переименовывается в <база>.before-restore-<время>, а
+на ее место ставится проверенная копия.
+
+Бот на время восстановления должен быть остановлен: иначе он продолжит
+писать в уже переименованный файл.
+
+Запуск из корня проекта:
+    python tools/restore.py --list
+    python tools/restore.py latest --check
+    python tools/restore.py backups/tutor_bot-20260101-033000.db.gz --force
+"""
+import argparse
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from database.backup import check_database, decompress_snapshot, list_snapshots  # noqa: E402
+from database.db_handler import SCHEMA_VERSION  # noqa: E402
+
+REQUIRED_TABLES = ('users', 'admins', 'assignments', 'results', 'files', 'file_attachments')
+
+
+def verify(path: str) -> list:
+    """Проверить распакованную базу; вернуть список проблем (пустой - все в порядке)"""
+    result = check_database(path)
+    if result != "ok":
+        return [f"integrity_check: {result}"]
+
+    problems = []
+    conn = sqlite3.connect(path)
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version > SCHEMA_VERSION:
+            problems.append(f"версия схемы снимка {version} новее, чем у бота ({SCHEMA_VERSION})")
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        missing = [table for table in REQUIRED_TABLES if table not in tables]
+        if missing:
+            problems.append(f"нет таблиц: {', '.join(missing)}")
+        else:
+            counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                      for table in ('users', 'assignments', 'results', 'files')}
+            print("Содержимое: " + ", ".join(f"{table} {count}" for table, count in counts.items()))
+            if version < SCHEMA_VERSION:
+                print(f"Версия схемы {version}: бот обновит ее до {SCHEMA_VERSION} при запуске")
+    finally:
+        conn.close()
+    return problems
+
+
+def move_aside(db_path: str) -> str:
+    """Переименовать текущую базу вместе с -wal/-shm; вернуть новое имя"""
+    suffix = f".before-restore-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+    for extra in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + extra):
+            os.replace(db_path + extra, db_path + suffix + extra)
+    return db_path + suffix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("snapshot", nargs="?", help="файл снимка или latest")
+    parser.add_argument("--dir", default=os.getenv("BACKUP_DIR", "backups"), help="каталог резервных копий")
+    parser.add_argument("--db", default="tutor_bot.db", help="восстанавливаемая база")
+    parser.add_argument("--list", action="store_true", help="показать снимки и выйти")
+    parser.add_argument("--check", action="store_true", help="только проверить снимок")
+    parser.add_argument("--force", action="store_true", help="заменить существующую базу")
+    args = parser.parse_args()
+
+    snapshots = list_snapshots(args.dir)
+    if args.list or not args.snapshot:
+        for snapshot in snapshots:
+            print(f"{snapshot['name']}  {snapshot['size'] // 1024:>8} КБ")
+        if not snapshots:
+            print(f"В {args.dir} нет резервных копий")
+        return
+
+    if args.snapshot == "latest":
+        if not snapshots:
+            parser.error(f"в {args.dir} нет резервных копий")
+        path = snapshots[0]['path']
+    else:
+        path = args.snapshot
+    if not os.path.exists(path):
+        parser.error(f"нет файла {path}")
+    if not args.check and os.path.exists(args.db) and not args.force:
+        parser.error(f"{args.db} уже существует; остановите бота и добавьте --force")
+
+    # Распаковка рядом с базой: замена - переименованием в пределах одного диска
+    staging = os.path.join(os.path.dirname(os.path.abspath(args.db)), f".restore-{os.getpid()}.db")
+    try:
+        print(f"Проверка {path}...")
+        try:
+            decompress_snapshot(path, staging)
+        except (OSError, EOFError) as e:
+            print(f"❌ Архив поврежден: {e}")
+            sys.exit(1)
+        problems = verify(staging)
+        if problems:
+            for problem in problems:
+                print(f"❌ {problem}")
+            sys.exit(1)
+        print("✅ Снимок цел")
+        if args.check:
+            return
+
+        if os.path.exists(args.db):
+            print(f"Текущая база сохранена как {move_aside(args.db)}")
+        os.replace(staging, args.db)
+        print(f"✅ {args.db} восстановлена из {os.path.basename(path)}")
+    finally:
+        if os.path.exists(staging):
+            os.remove(staging)
+
+
+if __name__ == "__main__":
+    main()
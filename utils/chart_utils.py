@@ -0,0 +1,113 @@
+# utils/chart_utils.py
+import asyncio
+import io
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, List, Dict, Tuple
+
+CHART_WIDTH = 720
+CHART_HEIGHT = 400
+CHART_CACHE_SIZE = 256  # Количество графиков в кэше
+CHART_WORKERS = 1
+
+_executor: Optional[ProcessPoolExecutor] = None
+_cache: "OrderedDict[Tuple, bytes]" = OrderedDict()
+
+
+def render_trend_chart(points: List[Tuple[str, int, Optional[float]]]) -> bytes:
+    """Нарисовать график прогресса в PNG.
+
+    points - список (подпись периода, количество решений, средний процент).
+    Выполняется в отдельном процессе, поэтому принимает только простые типы.
+    """
+    from PIL import Image, ImageDraw, ImageFont
+
+    image = Image.new("RGB", (CHART_WIDTH, CHART_HEIGHT), "white")
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default()
+
+    left, top, right, bottom = 50, 30, CHART_WIDTH - 50, CHART_HEIGHT - 50
+    draw.line([(left, top), (left, bottom), (right, bottom)], fill="black")
+
+    # Сетка по процентам (левая шкала)
+    for percent in range(0, 101, 20):
+        y = bottom - (bottom - top) * percent / 100
+        draw.line([(left, y), (right, y)], fill="#e5e5e5")
+        draw.text((left - 35, y - 6), f"{percent}%", fill="black", font=font)
+
+    if points:
+        max_count = max(count for _, count, _ in points) or 1
+        step = (right - left) / len(points)
+        bar_width = max(step * 0.5, 2)
+
+        line_points = []
+        for i, (label, count, percentage) in enumerate(points):
+            x = left + step * i + step / 2
+            bar_height = (bottom - top) * count / max_count
+            draw.rectangle([x - bar_width / 2, bottom - bar_height, x + bar_width / 2, bottom],
+                           fill="#b7d3f2")
+            draw.text((x - 6, bottom - bar_height - 14), str(count), fill="#1f5fa8", font=font)
+            draw.text((x - 14, bottom + 8), label, fill="black", font=font)
+            if percentage is not None:
+                line_points.append((x, bottom - (bottom - top) * percentage / 100))
+
+        if len(line_points) > 1:
+            draw.line(line_points, fill="#2e9e44", width=3)
+        for x, y in line_points:
+            draw.ellipse([x - 4, y - 4, x + 4, y + 4], fill="#2e9e44")
+
+    # Легенда (стандартный шрифт не содержит кириллицы)
+    draw.rectangle([left, 8, left + 12, 20], fill="#2e9e44")
+    draw.text((left + 18, 8), "avg %", fill="black", font=font)
+    draw.rectangle([left + 80, 8, left + 92, 20], fill="#b7d3f2")
+    draw.text((left + 98, 8), "solutions", fill="black", font=font)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=CHART_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def format_bucket_label(bucket_start: str, period: str) -> str:
+    """Подпись периода на оси графика"""
+    year, month, day = bucket_start[:10].split("-")
+    return f"{day}.{month}" if period == 'week' else f"{month}.{year[2:]}"
+
+
+async def get_trend_chart(user_id: int, period: str, buckets: List[Dict]) -> bytes:
+    """Получить PNG-график по сводкам, используя кэш.
+
+    Ключ кэша - (ученик, период, время последнего обновления сводок),
+    поэтому новый график рисуется только после сдачи или оценки решения.
+    """
+    version = max((b['updated_at'] or "" for b in buckets), default="")
+    key = (user_id, period, version)
+    if key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key]
+
+    points = [(format_bucket_label(b['bucket_start'], period), b['solutions_count'], b['avg_percentage'])
+              for b in buckets]
+    loop = asyncio.get_running_loop()
+    png = await loop.run_in_executor(_get_executor(), render_trend_chart, points)
+
+    _cache[key] = png
+    while len(_cache) > CHART_CACHE_SIZE:
+        _cache.popitem(last=False)
+    return png
+
+
+def shutdown_chart_workers():
+    """Остановить процесс отрисовки графиков"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,225 @@
+# utils/cluster.py
+import asyncio
+import logging
+import multiprocessing
+import signal
+import time
+from typing import Optional, List, Dict, Callable, Any
+
+from aiogram import Bot, Dispatcher
+
+SUPERVISE_INTERVAL = 1  # Секунд между проверками процессов-обработчиков
+STOP_TIMEOUT = 10  # Секунд на завершение обработчика перед принудительной остановкой
+QUICK_FAILURE_SECONDS = 30  # Падение раньше этого срока после запуска - сбой при старте
+MAX_QUICK_FAILURES = 5  # Столько сбоев при старте подряд - обработчик больше не перезапускается
+RESTART_BACKOFF_MAX = 60  # Предел паузы перед перезапуском (пауза удваивается после каждого сбоя)
+
+# (номер, очередь обновлений, очередь задач, счетчики: [2*номер] - взято из очереди, [2*номер+1] - обработано)
+WorkerTarget = Callable[[int, multiprocessing.Queue, multiprocessing.Queue, Any], None]
+
+
+def shard_for(key: int, workers: int) -> int:
+    """Номер процесса-обработчика для пользователя"""
+    return key % workers
+
+
+class Cluster:
+    """Процессы-обработчики обновлений с привязкой пользователя к процессу.
+
+    Процесс-приемник (polling или webhook) раскладывает обновления по
+    очередям: все обновления одного пользователя попадают в один процесс,
+    поэтому сценарии FSM идут по порядку. Обратно, от обработчиков к
+    приемнику, идет общая очередь задач планировщика.
+
+    Упавший процесс перезапускается с новой очередью: старую может держать
+    заблокированной (Queue.get) сам упавший процесс. Обновления, которые он
+    взял или которые остались в старой очереди, теряются, их число пишется
+    в журнал. Новые обновления копятся в новой очереди. Если процесс падает
+    вскоре после запуска, пауза перед перезапуском удваивается; после
+    MAX_QUICK_FAILURES таких падений подряд он больше не перезапускается,
+    а вызывается on_failure.
+    """
+
+    def __init__(self, workers: int, target: WorkerTarget, stop_timeout: float = STOP_TIMEOUT):
+        self.workers = workers
+        self.target = target
+        self.stop_timeout = stop_timeout
+        self._context = multiprocessing.get_context("spawn")
+        self._queues: List[multiprocessing.Queue] = []
+        self._jobs: Optional[multiprocessing.Queue] = None
+        self._dispatched: List[int] = []
+        self._progress = None
+        self._job_reader: Optional[asyncio.Task] = None
+        self._processes: List[Optional[multiprocessing.Process]] = []
+        self._supervisor: Optional[asyncio.Task] = None
+        self._started_at: List[float] = []
+        self._quick_failures: List[int] = []
+        self._restart_at: List[Optional[float]] = []
+        self._on_failure: Optional[Callable[[int], Any]] = None
+        self.restarts = 0
+        self.lost_updates = 0
+
+    def start(self, on_job: Optional[Callable[[Dict], Any]] = None,
+              on_failure: Optional[Callable[[int], Any]] = None):
+        """Запустить процессы-обработчики и наблюдение за ними.
+
+        on_job получает задачи планировщика, созданные в обработчиках;
+        on_failure - номер обработчика, который больше не перезапускается.
+        """
+        self._queues = [self._context.Queue() for _ in range(self.workers)]
+        self._jobs = self._context.Queue()
+        self._dispatched = [0] * self.workers
+        # У каждого счетчика один писатель - свой обработчик, блокировка не нужна
+        self._progress = self._context.Array('q', 2 * self.workers, lock=False)
+        if on_job is not None:
+            self._job_reader = asyncio.create_task(self._read_jobs(on_job))
+        self._on_failure = on_failure
+        self._processes = [None] * self.workers
+        self._started_at = [0.0] * self.workers
+        self._quick_failures = [0] * self.workers
+        self._restart_at = [None] * self.workers
+        for index in range(self.workers):
+            self._spawn(index)
+        self._supervisor = asyncio.create_task(self._supervise())
+        logging.info(f"Запущено процессов-обработчиков: {self.workers}")
+
+    def _spawn(self, index: int):
+        process = self._context.Process(target=self.target, args=(index, self._queues[index], self._jobs, self._progress),
+                                        name=f"tutorbot-worker-{index}", daemon=True)
+        process.start()
+        self._processes[index] = process
+        self._started_at[index] = time.monotonic()
+
+    def dispatch(self, key: int, update: Dict):
+        """Передать обновление (в виде словаря) процессу пользователя"""
+        index = shard_for(key, self.workers)
+        self._queues[index].put((key, update))
+        self._dispatched[index] += 1
+
+    def in_flight(self) -> int:
+        """Обновлений в очередях и в обработке во всех процессах-обработчиках"""
+        return sum(dispatched - self._progress[2 * index + 1] for index, dispatched in enumerate(self._dispatched))
+
+    async def _read_jobs(self, on_job: Callable[[Dict], Any]):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await loop.run_in_executor(None, self._jobs.get)
+            if job is None:
+                break
+            on_job(job)
+
+    def queue_sizes(self) -> List[int]:
+        sizes = []
+        for queue in self._queues:
+            try:
+                sizes.append(queue.qsize())
+            except NotImplementedError:  # macOS
+                sizes.append(-1)
+        return sizes
+
+    async def _supervise(self):
+        while True:
+            await asyncio.sleep(SUPERVISE_INTERVAL)
+            now = time.monotonic()
+            for index, process in enumerate(self._processes):
+                if process is not None and not process.is_alive():
+                    self._on_exit(index, process, now)
+                elif process is None and self._restart_at[index] is not None and now >= self._restart_at[index]:
+                    self._restart_at[index] = None
+                    self.restarts += 1
+                    self._spawn(index)
+
+    def _on_exit(self, index: int, process: multiprocessing.Process, now: float):
+        """Упавший обработчик: списать его обновления, выдать новую очередь и назначить перезапуск"""
+        self._processes[index] = None
+        lost = self._dispatched[index] - self._progress[2 * index + 1]
+        self.lost_updates += lost
+        # Иначе при выходе приемник ждал бы, пока никем не читаемая очередь примет остаток
+        self._queues[index].cancel_join_thread()
+        self._queues[index].close()
+        self._queues[index] = self._context.Queue()
+        self._dispatched[index] = 0
+        self._progress[2 * index] = self._progress[2 * index + 1] = 0
+
+        if now - self._started_at[index] < QUICK_FAILURE_SECONDS:
+            self._quick_failures[index] += 1
+        else:
+            self._quick_failures[index] = 0
+        failures = self._quick_failures[index]
+        if failures >= MAX_QUICK_FAILURES:
+            logging.critical(f"Обработчик {index} завершился (код {process.exitcode}), потеряно обновлений: {lost}; "
+                             f"{failures} сбоев при запуске подряд, перезапусков больше не будет")
+            if self._on_failure is not None:
+                self._on_failure(index)
+            return
+
+        delay = min(RESTART_BACKOFF_MAX, SUPERVISE_INTERVAL * 2 ** failures) if failures else 0
+        self._restart_at[index] = now + delay
+        logging.error(f"Обработчик {index} завершился (код {process.exitcode}), потеряно обновлений: {lost}; "
+                      f"перезапуск через {delay} с")
+
+    async def stop(self):
+        """Дождаться обработки очередей и остановить процессы"""
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+            try:
+                await self._supervisor
+            except asyncio.CancelledError:
+                pass
+            self._supervisor = None
+
+        for queue in self._queues:
+            queue.put(None)  # Сигнал завершения после уже полученных обновлений
+
+        for index, process in enumerate(self._processes):
+            if process is None:
+                continue
+            await asyncio.to_thread(process.join, self.stop_timeout)
+            if process.is_alive():
+                logging.error(f"Обработчик {index} не завершился вовремя, остановка")
+                process.kill()  # SIGTERM обработчик игнорирует
+        self._processes = []
+
+        if self._job_reader is not None:
+            self._jobs.put(None)
+            await self._job_reader
+            self._job_reader = None
+
+
+async def serve_updates(dp: Dispatcher, bot: Bot, updates: multiprocessing.Queue,
+                        progress=None, index: int = 0):
+    """Цикл процесса-обработчика: обновления из очереди передаются диспетчеру.
+
+    Порядок обновлений одного пользователя обеспечивает
+    UserOrderingMiddleware диспетчера. После сигнала завершения цикл
+    выходит сразу: обновления в обработке дожидается вызывающий
+    (InFlightMiddleware.drain) с ограничением по времени. В progress
+    обработчик отмечает взятые и обработанные обновления (Cluster.in_flight).
+    """
+    # Остановкой управляет процесс-приемник (Ctrl+C и SIGTERM от systemd
+    # приходят всей группе процессов)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    tasks = set()  # Ссылки на задачи, чтобы их не собрал сборщик мусора
+
+    async def handle(update: Dict):
+        try:
+            await dp.feed_raw_update(bot, update)
+        except Exception as e:
+            logging.error(f"Ошибка обработки обновления {update.get('update_id')}: {e}")
+        finally:
+            if progress is not None:
+                progress[2 * index + 1] += 1
+
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await loop.run_in_executor(None, updates.get)
+        if item is None:
+            break
+        _, update = item
+        if progress is not None:
+            progress[2 * index] += 1
+        task = asyncio.create_task(handle(update))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
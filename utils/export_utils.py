@@ -0,0 +1,141 @@
+# utils/export_utils.py
+import asyncio
+import csv
+import io
+import json
+import os
+import tempfile
+from typing import Optional, List, Dict
+
+from database.db_handler import DatabaseHandler
+
+EXPORT_DIR = "temp_files"
+EXPORT_CHUNK_SIZE = 500  # Строк из базы за одну выборку и запись в файл
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+db = DatabaseHandler()
+
+
+class GradebookExporter:
+    @staticmethod
+    def format_cell(score: Optional[int], max_score: Optional[int]) -> str:
+        """Форматировать ячейку журнала"""
+        if score is None:
+            return "на проверке"
+        return f"{score}/{max_score}"
+
+    @staticmethod
+    def _student_record(student: tuple, cells: Dict[int, tuple]) -> Dict:
+        telegram_id, first_name, last_name, grade = student
+        return {
+            'telegram_id': telegram_id,
+            'first_name': first_name,
+            'last_name': last_name,
+            'grade': grade,
+            'cells': cells
+        }
+
+    @staticmethod
+    async def iter_student_chunks(grade: Optional[int] = None,
+                                  chunk_size: int = EXPORT_CHUNK_SIZE):
+        """Свернуть поток строк (ученик, задание) в строки журнала.
+
+        Выдает списки записей учеников; в памяти одновременно находится
+        только одна порция строк из базы и текущий ученик.
+        """
+        current = None
+        cells = {}
+        batch = []
+
+        async for rows in db.iter_gradebook_rows(grade, chunk_size):
+            for telegram_id, first_name, last_name, student_grade, assignment_id, score, max_score in rows:
+                if current is None or current[0] != telegram_id:
+                    if current is not None:
+                        batch.append(GradebookExporter._student_record(current, cells))
+                    current = (telegram_id, first_name, last_name, student_grade)
+                    cells = {}
+
+                # Строки упорядочены так, что нужное решение задания идет последним
+                if assignment_id is not None:
+                    cells[assignment_id] = (score, max_score)
+
+            if len(batch) >= chunk_size:
+                yield batch
+                batch = []
+
+        if current is not None:
+            batch.append(GradebookExporter._student_record(current, cells))
+        if batch:
+            yield batch
+
+    @staticmethod
+    def render_csv(records: List[Dict], assignment_ids: List[int], header: Optional[List[str]] = None) -> str:
+        """Сформировать фрагмент CSV для порции учеников"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if header:
+            writer.writerow(header)
+        for record in records:
+            row = [record['telegram_id'], record['last_name'] or "", record['first_name'] or "", record['grade']]
+            for assignment_id in assignment_ids:
+                cell = record['cells'].get(assignment_id)
+                row.append(GradebookExporter.format_cell(*cell) if cell else "")
+            writer.writerow(row)
+        return buffer.getvalue()
+
+    @staticmethod
+    def render_jsonl(records: List[Dict]) -> str:
+        """Сформировать фрагмент JSONL для порции учеников"""
+        lines = []
+        for record in records:
+            lines.append(json.dumps({
+                'telegram_id': record['telegram_id'],
+                'first_name': record['first_name'],
+                'last_name': record['last_name'],
+                'grade': record['grade'],
+                'grades': {
+                    str(assignment_id): {'score': score, 'max_score': max_score}
+                    for assignment_id, (score, max_score) in record['cells'].items()
+                }
+            }, ensure_ascii=False))
+        return "\n".join(lines) + "\n" if lines else ""
+
+    @staticmethod
+    async def export(grade: Optional[int] = None, fmt: str = 'csv') -> tuple[str, int]:
+        """Выгрузить журнал во временный файл.
+
+        Возвращает путь к файлу и количество учеников. Запись на диск
+        выполняется в отдельном потоке, чтобы не блокировать цикл событий.
+        """
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Неизвестный формат выгрузки: {fmt}")
+
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        assignments = await db.get_gradebook_assignments(grade)
+        assignment_ids = [a['id'] for a in assignments]
+
+        # utf-8-sig, чтобы Excel корректно открывал кириллицу
+        handle = tempfile.NamedTemporaryFile(
+            mode='w', encoding='utf-8-sig' if fmt == 'csv' else 'utf-8',
+            newline='', suffix=f".{fmt}", prefix="gradebook_", dir=EXPORT_DIR, delete=False
+        )
+        students = 0
+        try:
+            if fmt == 'csv':
+                header = ["ID", "Фамилия", "Имя", "Класс"] + [f"#{a['id']} {a['title']}" for a in assignments]
+                await asyncio.to_thread(handle.write, GradebookExporter.render_csv([], [], header))
+
+            async for records in GradebookExporter.iter_student_chunks(grade):
+                if fmt == 'csv':
+                    chunk = GradebookExporter.render_csv(records, assignment_ids)
+                else:
+                    chunk = GradebookExporter.render_jsonl(records)
+                await asyncio.to_thread(handle.write, chunk)
+                students += len(records)
+        except Exception:
+            handle.close()
+            os.remove(handle.name)
+            raise
+
+        await asyncio.to_thread(handle.close)
+        return handle.name, students
@@ -1,6 +1,6 @@
 # utils/file_utils.py
 import os
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Tuple
 from aiogram.types import Message, Document, PhotoSize
 from database.db_handler import DatabaseHandler
 
@@ -17,11 +17,28 @@ ALLOWED_EXTENSIONS = {
 }
 
 MAX_FILES_PER_OBJECT = 10  # Максимум файлов на объект
+MAX_BYTES_PER_OBJECT = 50 * 1024 * 1024  # Максимум байт на объект
+
+QUOTA_EXCEEDED_TEXT = (
+    "❌ Превышена ваша квота на файлы.\n"
+    "Посмотреть объем загрузок: /usage. Увеличить квоту может преподаватель."
+)
 
 db = DatabaseHandler()
 
 
+class QuotaError(Exception):
+    """Файл превышает квоту пользователя или объекта (текст - для пользователя)"""
+
+
 class FileProcessor:
+    # Квота пользователя по умолчанию (файлов, байт; 0 - без ограничения), задается в main.py
+    user_quota = (0, 0)
+
+    @staticmethod
+    def set_user_quota(max_files: int, max_bytes: int):
+        FileProcessor.user_quota = (max_files, max_bytes)
+
     @staticmethod
     def get_file_extension(filename: str) -> str:
         """Получить расширение файла"""
@@ -45,26 +62,47 @@ class FileProcessor:
         return True, "OK"
 
     @staticmethod
-    async def process_message_files(message: Message) -> List[Dict]:
-        """Обработать все файлы из сообщения"""
+    def check_object_quota(pending: List[Dict], file_size: int):
+        """Поместится ли файл в объект, к которому уже собраны pending; иначе QuotaError"""
+        if len(pending) + 1 > MAX_FILES_PER_OBJECT:
+            raise QuotaError(f"❌ Не больше {MAX_FILES_PER_OBJECT} файлов на одно задание, решение или оценку.")
+        if sum(f['file_size'] or 0 for f in pending) + file_size > MAX_BYTES_PER_OBJECT:
+            raise QuotaError(f"❌ Файлы одного задания, решения или оценки - не больше "
+                             f"{MAX_BYTES_PER_OBJECT // (1024 * 1024)} МБ вместе.")
+
+    @staticmethod
+    async def process_message_files(message: Message, pending: Optional[List[Dict]] = None) -> List[Dict]:
+        """Обработать все файлы из сообщения.
+
+        pending - файлы, уже собранные для того же объекта в этом диалоге.
+        Превышение квоты объекта или пользователя - QuotaError.
+        """
         files_data = []
+        pending = list(pending or [])
+        user_id = message.from_user.id
+        # Администратор (материалы заданий) ограничен только квотой объекта
+        quota = None if await db.is_admin(user_id) else FileProcessor.user_quota
 
         # Обрабатываем документы
         if message.document:
-            file_data = await FileProcessor.process_document(message.document, message.from_user.id)
+            FileProcessor.check_object_quota(pending, message.document.file_size or 0)
+            file_data = await FileProcessor.process_document(message.document, user_id, quota)
             if file_data:
                 files_data.append(file_data)
+                pending.append(file_data)
 
         # Обрабатываем фото
         if message.photo:
-            file_data = await FileProcessor.process_photo(message.photo, message.from_user.id)
+            FileProcessor.check_object_quota(pending, max(p.file_size or 0 for p in message.photo))
+            file_data = await FileProcessor.process_photo(message.photo, user_id, quota)
             if file_data:
                 files_data.append(file_data)
 
         return files_data
 
     @staticmethod
-    async def process_document(document: Document, user_id: int) -> Optional[Dict]:
+    async def process_document(document: Document, user_id: int,
+                               quota: Optional[Tuple[int, int]] = None) -> Optional[Dict]:
         """Обработать документ"""
         filename = document.file_name or "document"
         file_size = document.file_size or 0
@@ -81,8 +119,11 @@ class FileProcessor:
             file_size=file_size,
             mime_type=document.mime_type or "application/octet-stream",
             file_type="document",
-            uploaded_by=user_id
+            uploaded_by=user_id,
+            quota=quota
         )
+        if file_db_id is None:
+            raise QuotaError(QUOTA_EXCEEDED_TEXT)
 
         return {
             'db_id': file_db_id,
@@ -133,7 +174,8 @@ class FileProcessor:
         }.get(file_type, '📎')
 
     @staticmethod
-    async def process_photo(photo_sizes: List[PhotoSize], user_id: int) -> Optional[Dict]:
+    async def process_photo(photo_sizes: List[PhotoSize], user_id: int,
+                            quota: Optional[Tuple[int, int]] = None) -> Optional[Dict]:
         """Обработать фото (берем самое большое)"""
         if not photo_sizes:
             return None
@@ -156,8 +198,11 @@ class FileProcessor:
             file_size=file_size,
             mime_type="image/jpeg",
             file_type="photo",
-            uploaded_by=user_id
+            uploaded_by=user_id,
+            quota=quota
         )
+        if file_db_id is None:
+            raise QuotaError(QUOTA_EXCEEDED_TEXT)
 
         return {
             'db_id': file_db_id,
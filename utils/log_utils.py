@@ -0,0 +1,199 @@
+# utils/log_utils.py
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+LOG_QUEUE_SIZE = 10000  # Записей в очереди; при переполнении новые отбрасываются
+SLOW_UPDATE_MS = 1000  # Медленные обновления пишутся всегда, без выборки
+CONTEXT_FIELDS = ('update_id', 'user_id', 'handler')
+
+# Стандартные атрибуты LogRecord; остальное - поля из extra
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {'message', 'asctime'}
+
+# Контекст текущего обновления: update_id, user_id, handler
+log_context: ContextVar[Optional[Dict[str, Any]]] = ContextVar("log_context", default=None)
+
+update_logger = logging.getLogger("tutorbot.updates")
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """Разобрать строку вида 'update:0.1,delivery:0.2'"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        event, rate = item.split(":")
+        rates[event] = float(rate)
+    return rates
+
+
+class ContextFilter(logging.Filter):
+    """Добавляет к записи update_id, user_id и handler текущего обновления"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = log_context.get()
+        if context is not None:
+            for field in CONTEXT_FIELDS:
+                if getattr(record, field, None) is None:
+                    setattr(record, field, context.get(field))
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Выборка массовых событий (extra={'event': ...}); предупреждения и ошибки не отбрасываются"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self.dropped: Dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, 'event', None)
+        rate = self.rates.get(event) if event else None
+        if rate is None or rate >= 1 or record.levelno >= logging.WARNING:
+            return True
+        if random.random() < rate:
+            record.sample_rate = rate  # Для пересчета в абсолютные числа
+            return True
+        self.dropped[event] = self.dropped.get(event, 0) + 1
+        return False
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись журнала одной строкой JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Обычный текст; контекст обновления и поля extra - в конце строки"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = [f"{key}={value}" for key, value in vars(record).items()
+                  if key not in _RESERVED and value is not None]
+        if not fields:
+            return text
+        # Трассировка (если есть) остается последней
+        head, sep, tail = text.partition("\n")
+        return f"{head} [{' '.join(fields)}]{sep}{tail}"
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который при переполнении очереди отбрасывает записи вместо ошибки"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(level: str = "INFO", fmt: str = "text", log_file: str = "",
+                  sample_rates: Optional[Dict[str, float]] = None) -> logging.handlers.QueueListener:
+    """Настроить журнал: запись форматируется в вызывающем потоке,
+    вывод в консоль и файл идет в фоновом потоке QueueListener.
+    """
+    formatter = JsonFormatter() if fmt == "json" else TextFormatter()
+
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(sample_rates or {}))
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.setFormatter(formatter)
+
+    # Запись уже отформатирована в QueueHandler.prepare
+    sinks = [logging.StreamHandler(sys.stderr)]
+    if log_file:
+        sinks.append(logging.handlers.WatchedFileHandler(log_file, encoding="utf-8"))
+    for sink in sinks:
+        sink.setFormatter(logging.Formatter("%(message)s"))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    # "Update id=... is handled" на каждое обновление заменяется событием update
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+
+    listener = logging.handlers.QueueListener(log_queue, *sinks, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)  # Дописать очередь при выходе
+    return listener
+
+
+class LogContextMiddleware(BaseMiddleware):
+    """Контекст журнала для обновления и итоговая запись event=update (dp.update)"""
+
+    def __init__(self, slow_ms: float = SLOW_UPDATE_MS):
+        self.slow = slow_ms / 1000
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        context = {'update_id': event.update_id, 'user_id': user.id if user else None, 'handler': None}
+        token = log_context.set(context)
+        started = time.perf_counter()
+        status, exc_info = "ok", None
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            status, exc_info = "error", e
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            level = logging.ERROR if exc_info else logging.WARNING if elapsed >= self.slow else logging.INFO
+            update_logger.log(level, "Обновление обработано", exc_info=exc_info, extra={
+                'event': 'update', 'update_type': event.event_type,
+                'latency_ms': round(elapsed * 1000, 1), 'status': status
+            })
+            log_context.reset(token)
+
+
+class HandlerLogMiddleware(BaseMiddleware):
+    """Имя выбранного обработчика в контекст журнала (внутренний middleware)"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        context = log_context.get()
+        handler_object = data.get("handler")
+        if context is not None and handler_object is not None:
+            context['handler'] = handler_object.callback.__name__
+        return await handler(event, data)
@@ -0,0 +1,283 @@
+# utils/metrics.py
+import functools
+import inspect
+import logging
+import time
+from bisect import bisect_left
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject
+
+PREFIX = "tutorbot"
+
+# Границы корзин гистограмм (секунды), как у клиентов Prometheus
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SAMPLE_SIZE = 1000  # Последних значений для p50/p95/p99 в /botstats
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами и окном последних значений"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.samples = deque(maxlen=SAMPLE_SIZE)
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.samples.append(value)
+
+    def quantiles(self, *qs: float) -> List[float]:
+        ordered = sorted(self.samples)
+        if not ordered:
+            return [0.0 for _ in qs]
+        return [ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in qs]
+
+
+class MetricsRegistry:
+    """Счетчики и гистограммы процесса в формате Prometheus"""
+
+    def __init__(self):
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        self._gauges: Dict[str, Dict[Labels, float]] = {}
+        self._collectors: List[Callable[[], Awaitable[Dict[Tuple[str, Labels], float]]]] = []
+        self.started_at = time.time()
+
+    def counter(self, name: str, help_text: str):
+        self._help[name] = ('counter', help_text)
+        self._counters.setdefault(name, {})
+
+    def histogram(self, name: str, help_text: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self._help[name] = ('histogram', help_text)
+        self._histograms.setdefault(name, {})
+        self._buckets[name] = buckets
+
+    def gauge(self, name: str, help_text: str):
+        self._help[name] = ('gauge', help_text)
+
+    def set(self, name: str, value: float, **labels: str):
+        """Установить значение gauge-метрики (без функции-сборщика)"""
+        self._gauges.setdefault(name, {})[tuple(sorted(labels.items()))] = value
+
+    def gauges(self, name: str) -> Dict[Labels, float]:
+        return self._gauges.get(name, {})
+
+    def add_collector(self, collector: Callable[[], Awaitable[Dict[Tuple[str, Labels], float]]]):
+        """Функция, вычисляющая значения gauge-метрик при чтении"""
+        self._collectors.append(collector)
+
+    def inc(self, name: str, value: float = 1, **labels: str):
+        series = self._counters[name]
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str):
+        series = self._histograms[name]
+        key = tuple(sorted(labels.items()))
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram(self._buckets[name])
+        histogram.observe(value)
+
+    def histograms(self, name: str) -> Dict[Labels, Histogram]:
+        return self._histograms.get(name, {})
+
+    def counters(self, name: str) -> Dict[Labels, float]:
+        return self._counters.get(name, {})
+
+    @staticmethod
+    def _escape(value) -> str:
+        """Экранировать значение метки по текстовому формату Prometheus"""
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    @staticmethod
+    def _labels(labels: Labels, extra: str = "") -> str:
+        parts = [f'{key}="{MetricsRegistry._escape(value)}"' for key, value in labels]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    async def render(self) -> str:
+        """Текст для GET /metrics"""
+        gauges: Dict[str, Dict[Labels, float]] = {name: dict(series) for name, series in self._gauges.items()}
+        for collector in self._collectors:
+            try:
+                for (name, labels), value in (await collector()).items():
+                    gauges.setdefault(name, {})[labels] = value
+            except Exception as e:
+                logging.error(f"Ошибка сбора метрик: {e}")
+
+        lines = []
+        for name, (kind, help_text) in self._help.items():
+            full_name = f"{PREFIX}_{name}"
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            if kind == 'counter':
+                for labels, value in self._counters[name].items():
+                    lines.append(f"{full_name}{self._labels(labels)} {value}")
+            elif kind == 'gauge':
+                for labels, value in gauges.get(name, {}).items():
+                    lines.append(f"{full_name}{self._labels(labels)} {value}")
+            else:
+                for labels, histogram in self._histograms[name].items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        le = f'le="{bound}"'
+                        lines.append(f"{full_name}_bucket{self._labels(labels, le)} {cumulative}")
+                    le = 'le="+Inf"'
+                    lines.append(f"{full_name}_bucket{self._labels(labels, le)} {histogram.count}")
+                    lines.append(f"{full_name}_sum{self._labels(labels)} {histogram.sum}")
+                    lines.append(f"{full_name}_count{self._labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+metrics.histogram('update_seconds', 'Время обработки обновления')
+metrics.histogram('handler_seconds', 'Время работы обработчика')
+metrics.counter('handler_errors_total', 'Исключения в обработчиках')
+metrics.histogram('db_call_seconds', 'Время вызова метода DatabaseHandler')
+metrics.histogram('db_calls_per_update', 'Вызовов базы на одно обновление', COUNT_BUCKETS)
+metrics.histogram('db_seconds_per_update', 'Время в базе на одно обновление')
+metrics.histogram('bot_api_seconds', 'Время запроса к Bot API')
+metrics.counter('bot_api_errors_total', 'Ошибки запросов к Bot API')
+metrics.gauge('fsm_states', 'Пользователей в каждом состоянии FSM')
+metrics.gauge('startup_seconds', 'Длительность этапов запуска (schema, startup, warmup)')
+metrics.gauge('first_response_seconds', 'От запуска процесса до обработки первого обновления')
+metrics.gauge('first_update_seconds', 'Время обработки первого обновления после запуска')
+
+
+class UpdateDbStats:
+    """Обращения к базе в рамках одного обновления"""
+    __slots__ = ('calls', 'seconds')
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+
+
+current_update_db: ContextVar[Optional[UpdateDbStats]] = ContextVar("current_update_db", default=None)
+
+
+def instrument_db_methods(cls):
+    """Декоратор класса: замер времени публичных async-методов базы"""
+    for name, method in list(vars(cls).items()):
+        if name.startswith("_") or not inspect.iscoroutinefunction(method):
+            continue
+        setattr(cls, name, _timed_db_method(name, method))
+    return cls
+
+
+def _timed_db_method(name: str, method):
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.observe('db_call_seconds', elapsed, method=name)
+            stats = current_update_db.get()
+            if stats is not None:
+                stats.calls += 1
+                stats.seconds += elapsed
+    return wrapper
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Время обработки обновления и обращения к базе за обновление (dp.update)"""
+
+    def __init__(self):
+        self.first_done = False
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        stats = UpdateDbStats()
+        token = current_update_db.set(stats)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.observe('update_seconds', elapsed, type=event.event_type)
+            if not self.first_done:
+                # Первый ответ после перезапуска - на холодных кэшах
+                self.first_done = True
+                since_start = time.time() - metrics.started_at
+                metrics.set('first_update_seconds', elapsed)
+                metrics.set('first_response_seconds', since_start)
+                logging.info(f"Первое обновление обработано за {elapsed * 1000:.0f} мс, "
+                             f"через {since_start:.2f} с после запуска")
+            metrics.observe('db_calls_per_update', stats.calls)
+            metrics.observe('db_seconds_per_update', stats.seconds)
+            current_update_db.reset(token)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Время работы конкретного обработчика (внутренний middleware)"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object is not None else "unknown"
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            metrics.inc('handler_errors_total', handler=name, error=type(e).__name__)
+            raise
+        finally:
+            metrics.observe('handler_seconds', time.perf_counter() - started, handler=name)
+
+
+class BotApiMetricsMiddleware(BaseRequestMiddleware):
+    """Время и ошибки запросов к Bot API (bot.session.middleware)"""
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            metrics.inc('bot_api_errors_total', method=name, error=type(e).__name__)
+            raise
+        finally:
+            metrics.observe('bot_api_seconds', time.perf_counter() - started, method=name)
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """Запустить HTTP-сервер с GET /metrics"""
+
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(text=await metrics.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,280 @@
+# utils/notifications.py
+import asyncio
+import logging
+import time
+from typing import Optional, List, Tuple, Callable, Awaitable
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest,
+    TelegramNetworkError, TelegramServerError
+)
+
+BULK_RATE_LIMIT = 25  # Сообщений в секунду (лимит Telegram - около 30)
+TRANSIENT_RETRIES = 3  # Повторы при временных ошибках (сеть, 5xx)
+
+# Ответы Telegram, после которых повторять отправку бессмысленно
+PERMANENT_ERROR_MARKERS = ("chat not found", "user not found", "peer_id_invalid", "user is deactivated")
+
+DELIVERED = 'delivered'
+UNREACHABLE = 'unreachable'
+TRANSIENT = 'transient'
+RETRY_AFTER = 'retry_after'
+FAILED = 'failed'
+
+
+def classify_delivery_error(error: Exception) -> str:
+    """Классифицировать ошибку отправки сообщения"""
+    if isinstance(error, TelegramRetryAfter):
+        return RETRY_AFTER
+    if isinstance(error, TelegramForbiddenError):
+        return UNREACHABLE
+    if isinstance(error, TelegramBadRequest):
+        message = str(error).lower()
+        if any(marker in message for marker in PERMANENT_ERROR_MARKERS):
+            return UNREACHABLE
+        return FAILED
+    if isinstance(error, (TelegramNetworkError, TelegramServerError)):
+        return TRANSIENT
+    return FAILED
+
+
+class DeliveryReport:
+    """Итоги доставки пачки сообщений (рассылки)"""
+
+    def __init__(self, total: int, title: str = "", summary: bool = False):
+        self.total = total
+        self.title = title
+        self.summary = summary  # Отправить администратору сводку по итогам
+        self.delivered = 0
+        self.failed = 0
+        self.unreachable: List[int] = []
+
+    @property
+    def done(self) -> bool:
+        return self.delivered + self.failed + len(self.unreachable) >= self.total
+
+    def record(self, chat_id: int, outcome: str):
+        if outcome == DELIVERED:
+            self.delivered += 1
+        elif outcome == UNREACHABLE:
+            self.unreachable.append(chat_id)
+        else:
+            self.failed += 1
+
+
+ReportHandler = Callable[[DeliveryReport], Awaitable[None]]
+
+
+class BulkSender:
+    """Фоновая очередь сообщений с ограничением скорости отправки.
+
+    Обработчики кладут сообщения в очередь и сразу отвечают пользователю,
+    а отправка идет в отдельной задаче не быстрее rate сообщений в секунду.
+    По завершении каждой пачки вызывается on_report с итогами доставки.
+    """
+
+    def __init__(self, bot: Bot, rate: float = BULK_RATE_LIMIT, on_report: Optional[ReportHandler] = None):
+        self.bot = bot
+        self.interval = 1 / rate
+        self.on_report = on_report
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self._worker: Optional[asyncio.Task] = None
+        self._next_send = 0.0
+
+    def start(self):
+        """Запустить фоновую отправку (вызывать внутри цикла событий)"""
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    def enqueue(self, chat_id: int, text: str, **kwargs) -> DeliveryReport:
+        """Поставить сообщение в очередь"""
+        report = DeliveryReport(1)
+        self.queue.put_nowait((chat_id, text, kwargs, report))
+        return report
+
+    def enqueue_many(self, messages: List[Tuple[int, str]], title: str = "",
+                     summary: bool = False) -> Optional[DeliveryReport]:
+        """Поставить в очередь пачку сообщений (chat_id, text)"""
+        if not messages:
+            return None
+
+        report = DeliveryReport(len(messages), title, summary)
+        for chat_id, text in messages:
+            self.queue.put_nowait((chat_id, text, {}, report))
+        return report
+
+    async def join(self, timeout: Optional[float] = None) -> int:
+        """Дождаться отправки всех сообщений из очереди; вернуть число неотправленных"""
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.queue.qsize()
+
+    async def stop(self, timeout: Optional[float] = None) -> int:
+        """Отправить очередь (не дольше timeout) и остановить фоновую отправку;
+        вернуть число неотправленных сообщений"""
+        unsent = await self.join(timeout) if self._worker is not None else self.queue.qsize()
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        return unsent
+
+    async def _throttle(self):
+        now = time.monotonic()
+        if self._next_send > now:
+            await asyncio.sleep(self._next_send - now)
+        self._next_send = max(now, self._next_send) + self.interval
+
+    async def _run(self):
+        while True:
+            chat_id, text, kwargs, report = await self.queue.get()
+            try:
+                report.record(chat_id, await self._send(chat_id, text, kwargs))
+                if report.done and self.on_report is not None:
+                    try:
+                        await self.on_report(report)
+                    except Exception as e:
+                        logging.error(f"Ошибка при обработке итогов рассылки: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def _send(self, chat_id: int, text: str, kwargs: dict) -> str:
+        retries = 0
+        while True:
+            await self._throttle()
+            try:
+                await self.bot.send_message(chat_id, text, **kwargs)
+                return DELIVERED
+            except Exception as e:
+                outcome = classify_delivery_error(e)
+
+                if outcome == RETRY_AFTER:
+                    logging.warning(f"Превышен лимит отправки, пауза {e.retry_after} с")
+                    self._next_send = time.monotonic() + e.retry_after
+                    continue
+
+                if outcome == TRANSIENT and retries < TRANSIENT_RETRIES:
+                    retries += 1
+                    await asyncio.sleep(2 ** retries)
+                    continue
+
+                if outcome == UNREACHABLE:
+                    # При массовой блокировке таких записей много: они идут в выборку (LOG_SAMPLE)
+                    logging.info(f"Пользователь {chat_id} недоступен: {e}",
+                                 extra={'event': 'delivery', 'chat_id': chat_id})
+                else:
+                    logging.error(f"Не удалось отправить сообщение пользователю {chat_id}: {e}")
+                return outcome
+
+
+DIGEST_WINDOW = 300  # Секунд накопления событий перед отправкой сводки
+DIGEST_MAX_EVENTS = 20  # Отправить сводку раньше, если накопилось столько событий
+DIGEST_URGENT_FIRST = True  # Первое решение по заданию - сразу, без ожидания сводки
+MESSAGE_LIMIT = 4000
+
+
+class SolutionDigest:
+    """Объединяет уведомления о новых решениях в одну сводку.
+
+    События копятся window секунд (или до max_events) и уходят одним
+    сообщением, сгруппированным по заданиям. Первое решение по заданию
+    при urgent_first отправляется сразу.
+    """
+
+    def __init__(self, sender: BulkSender, chat_id: int, window: float = DIGEST_WINDOW,
+                 max_events: int = DIGEST_MAX_EVENTS, urgent_first: bool = DIGEST_URGENT_FIRST):
+        self.sender = sender
+        self.chat_id = chat_id
+        self.window = window
+        self.max_events = max_events
+        self.urgent_first = urgent_first
+        self._events = {}  # result_id -> данные уведомления (повторная отправка заменяет)
+        self._timer: Optional[asyncio.Task] = None
+
+    def add(self, event: dict):
+        """Добавить событие о новом решении"""
+        if self.window <= 0 or (self.urgent_first and event.get('is_first')):
+            self.sender.enqueue(self.chat_id, self.format_single(event))
+            return
+
+        self._events.pop(event['result_id'], None)
+        self._events[event['result_id']] = event
+
+        if len(self._events) >= self.max_events:
+            self.flush()
+        elif self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+
+    def pending_count(self) -> int:
+        return len(self._events)
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        self._timer = None
+        self.flush()
+
+    def flush(self):
+        """Отправить накопленную сводку"""
+        if self._timer is not None and not self._timer.done() and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+        self._timer = None
+
+        if not self._events:
+            return
+
+        events = list(self._events.values())
+        self._events = {}
+        for part in self.format_digest(events):
+            self.sender.enqueue(self.chat_id, part)
+
+    @staticmethod
+    def _student_line(event: dict) -> str:
+        user = event['user_data']
+        files_text = f" 📎{event['files_count']}" if event.get('has_files') else ""
+        return f"   👤 {user['first_name']} {user['last_name']} ({user['grade']} кл.) - ID {event['result_id']}{files_text}"
+
+    @staticmethod
+    def format_single(event: dict) -> str:
+        files_text = f" 📎{event['files_count']}" if event.get('has_files') else ""
+        first_text = "\n🥇 Первое решение по заданию" if event.get('is_first') else ""
+        return (
+            f"📤 Новое решение!{first_text}\n\n"
+            f"👤 {event['user_data']['first_name']} {event['user_data']['last_name']} "
+            f"({event['user_data']['grade']} класс)\n"
+            f"📝 Задание: {event['assignment']['title']}\n"
+            f"🆔 ID решения: {event['result_id']}{files_text}\n\n"
+            "Используйте /ungraded для проверки."
+        )
+
+    @staticmethod
+    def format_digest(events: List[dict]) -> List[str]:
+        """Сформировать сводку, разбитую на сообщения до MESSAGE_LIMIT символов"""
+        groups = {}
+        for event in events:
+            groups.setdefault(event['assignment']['id'], []).append(event)
+
+        files_total = sum(event['files_count'] for event in events if event.get('has_files'))
+        files_text = f", файлов: {files_total} 📎" if files_total else ""
+        lines = [f"📬 Новые решения: {len(events)}{files_text}", ""]
+        for group in groups.values():
+            lines.append(f"📝 {group[0]['assignment']['title']} - {len(group)} шт.")
+            lines.extend(SolutionDigest._student_line(event) for event in group)
+            lines.append("")
+        lines.append("Используйте /ungraded для проверки.")
+
+        parts = []
+        current = ""
+        for line in lines:
+            if len(current) + len(line) + 1 > MESSAGE_LIMIT:
+                parts.append(current)
+                current = ""
+            current += line + "\n"
+        if current.strip():
+            parts.append(current)
+        return parts
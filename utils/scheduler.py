@@ -0,0 +1,200 @@
+# utils/scheduler.py
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Callable, Awaitable
+
+from database.db_handler import DatabaseHandler
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# За сколько до срока сдачи напоминать ученикам
+REMINDER_OFFSETS = (timedelta(hours=24), timedelta(hours=2))
+
+# Максимальный сон между пробуждениями: страхует от перевода системных часов
+MAX_SLEEP = 3600
+ERROR_PAUSE = 1  # Пауза после ошибки в цикле (например, база заблокирована)
+
+db = DatabaseHandler()
+
+JobHandler = Callable[[Dict], Awaitable[None]]
+
+
+class Scheduler:
+    """Планировщик отложенных задач на куче с сохранением в базе.
+
+    Задачи хранятся в таблице scheduled_jobs и дублируются в куче по
+    времени запуска. Фоновая задача спит до ближайшего срока (или до
+    появления более ранней задачи), поэтому тысячи ожидающих задач не
+    требуют периодического опроса базы. Процессы-обработчики передают
+    созданные задачи процессу с планировщиком (forward_to).
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._job_ids = set()
+        self._handlers: Dict[str, JobHandler] = {}
+        self._wakeup: Optional[asyncio.Event] = None  # Создается в start() вместе с остальным состоянием цикла
+        self._task: Optional[asyncio.Task] = None
+        self._sync_interval: Optional[float] = None
+        self._last_synced_id = 0
+        self._next_sync = 0.0
+        self._forward: Optional[Callable[[Dict], None]] = None
+        self._stopping = False
+
+    def register(self, kind: str, handler: JobHandler):
+        """Зарегистрировать обработчик для типа задач"""
+        self._handlers[kind] = handler
+
+    async def start(self, sync_interval: Optional[float] = None):
+        """Загрузить невыполненные задачи из базы и запустить цикл.
+
+        sync_interval - как часто проверять базу на задачи других процессов,
+        уведомление о которых не дошло (многопроцессный режим). Читаются
+        только задачи новее уже прочитанных.
+        """
+        self._wakeup = asyncio.Event()
+        self._heap = []
+        self._job_ids = set()
+        self._sync_interval = sync_interval
+        self._last_synced_id = 0
+        self._stopping = False
+        await self._load_pending()
+        self._next_sync = time.monotonic() + (sync_interval or 0)
+        logging.info(f"Планировщик: загружено задач - {len(self._heap)}")
+        self._task = asyncio.create_task(self._run())
+        self._task.add_done_callback(self._on_task_done)
+
+    @staticmethod
+    def _on_task_done(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logging.critical("Планировщик остановился из-за ошибки: задачи больше не выполняются",
+                             exc_info=task.exception())
+
+    async def _load_pending(self):
+        for job in await db.get_pending_jobs(self._last_synced_id):
+            self._last_synced_id = max(self._last_synced_id, job['id'])
+            if job['id'] not in self._job_ids:
+                self._push(job)
+
+    def forward_to(self, send: Callable[[Dict], None]):
+        """Процесс без цикла планировщика (обработчик) передает новые задачи через send"""
+        self._forward = send
+
+    def add(self, job: Dict):
+        """Принять задачу, созданную другим процессом (уже сохранена в базе)"""
+        if self._task is not None and job['id'] not in self._job_ids:
+            self._push(job)
+
+    async def stop(self, timeout: Optional[float] = None):
+        """Остановить цикл; выполняющаяся задача (публикация, напоминания) дорабатывает до timeout"""
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            try:
+                await asyncio.wait_for(self._task, timeout=timeout)
+            except asyncio.TimeoutError:
+                logging.warning("Остановка: задача планировщика не завершилась вовремя")
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def schedule(self, kind: str, object_id: int, run_at: datetime) -> bool:
+        """Запланировать задачу. Повторное планирование той же задачи игнорируется."""
+        run_at_text = run_at.strftime(DATETIME_FORMAT)
+        job_id = await db.add_scheduled_job(kind, object_id, run_at_text)
+        if job_id is None:
+            return False
+
+        # Без запущенного цикла (процесс-обработчик) задачу выполнит процесс,
+        # в котором работает планировщик
+        job = {'id': job_id, 'kind': kind, 'object_id': object_id, 'run_at': run_at_text}
+        if self._task is not None:
+            self._push(job)
+        elif self._forward is not None:
+            self._forward(job)
+        return True
+
+    async def schedule_assignment(self, assignment_id: int, due_date: Optional[str],
+                                  publish_date: Optional[str] = None):
+        """Запланировать публикацию задания и напоминания о сроке сдачи"""
+        now = datetime.now()
+
+        if publish_date:
+            await self.schedule('publish', assignment_id, datetime.strptime(publish_date, DATETIME_FORMAT))
+
+        if due_date:
+            due = datetime.strptime(due_date, DATETIME_FORMAT)
+            for offset in REMINDER_OFFSETS:
+                run_at = due - offset
+                if run_at > now:
+                    await self.schedule('reminder', assignment_id, run_at)
+
+    def pending_count(self) -> int:
+        return len(self._heap)
+
+    def _push(self, job: Dict):
+        run_at = datetime.strptime(job['run_at'], DATETIME_FORMAT)
+        is_earliest = not self._heap or run_at < self._heap[0][0]
+        heapq.heappush(self._heap, (run_at, job['id'], job['kind'], job['object_id']))
+        self._job_ids.add(job['id'])
+        if is_earliest and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while not self._stopping:
+            # Ошибка одного шага (база заблокирована при отметке задачи) не останавливает
+            # цикл: иначе перестали бы выполняться все задачи, включая ежедневные
+            try:
+                await self._step()
+            except Exception:
+                logging.exception("Планировщик: ошибка в цикле")
+                await asyncio.sleep(ERROR_PAUSE)
+
+    async def _step(self):
+        """Дождаться ближайшей задачи (или пробуждения) и выполнить ее"""
+        max_sleep = min(MAX_SLEEP, self._sync_interval or MAX_SLEEP)
+        self._wakeup.clear()
+
+        if self._heap:
+            delay = (self._heap[0][0] - datetime.now()).total_seconds()
+        else:
+            delay = max_sleep
+
+        if delay > 0:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=min(delay, max_sleep))
+            except asyncio.TimeoutError:
+                # Пробуждение к сроку задачи базу не читает: только раз в sync_interval
+                if self._sync_interval and time.monotonic() >= self._next_sync:
+                    self._next_sync = time.monotonic() + self._sync_interval
+                    await self._load_pending()
+            return
+
+        run_at, job_id, kind, object_id = heapq.heappop(self._heap)
+        # id снимается после выполнения: задача еще pending в базе и не должна
+        # вернуться в кучу при проверке базы во время выполнения
+        try:
+            await self._fire({'id': job_id, 'kind': kind, 'object_id': object_id,
+                              'run_at': run_at.strftime(DATETIME_FORMAT)})
+        finally:
+            self._job_ids.discard(job_id)
+
+    async def _fire(self, job: Dict):
+        handler = self._handlers.get(job['kind'])
+        if handler is None:
+            logging.error(f"Планировщик: нет обработчика для задачи {job['kind']}")
+            await db.finish_scheduled_job(job['id'], 'failed')
+            return
+
+        try:
+            await handler(job)
+            await db.finish_scheduled_job(job['id'], 'done')
+        except Exception as e:
+            logging.error(f"Планировщик: ошибка в задаче {job['kind']} #{job['id']}: {e}")
+            await db.finish_scheduled_job(job['id'], 'failed')
+
+
+scheduler = Scheduler()
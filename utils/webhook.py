@@ -0,0 +1,61 @@
+# utils/webhook.py
+import asyncio
+import logging
+import signal
+from typing import Optional, Callable, Dict
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+HEALTH_PATH = "/health"
+
+HealthProvider = Callable[[], Dict]
+
+
+def build_webhook_app(dp: Dispatcher, bot: Bot, path: str, secret: Optional[str] = None,
+                      health: Optional[HealthProvider] = None) -> web.Application:
+    """Собрать aiohttp-приложение, принимающее обновления Telegram.
+
+    POST на path передается диспетчеру (с проверкой заголовка
+    X-Telegram-Bot-Api-Secret-Token, если задан secret), GET /health
+    отвечает состоянием бота. События startup/shutdown диспетчера
+    вызываются при запуске и остановке сервера.
+    """
+    app = web.Application()
+
+    async def health_check(request: web.Request) -> web.Response:
+        data = {'status': 'ok'}
+        if health is not None:
+            data.update(health())
+        return web.json_response(data)
+
+    app.router.add_get(HEALTH_PATH, health_check)
+
+    # Сначала хуки диспетчера, затем обработчик: при остановке сессия бота
+    # закрывается последней, чтобы shutdown-хуки успели отправить сообщения
+    setup_application(app, dp, bot=bot)
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=secret or None).register(app, path=path)
+    return app
+
+
+async def run_webhook(app: web.Application, host: str, port: int):
+    """Запустить сервер и работать до SIGINT/SIGTERM"""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logging.info(f"Webhook-сервер слушает {host}:{port}")
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    try:
+        await stop_event.wait()
+    finally:
+        await runner.cleanup()